@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# only server processes import this module (not manage.py commands) → load the FAISS indexes here
+from django.conf import settings  # noqa: E402
+from core.faiss_index import preload  # noqa: E402
+
+preload(block=settings.FAISS_PRELOAD_BLOCKING)
@@ -101,6 +101,9 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # connections are reused by the bounded executor threads serving /chat
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -141,3 +144,174 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Outbound HTTP clients (see core/clients.py)
+# One pooled keep-alive client is kept per upstream; every knob can be
+# overridden with <PREFIX>_POOL_SIZE, <PREFIX>_READ_TIMEOUT, ... env vars.
+
+TOROB_API_KEY = os.getenv("TOROB_API_KEY")
+TOROB_BASE_URL = os.getenv("TOROB_BASE_URL", "https://turbo.torob.com/v1")
+CLIP_API_URL = os.getenv("CLIP_API_URL", "https://model-api.darkube.app")
+
+
+def _upstream(prefix, pool_size, read_timeout):
+    return {
+        "pool_size": int(os.getenv(f"{prefix}_POOL_SIZE", pool_size)),
+        "keepalive": int(os.getenv(f"{prefix}_KEEPALIVE", pool_size)),
+        "keepalive_expiry": float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", 60)),
+        "connect_timeout": float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", 5)),
+        "read_timeout": float(os.getenv(f"{prefix}_READ_TIMEOUT", read_timeout)),
+        "http2": os.getenv(f"{prefix}_HTTP2", "1") == "1",
+    }
+
+
+UPSTREAMS = {
+    "openai": _upstream("OPENAI", 100, 120),
+    "clip": _upstream("CLIP", 10, 30),
+    "images": _upstream("IMAGES", 20, 15),
+}
+
+
+# Text-embedding cache (see core/embedding_cache.py)
+# The disk tier is a memory-mapped float32 file plus a SQLite key index,
+# shared by every worker on the node and kept across restarts.
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "/var/lib/data/embedding_cache")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 20000))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", 200000))
+
+
+# Local scenario classifier (see core/intent_classifier.py)
+# The LLM detector is only called when the classifier's confidence is below
+# the threshold; every LLM decision is appended to the log for retraining.
+
+INTENT_CLASSIFIER_PATH = os.getenv("INTENT_CLASSIFIER_PATH", "/var/lib/data/intent_classifier.npz")
+INTENT_DECISIONS_LOG = os.getenv("INTENT_DECISIONS_LOG", "/var/lib/data/scenario_decisions.jsonl")
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", 0.9))
+
+
+# Async /chat pipeline (see core/executor.py)
+# FAISS searches and ORM queries issued by the async views run on this many
+# threads per process; it also bounds the DB connections the process opens.
+
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", 16))
+
+# Start the embedding + top-1 product lookup for text messages in parallel
+# with scenario classification (see core/retrieval.py).
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+
+
+# /chat response cache (see core/response_cache.py)
+# Identical requests (same message contents and types) are answered from
+# memory for RESPONSE_CACHE_TTL seconds; concurrent duplicates share one
+# computation. Set the TTL to 0 to disable.
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 600))
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", 10000))
+
+
+# Scenario 7 candidate verification (see core/scenarios/scenario7.py)
+# At most SCENARIO7_CANDIDATE_BUDGET distinct bases are verified,
+# SCENARIO7_VERIFY_BATCH per vision call, stopping at the first match or
+# after SCENARIO7_DEADLINE seconds (then the closest CLIP match is returned).
+
+SCENARIO7_CANDIDATE_BUDGET = int(os.getenv("SCENARIO7_CANDIDATE_BUDGET", 24))
+SCENARIO7_VERIFY_BATCH = int(os.getenv("SCENARIO7_VERIFY_BATCH", 4))
+SCENARIO7_IMAGE_CONCURRENCY = int(os.getenv("SCENARIO7_IMAGE_CONCURRENCY", 8))
+SCENARIO7_DEADLINE = float(os.getenv("SCENARIO7_DEADLINE", 20))
+
+
+# Scenario 4 product search (see core/scenarios/scenario4.py)
+# At most SCENARIO4_MAX_CANDIDATES products within the name threshold are
+# kept (closest first). The customer's filters restrict the FAISS search
+# itself only when they leave at most SCENARIO4_PREFILTER_MAX_PRODUCTS
+# products; looser filters are applied in SQL to the FAISS results.
+
+SCENARIO4_MAX_CANDIDATES = int(os.getenv("SCENARIO4_MAX_CANDIDATES", 10000))
+SCENARIO4_PREFILTER_MAX_PRODUCTS = int(os.getenv("SCENARIO4_PREFILTER_MAX_PRODUCTS", 20000))
+
+
+# Product image cache (see core/image_cache.py)
+# Downloaded images are stored as base64 data URLs, content-addressed by
+# SHA-256 and evicted least-recently-used above IMAGE_CACHE_MAX_BYTES.
+# Scenario 7 candidates are sent as thumbnails of at most
+# IMAGE_CACHE_THUMBNAIL_SIZE px (0 sends full images; needs Pillow).
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/var/lib/data/image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+IMAGE_CACHE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_CACHE_THUMBNAIL_SIZE", 512))
+
+
+# CLIP service transport (see core/scenarios/scenario7.py)
+# "binary" sends the raw image bytes and receives float32 embeddings;
+# "json" keeps the base64/JSON protocol of older CLIP deployments. A service
+# that rejects the binary body (415/422) is switched to "json" automatically,
+# with a warning in the log.
+
+CLIP_TRANSPORT = os.getenv("CLIP_TRANSPORT", "binary")
+
+
+# Text embeddings (see core/embedding_providers.py)
+# "openai" calls the remote API; "local" runs sentence-transformers on this
+# node (pip install sentence-transformers). The text FAISS indexes must be
+# built with the same provider/model: `manage.py rebuild_text_indexes`.
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")  # empty → the provider's default model
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+
+
+# Approximate nearest-neighbour search (see core/ann.py)
+# FAISS_ANN_INDEX_TYPE selects a products.<type>.index built with
+# `manage.py build_ann_index` (ivf_flat, ivf_pq or hnsw; empty → flat only).
+# Each call site searches with a named profile; "exact" always uses the
+# flat index.
+
+FAISS_ANN_INDEX_TYPE = os.getenv("FAISS_ANN_INDEX_TYPE", "")
+
+
+def _search_profile(name, nprobe, ef_search, exact=False):
+    return {
+        "nprobe": int(os.getenv(f"FAISS_{name}_NPROBE", nprobe)),
+        "ef_search": int(os.getenv(f"FAISS_{name}_EF_SEARCH", ef_search)),
+        "exact": os.getenv(f"FAISS_{name}_EXACT", "1" if exact else "0") == "1",
+    }
+
+
+FAISS_SEARCH_PROFILES = {
+    "top1": _search_profile("TOP1", nprobe=8, ef_search=32),
+    "default": _search_profile("DEFAULT", nprobe=32, ef_search=128),
+    "exact": _search_profile("EXACT", nprobe=0, ef_search=0, exact=True),
+}
+
+
+# FAISS index preloading (see core/faiss_index.py)
+# The ASGI/WSGI entry points load the indexes and key tables when a worker
+# starts; /healthz and /readyz answer 503 until they are loaded and warmed.
+# With FAISS_PRELOAD_BLOCKING=1 the worker does not start serving before that.
+
+FAISS_PRELOAD_BLOCKING = os.getenv("FAISS_PRELOAD_BLOCKING", "0") == "1"
+
+
+# Versioned index bundles (see core/index_bundle.py)
+# `manage.py publish_index_bundle` writes /var/lib/data/bundles/<version> and
+# points bundles/CURRENT at it. Every worker checks CURRENT every
+# FAISS_BUNDLE_POLL_SECONDS (0 disables), loads and warms the new bundle in
+# the background and then switches to it. FAISS_BUNDLE_VERIFY is "sha256"
+# (full checksums before loading) or "size".
+
+FAISS_BUNDLE_POLL_SECONDS = float(os.getenv("FAISS_BUNDLE_POLL_SECONDS", 30))
+FAISS_BUNDLE_VERIFY = os.getenv("FAISS_BUNDLE_VERIFY", "sha256")
+
+
+# Artifact downloads (see core/artifact_fetcher.py)
+# Sources are tried in order: "dir:<path>" (local or mounted directory),
+# "http(s)://<base>" (any mirror serving the files by name), "url" (the
+# artifact's own direct URL) and "gdrive". ARTIFACT_MANIFEST is a JSON file
+# of expected sizes and SHA-256s (`manage.py fetch_artifacts --record`).
+
+ARTIFACT_SOURCES = os.getenv("ARTIFACT_SOURCES", "gdrive")
+ARTIFACT_MANIFEST = os.getenv("ARTIFACT_MANIFEST", "")
+ARTIFACT_FETCH_WORKERS = int(os.getenv("ARTIFACT_FETCH_WORKERS", 4))
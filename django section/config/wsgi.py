@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_wsgi_application()
+
+# runserver and WSGI servers: load the FAISS indexes when the worker starts (see asgi.py)
+from django.conf import settings  # noqa: E402
+from core.faiss_index import preload  # noqa: E402
+
+preload(block=settings.FAISS_PRELOAD_BLOCKING)
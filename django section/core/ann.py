@@ -0,0 +1,137 @@
+import math
+import os
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+INDEX_TYPES = ("ivf_flat", "ivf_pq", "hnsw")
+
+
+def ann_index_path(index_path, kind):
+    """products.index → products.ivf_flat.index"""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.{kind}{ext}"
+
+
+def default_nlist(n):
+    # ~4·sqrt(n) lists, but at least 39 training points per centroid (FAISS warns below that)
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(dim):
+    """تعداد زیربردارهای PQ: ~۱۶ بعد برای هر بایت کد، به شرط بخش‌پذیری dim"""
+    for m in range(max(dim // 16, 1), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(kind, nlist=None, pq_m=None, hnsw_m=32):
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m}"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    raise ValueError(f"Unknown index type {kind!r} (choose from {', '.join(INDEX_TYPES)})")
+
+
+def _rows(source, ids):
+    return np.ascontiguousarray(source.reconstruct_batch(ids), dtype=np.float32)
+
+
+def build_ann_index(source, kind, nlist=None, pq_m=None, hnsw_m=32, ef_construction=200,
+                    train_size=200000, chunk_size=100000, seed=0, progress=None):
+    """
+    ایندکس ANN از روی یک ایندکس flat (معمولاً mmap شده) ساخته می‌شود؛ بردارها به
+    صورت تکه‌ای از source خوانده می‌شوند و هیچ‌وقت کل ماتریس در حافظه نیست.
+    برمی‌گرداند: (index, params)
+    """
+    n, dim = source.ntotal, source.d
+    params = {"index_type": kind}
+    if kind.startswith("ivf"):
+        params["nlist"] = nlist or default_nlist(n)
+    if kind == "ivf_pq":
+        params["pq_m"] = pq_m or default_pq_m(dim)
+    if kind == "hnsw":
+        params["hnsw_m"] = hnsw_m
+
+    index = faiss.index_factory(
+        dim, factory_string(kind, params.get("nlist"), params.get("pq_m"), hnsw_m), source.metric_type
+    )
+    if kind == "hnsw":
+        index.hnsw.efConstruction = ef_construction
+
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(train_size, n), replace=False))
+        index.train(_rows(source, sample))
+
+    for start in range(0, n, chunk_size):
+        count = min(chunk_size, n - start)
+        index.add(np.ascontiguousarray(source.reconstruct_n(start, count), dtype=np.float32))
+        if progress is not None:
+            progress(count)
+    return index, params
+
+
+def search_params(index, k, nprobe=None, ef_search=None, selector=None):
+    """پارامترهای جستجوی هر فراخوانی؛ روی خود index چیزی تنظیم نمی‌شود (thread-safe)"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or ivf.nprobe, ivf.nlist), sel=selector)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=max(ef_search or index.hnsw.efSearch, k), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def search_index(faiss_dict, name, query_vec, k, profile="default", selector=None):
+    """
+    جستجو در faiss_dict[name] با پروفایل FAISS_SEARCH_PROFILES[profile]؛ اگر
+    نسخه‌ی ANN ایندکس لود شده باشد (faiss_dict[f"{name}_ann"]) و پروفایل exact
+    نباشد از آن استفاده می‌شود.
+    """
+    conf = settings.FAISS_SEARCH_PROFILES[profile]
+    index = faiss_dict[name]
+    ann = faiss_dict.get(f"{name}_ann")
+    if ann is not None and not conf["exact"]:
+        index = ann
+    params = search_params(index, k, conf["nprobe"], conf["ef_search"], selector)
+    return index.search(query_vec, k, params=params)
+
+
+# -------------------- Filtered search --------------------
+
+def id_selector(rows):
+    """IDSelector روی ردیف‌های مجاز؛ FAISS فقط همین ردیف‌ها را امتیاز می‌دهد"""
+    return faiss.IDSelectorBatch(np.ascontiguousarray(rows, dtype=np.int64))
+
+
+def filtered_search(faiss_dict, name, query_vec, k, allowed_rows=None, profile="exact"):
+    """
+    top-k فقط بین allowed_rows (None یعنی همه). چون فیلتر داخل FAISS اعمال
+    می‌شود، وقتی مجموعه‌ی مجاز کوچک است نتایج برتر از دست نمی‌روند.
+    """
+    if allowed_rows is not None and len(allowed_rows) == 0:
+        return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+    selector = id_selector(allowed_rows) if allowed_rows is not None else None
+    return search_index(faiss_dict, name, query_vec, k, profile=profile, selector=selector)
+
+
+def radius_search(faiss_dict, name, query_vec, radius, allowed_rows=None, limit=None):
+    """
+    ردیف‌های با فاصله‌ی کمتر از radius (برای یک query)، مرتب بر اساس فاصله و حداکثر
+    limit تا. range search روی ایندکس flat (دقیق) اجرا می‌شود.
+    """
+    if allowed_rows is not None and len(allowed_rows) == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    index = faiss_dict[name]
+    # keep a Python reference: SearchParameters only holds a raw pointer to the selector
+    selector = id_selector(allowed_rows) if allowed_rows is not None else None
+    params = faiss.SearchParameters(sel=selector) if selector is not None else None
+    lims, distances, rows = index.range_search(query_vec[:1], radius, params=params)
+    order = np.argsort(distances[lims[0]:lims[1]], kind="stable")[:limit]
+    return distances[lims[0]:lims[1]][order], rows[lims[0]:lims[1]][order]
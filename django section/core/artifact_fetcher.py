@@ -0,0 +1,300 @@
+"""
+دریافت موازی و قابل‌ادامه‌ی فایل‌های بزرگ (ایندکس‌ها، جدول‌های کلید، دیتاست).
+
+هر artifact اول در <path>.part نوشته می‌شود، بعد اندازه و SHA-256 آن با manifest
+مقایسه و در نهایت با os.replace سر جایش گذاشته می‌شود؛ پس فایلی که در مسیر نهایی
+هست همیشه کامل است. یک دانلود نیمه‌کاره از همان‌جا که مانده ادامه پیدا می‌کند.
+
+منبع‌ها به ترتیب امتحان می‌شوند (ARTIFACT_SOURCES، جدا شده با کاما):
+    dir:/mnt/artifacts          پوشه‌ی محلی یا mount شده (نودهای بدون اینترنت)
+    http://mirror.local/data    هر سرور HTTP که فایل‌ها را با همان نام سرو کند
+    url                         لینک مستقیم خود artifact
+    gdrive                      لینک Google Drive خود artifact (gdown)
+
+این ماژول به Django وابسته نیست تا data.py هم بتواند از آن استفاده کند.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+
+class ArtifactError(Exception):
+    pass
+
+
+@dataclass
+class Artifact:
+    name: str
+    path: str
+    url: str = None  # Google Drive (or any direct) URL, used by the gdrive source
+    size: int = None
+    sha256: str = None
+
+    @property
+    def part_path(self):
+        return f"{self.path}.part"
+
+
+# -------------------- Manifest --------------------
+
+def load_manifest(path):
+    """{name: {"size": ..., "sha256": ...}}؛ بدون manifest فقط تکمیل دانلود تضمین می‌شود"""
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"[artifact_fetcher] manifest {path} not found → sizes and checksums are not verified")
+        return {}
+
+
+def with_manifest(artifacts, manifest):
+    for artifact in artifacts:
+        entry = manifest.get(artifact.name, {})
+        artifact.size = entry.get("size", artifact.size)
+        artifact.sha256 = entry.get("sha256", artifact.sha256)
+    return artifacts
+
+
+def record_manifest(artifacts, path):
+    """manifest را از روی فایل‌های فعلی (که به آن‌ها اعتماد داریم) می‌نویسد"""
+    manifest = {
+        artifact.name: {"size": os.path.getsize(artifact.path), "sha256": sha256_file(artifact.path)}
+        for artifact in artifacts
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+# -------------------- Verification --------------------
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stamp_path(path):
+    return f"{path}.verified"
+
+
+def _read_stamp(path):
+    try:
+        with open(_stamp_path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_stamp(path, sha256):
+    stat = os.stat(path)
+    with open(_stamp_path(path), "w", encoding="utf-8") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}, f)
+
+
+def verify(artifact, path):
+    """None اگر path با manifest بخواند، وگرنه دلیل عدم تطابق"""
+    size = os.path.getsize(path)
+    if artifact.size is not None and size != artifact.size:
+        return f"{size} bytes, expected {artifact.size}"
+    if artifact.sha256 is not None:
+        digest = sha256_file(path)
+        if digest != artifact.sha256:
+            return f"SHA-256 {digest[:12]}… does not match {artifact.sha256[:12]}…"
+    return None
+
+
+def is_current(artifact):
+    """
+    فایل نهایی موجود و معتبر است؟ هش فقط یک بار حساب می‌شود و نتیجه کنار فایل
+    (<path>.verified با size و mtime) ذخیره می‌شود تا هر شروع دوباره کل فایل خوانده نشود.
+    """
+    if not os.path.exists(artifact.path):
+        return False
+    if artifact.sha256 is not None:
+        stamp = _read_stamp(artifact.path)
+        stat = os.stat(artifact.path)
+        if stamp == {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": artifact.sha256}:
+            return True
+    problem = verify(artifact, artifact.path)
+    if problem:
+        logger.warning(f"[artifact_fetcher] {artifact.path}: {problem} → fetching again")
+        return False
+    if artifact.sha256 is not None:
+        _write_stamp(artifact.path, artifact.sha256)
+    return True
+
+
+# -------------------- Sources --------------------
+
+class LocalDirSource:
+    """کپی از یک پوشه‌ی محلی/mount شده با همان نام فایل"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = f"dir:{directory}"
+
+    def fetch(self, artifact, part_path):
+        source = os.path.join(self.directory, artifact.name)
+        if not os.path.exists(source):
+            raise ArtifactError(f"{source} not found")
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > os.path.getsize(source):
+            offset = 0
+        with open(source, "rb") as src, open(part_path, "ab" if offset else "wb") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class HttpSource:
+    """GET <base_url>/<name>؛ فایل .part موجود با هدر Range ادامه داده می‌شود"""
+
+    def __init__(self, base_url, timeout=60.0):
+        self.base_url = base_url.rstrip("/")
+        self.name = self.base_url
+        self.timeout = timeout
+
+    def url(self, artifact):
+        return f"{self.base_url}/{artifact.name}"
+
+    def fetch(self, artifact, part_path):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with httpx.stream("GET", self.url(artifact), headers=headers, timeout=self.timeout,
+                          follow_redirects=True) as response:
+            if response.status_code == 416:
+                # the part file is already complete (or longer than the remote file)
+                return
+            response.raise_for_status()
+            # 200 instead of 206: the server ignored Range → start over
+            mode = "ab" if response.status_code == 206 else "wb"
+            with open(part_path, mode) as f:
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+
+
+class UrlSource(HttpSource):
+    """لینک مستقیم خود artifact (artifact.url)"""
+
+    def __init__(self, timeout=60.0):
+        super().__init__("", timeout)
+        self.name = "url"
+
+    def url(self, artifact):
+        if not artifact.url:
+            raise ArtifactError(f"{artifact.name} has no URL")
+        return artifact.url
+
+
+class GoogleDriveSource:
+    """لینک Google Drive خود artifact با gdown (resume=True ادامه‌ی دانلود قبلی است)"""
+
+    name = "gdrive"
+
+    def fetch(self, artifact, part_path):
+        import gdown
+
+        if not artifact.url:
+            raise ArtifactError(f"{artifact.name} has no Google Drive URL")
+        # gdown resumes from its own temp file next to part_path and only creates
+        # part_path when done; an existing one (e.g. from another source) would be
+        # taken as finished
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if gdown.download(artifact.url, part_path, quiet=True, resume=True) is None:
+            raise ArtifactError(f"gdown could not download {artifact.url}")
+
+
+def parse_sources(spec):
+    """'dir:/mnt/a,http://mirror/data,gdrive' → لیست منبع‌ها به ترتیب اولویت"""
+    sources = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        if item.startswith("dir:"):
+            sources.append(LocalDirSource(item[len("dir:"):]))
+        elif item.startswith(("http://", "https://")):
+            sources.append(HttpSource(item))
+        elif item == "url":
+            sources.append(UrlSource())
+        elif item == "gdrive":
+            sources.append(GoogleDriveSource())
+        else:
+            raise ValueError(f"Unknown artifact source {item!r} (dir:<path>, http(s)://<base>, url or gdrive)")
+    return sources
+
+
+# -------------------- Fetch --------------------
+
+def _part_complete(artifact):
+    return (
+        artifact.size is not None and os.path.exists(artifact.part_path)
+        and os.path.getsize(artifact.part_path) == artifact.size
+    )
+
+
+def fetch_artifact(artifact, sources):
+    """artifact را اگر موجود/معتبر نباشد از اولین منبعی که جواب بدهد می‌گیرد؛ (منبع، ثانیه)"""
+    if is_current(artifact):
+        return None, 0.0
+    os.makedirs(os.path.dirname(artifact.path) or ".", exist_ok=True)
+    errors = []
+    for source in sources:
+        start = time.perf_counter()
+        try:
+            if not _part_complete(artifact):
+                source.fetch(artifact, artifact.part_path)
+            problem = verify(artifact, artifact.part_path)
+        except Exception as e:
+            # keep the part file: the next source (or the next start) resumes from it
+            errors.append(f"{source.name}: {type(e).__name__}: {e}")
+            continue
+        if problem:
+            # a corrupt part file can't be resumed
+            os.remove(artifact.part_path)
+            errors.append(f"{source.name}: {problem}")
+            continue
+        os.replace(artifact.part_path, artifact.path)
+        if artifact.sha256 is not None:
+            _write_stamp(artifact.path, artifact.sha256)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(artifact.path)
+        logger.info(
+            f"[artifact_fetcher] {artifact.name}: {size / 1024 ** 2:.1f} MiB from {source.name} "
+            f"in {elapsed:.1f}s ({size / 1024 ** 2 / max(elapsed, 1e-6):.1f} MiB/s) ✅"
+        )
+        return source.name, elapsed
+    raise ArtifactError(f"{artifact.name}: every source failed ({'; '.join(errors) or 'no sources'})")
+
+
+def fetch_all(artifacts, sources, workers=4):
+    """
+    همه‌ی artifactها به صورت موازی؛ اگر یکی شکست بخورد بقیه تمام می‌شوند و بعد
+    ArtifactError با همه‌ی خطاها بالا می‌رود. برمی‌گرداند: {name: (منبع یا None، ثانیه)}
+    """
+    results, errors = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="artifact-fetch") as pool:
+        futures = {artifact.name: pool.submit(fetch_artifact, artifact, sources) for artifact in artifacts}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors.append(str(e))
+    if errors:
+        raise ArtifactError("; ".join(errors))
+    return results
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (httpx only needs it to be importable for http2=True)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+class _ConnectionStats:
+    """شمارنده‌ی درخواست‌ها و اتصال‌های جدید برای یک upstream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        # httpcore calls this for every connection-level event of the request
+        request.extensions["trace"] = self._trace
+
+    async def aon_request(self, request):
+        with self._lock:
+            self.requests += 1
+        # the async connection pool awaits the trace callback, so it has to be a coroutine
+        request.extensions["trace"] = self._atrace
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else None,
+            }
+
+
+_lock = threading.Lock()
+_http_clients = {}
+_stats = {}
+_openai_client = None
+# httpx.AsyncClient is bound to the event loop it was first used on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _build_http_client(name, client_class=httpx.Client, **kwargs):
+    conf = settings.UPSTREAMS[name]
+    http2 = conf["http2"] and _HTTP2_AVAILABLE
+    if conf["http2"] and not _HTTP2_AVAILABLE:
+        logger.warning(f"[clients] h2 is not installed → {name} falls back to HTTP/1.1")
+
+    stats = _stats.setdefault(name, _ConnectionStats())
+    on_request = stats.aon_request if client_class is httpx.AsyncClient else stats.on_request
+    client = client_class(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=conf["pool_size"],
+            max_keepalive_connections=conf["keepalive"],
+            keepalive_expiry=conf["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(conf["read_timeout"], connect=conf["connect_timeout"]),
+        event_hooks={"request": [on_request]},
+        **kwargs,
+    )
+    logger.info(f"[clients] {name} client ready (pool={conf['pool_size']}, http2={http2})")
+    return client
+
+
+def _get_http_client(name, **kwargs):
+    client = _http_clients.get(name)
+    if client is None:
+        with _lock:
+            client = _http_clients.get(name)
+            if client is None:
+                client = _build_http_client(name, **kwargs)
+                _http_clients[name] = client
+    return client
+
+
+def get_openai_client():
+    """کلاینت مشترک OpenAI (turbo.torob.com) با connection pool"""
+    global _openai_client
+    if _openai_client is None:
+        http_client = _get_http_client("openai")
+        with _lock:
+            if _openai_client is None:
+                _openai_client = OpenAI(
+                    api_key=settings.TOROB_API_KEY,
+                    base_url=settings.TOROB_BASE_URL,
+                    http_client=http_client,
+                )
+    return _openai_client
+
+
+def get_clip_client():
+    """کلاینت مشترک سرویس CLIP؛ مسیرها نسبت به CLIP_API_URL هستند"""
+    return _get_http_client("clip", base_url=settings.CLIP_API_URL)
+
+
+def get_image_client():
+    """کلاینت مشترک دانلود تصویر محصولات"""
+    return _get_http_client("images", follow_redirects=True)
+
+
+def _get_async_client(name, factory):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(name)
+    if client is None:
+        client = clients[name] = factory()
+    return client
+
+
+def get_async_openai_client():
+    """نسخه‌ی async کلاینت OpenAI برای event loop جاری"""
+    return _get_async_client("openai_sdk", lambda: AsyncOpenAI(
+        api_key=settings.TOROB_API_KEY,
+        base_url=settings.TOROB_BASE_URL,
+        http_client=_get_async_client("openai", lambda: _build_http_client("openai", httpx.AsyncClient)),
+    ))
+
+
+def get_async_clip_client():
+    return _get_async_client("clip", lambda: _build_http_client(
+        "clip", httpx.AsyncClient, base_url=settings.CLIP_API_URL
+    ))
+
+
+def get_async_image_client():
+    return _get_async_client("images", lambda: _build_http_client(
+        "images", httpx.AsyncClient, follow_redirects=True
+    ))
+
+
+def client_stats():
+    return {name: stats.snapshot() for name, stats in _stats.items()}
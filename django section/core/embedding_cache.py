@@ -0,0 +1,338 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from core.embedding_providers import get_embedding_provider
+from core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+_CHAR_MAP = str.maketrans({
+    "ي": "ی",
+    "ى": "ی",
+    "ئ": "ی",
+    "ك": "ک",
+    "ة": "ه",
+    "ۀ": "ه",
+    "أ": "ا",
+    "إ": "ا",
+    "ٱ": "ا",
+    "ؤ": "و",
+    "\u200c": " ",  # ZWNJ
+    "\u200d": "",   # ZWJ
+    "\u0640": "",   # tatweel
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # Persian digits
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # Arabic-Indic digits
+})
+_DIACRITICS_RE = re.compile(r"[\u064B-\u065F\u0670]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """یکسان‌سازی حروف و ارقام فارسی/عربی و فاصله‌ها برای کلید کش"""
+    text = _DIACRITICS_RE.sub("", str(text).translate(_CHAR_MAP))
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class _MemoryTier:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def get(self, key):
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is not None:
+                self._items.move_to_end(key)
+            return vec
+
+    def put(self, key, vec):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = vec
+            self.nbytes += vec.nbytes
+            while len(self._items) > self.max_items:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _DiskTier:
+    """
+    Vectors live in a fixed-capacity float32 memmap shared by all workers;
+    the key → slot index is a SQLite table (WAL) so concurrent writers from
+    different processes are serialized by SQLite's write lock.
+
+    Each slot also stores the 16-byte digest of its key. Writers clear it
+    before overwriting the vector and set it afterwards, and readers check
+    it after copying, so a slot that is evicted mid-read shows up as a miss.
+    """
+
+    def __init__(self, directory, capacity):
+        self.directory = directory
+        self.capacity = capacity
+        self.dim = None
+        self._vectors = None
+        self._digests = None
+        self._local = threading.local()
+        self._open_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key BLOB PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row is not None:
+            self._open(int(row[0]))
+
+    def _open(self, dim):
+        with self._open_lock:
+            if self._vectors is not None:
+                return
+            row = self._conn().execute("SELECT value FROM meta WHERE name = 'capacity'").fetchone()
+            if row is not None and int(row[0]) != self.capacity:
+                # the memmap layout is fixed on creation; a new limit only applies to a fresh cache dir
+                logger.warning(f"[embedding_cache] keeping on-disk capacity {row[0]} (requested {self.capacity})")
+                self.capacity = int(row[0])
+
+            vectors_path = os.path.join(self.directory, "vectors.f32")
+            digests_path = os.path.join(self.directory, "digests.bin")
+            for path, nbytes in ((vectors_path, self.capacity * dim * 4), (digests_path, self.capacity * 16)):
+                if not os.path.exists(path) or os.path.getsize(path) < nbytes:
+                    with open(path, "ab") as f:
+                        f.truncate(nbytes)  # sparse: only written slots use disk
+
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+            self._digests = np.memmap(digests_path, dtype=np.uint8, mode="r+", shape=(self.capacity, 16))
+            self.dim = dim
+
+    def get(self, key):
+        if self._vectors is None:
+            return None
+        row = self._conn().execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        slot = row[0]
+        vec = np.array(self._vectors[slot])
+        if self._digests[slot].tobytes() != key:
+            return None
+        self._conn().execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return vec
+
+    def put(self, key, vec):
+        conn = self._conn()
+        if self._vectors is None:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (str(vec.shape[0]),))
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('capacity', ?)", (str(self.capacity),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._open(int(conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0]))
+        if vec.shape[0] != self.dim:
+            logger.warning(f"[embedding_cache] dim mismatch ({vec.shape[0]} != {self.dim}) → not stored")
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                conn.execute("COMMIT")
+                return
+            count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count < self.capacity:
+                slot = conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+            else:
+                old_key, slot = conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1"
+                ).fetchone()
+                conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+
+            self._digests[slot] = 0
+            self._vectors[slot] = vec
+            self._digests[slot] = np.frombuffer(key, dtype=np.uint8)
+            conn.execute("INSERT INTO entries VALUES (?, ?, ?)", (key, slot, time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def nbytes(self):
+        return self.count() * ((self.dim or 0) * 4 + 16)
+
+
+class EmbeddingCache:
+    def __init__(self, model, memory_items, disk_items, directory):
+        self.model = model
+        self.memory = _MemoryTier(memory_items)
+        self.disk = _DiskTier(directory, disk_items) if disk_items > 0 else None
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        return hashlib.blake2b(f"{self.model}\0{normalize_text(text)}".encode("utf-8"), digest_size=16).digest()
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, text):
+        key = self._key(text)
+        vec = self.memory.get(key)
+        if vec is not None:
+            self._count("memory_hits")
+            return vec
+        if self.disk is not None:
+            try:
+                vec = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"[embedding_cache] disk lookup failed: {e}")
+                vec = None
+            if vec is not None:
+                self._count("disk_hits")
+                self.memory.put(key, vec)
+                return vec
+        self._count("misses")
+        return None
+
+    def put(self, text, vec):
+        key = self._key(text)
+        vec = np.ascontiguousarray(vec, dtype=np.float32)
+        self.memory.put(key, vec)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, vec)
+            except sqlite3.Error as e:
+                logger.warning(f"[embedding_cache] disk store failed: {e}")
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "memory_items": len(self.memory),
+            "memory_bytes": self.memory.nbytes,
+            "disk_items": self.disk.count() if self.disk is not None else 0,
+            "disk_bytes": self.disk.nbytes() if self.disk is not None else 0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model):
+    cache = _caches.get(model)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(model)
+            if cache is None:
+                cache = EmbeddingCache(
+                    model,
+                    memory_items=settings.EMBEDDING_CACHE_MEMORY_ITEMS,
+                    disk_items=settings.EMBEDDING_CACHE_DISK_ITEMS,
+                    directory=os.path.join(settings.EMBEDDING_CACHE_DIR, model.replace("/", "__")),
+                )
+                _caches[model] = cache
+    return cache
+
+
+def _lookup(texts, model):
+    cache = get_embedding_cache(model)
+    vectors = [cache.get(text) for text in texts]
+
+    missing = {}
+    for i, vec in enumerate(vectors):
+        if vec is None:
+            missing.setdefault(normalize_text(texts[i]), []).append(i)
+    inputs = [texts[positions[0]] for positions in missing.values()]
+    return vectors, inputs, list(missing.values())
+
+
+def _store(model, vectors, inputs, positions_list, new_vectors):
+    cache = get_embedding_cache(model)
+    for text, positions, vec in zip(inputs, positions_list, new_vectors):
+        vec = np.array(vec, dtype=np.float32)  # own copy, not a view that pins the whole batch
+        cache.put(text, vec)
+        for i in positions:
+            vectors[i] = vec
+    return np.vstack(vectors)
+
+
+def _cache_name(provider):
+    # the OpenAI cache keeps its pre-provider name so existing disk caches stay valid
+    return provider.model if provider.name == "openai" else f"{provider.name}:{provider.model}"
+
+
+def embed_texts(texts, provider=None):
+    """embedding چند متن با provider فعال؛ فقط متن‌هایی که در کش نیستند محاسبه می‌شوند"""
+    provider = provider or get_embedding_provider()
+    model = _cache_name(provider)
+    vectors, inputs, positions_list = _lookup(texts, model)
+    if not inputs:
+        return np.vstack(vectors)
+    return _store(model, vectors, inputs, positions_list, provider.embed(inputs))
+
+
+def embed_text(text, provider=None):
+    """embedding یک متن به صورت آرایه‌ی (1, dim) آماده‌ی جستجو در FAISS"""
+    return embed_texts([text], provider=provider)
+
+
+async def aembed_texts(texts, provider=None):
+    """نسخه‌ی async؛ دسترسی به کش دیسکی روی executor انجام می‌شود"""
+    provider = provider or get_embedding_provider()
+    model = _cache_name(provider)
+    vectors, inputs, positions_list = await run_blocking(_lookup, texts, model)
+    if not inputs:
+        return np.vstack(vectors)
+    new_vectors = await provider.aembed(inputs)
+    return await run_blocking(_store, model, vectors, inputs, positions_list, new_vectors)
+
+
+async def aembed_text(text, provider=None):
+    return await aembed_texts([text], provider=provider)
+
+
+def embedding_cache_stats():
+    return {model: cache.stats() for model, cache in _caches.items()}
@@ -0,0 +1,100 @@
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from core.clients import get_openai_client, get_async_openai_client
+from core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class OpenAIEmbeddingProvider:
+    """embedding از طریق API سازگار با OpenAI (turbo.torob.com)"""
+
+    name = "openai"
+    default_model = "text-embedding-3-small"
+    DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+    def __init__(self, model=None):
+        self.model = model or self.default_model
+        self.dim = self.DIMS.get(self.model)
+
+    @staticmethod
+    def _vectors(response):
+        return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+    def embed(self, texts):
+        return self._vectors(get_openai_client().embeddings.create(model=self.model, input=texts))
+
+    async def aembed(self, texts):
+        return self._vectors(await get_async_openai_client().embeddings.create(model=self.model, input=texts))
+
+
+class SentenceTransformerProvider:
+    """
+    embedding محلی روی CPU با sentence-transformers؛ نیازی به API ندارد ولی
+    ایندکس‌های متنی باید با همین مدل دوباره ساخته شوند (rebuild_text_indexes).
+    """
+
+    name = "local"
+    default_model = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+    def __init__(self, model=None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImproperlyConfigured(
+                "EMBEDDING_PROVIDER=local needs sentence-transformers (pip install sentence-transformers)"
+            )
+        self.model = model or self.default_model
+        self._model = SentenceTransformer(self.model, device=settings.EMBEDDING_DEVICE)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        # SentenceTransformer.encode is not safe to call from several threads at once
+        self._lock = threading.Lock()
+        logger.info(f"[embedding_providers] loaded {self.model} (dim={self.dim}, device={settings.EMBEDDING_DEVICE})")
+
+    def embed(self, texts):
+        with self._lock:
+            vectors = self._model.encode(
+                list(texts),
+                batch_size=settings.EMBEDDING_BATCH_SIZE,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+            )
+        return vectors.astype(np.float32, copy=False)
+
+    async def aembed(self, texts):
+        return await run_blocking(self.embed, texts)
+
+
+PROVIDERS = {
+    OpenAIEmbeddingProvider.name: OpenAIEmbeddingProvider,
+    SentenceTransformerProvider.name: SentenceTransformerProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(name=None, model=None):
+    """provider انتخاب‌شده در تنظیمات (EMBEDDING_PROVIDER / EMBEDDING_MODEL)"""
+    name = name or settings.EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ImproperlyConfigured(f"Unknown EMBEDDING_PROVIDER {name!r} (choose from {', '.join(PROVIDERS)})")
+    model = model or settings.EMBEDDING_MODEL or PROVIDERS[name].default_model
+    provider = _providers.get((name, model))
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get((name, model))
+            if provider is None:
+                provider = _providers[(name, model)] = PROVIDERS[name](model)
+    return provider
+
+
+def embedding_model_id(provider=None):
+    """شناسه‌ی provider/model برای ذخیره کنار مدل‌ها و ایندکس‌هایی که روی embedding ساخته می‌شوند"""
+    provider = provider or get_embedding_provider()
+    return f"{provider.name}/{provider.model}"
@@ -0,0 +1,38 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_blocking_executor():
+    """
+    Bounded thread pool for FAISS searches and ORM queries issued from async
+    views. Each worker thread keeps its own DB connection, so the pool size
+    is also the number of DB connections a process holds for /chat.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BLOCKING_EXECUTOR_WORKERS,
+                    thread_name_prefix="core-blocking",
+                )
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    close_old_connections()
+    return fn(*args, **kwargs)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """اجرای کد sync (FAISS/ORM) روی executor محدود، بدون بلاک کردن event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(_call, fn, args, kwargs))
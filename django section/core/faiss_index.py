@@ -1,14 +1,22 @@
 import os
-import sys
+import time
 import pickle
 import faiss
-import gdown
 import logging
 import json
+import threading
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+
+from core.artifact_fetcher import Artifact, fetch_all, load_manifest, parse_sources, with_manifest
+from core.index_bundle import (
+    INDEX_FILES, KEY_FILES, bundle_dir, check_alignment, read_current, read_manifest, verify_files,
+)
+from core.key_table import KeyTable, key_table_path, write_key_table
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-DIM = 1536
 DATA_DIR = "/var/lib/data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -19,6 +27,15 @@ categories_id_to_key_path = os.path.join(DATA_DIR, "categories_id_to_key.pkl")
 categories_index_path = os.path.join(DATA_DIR, "categories.index")
 images_index_path = os.path.join(DATA_DIR, "images.index")
 images_id_to_key_path = os.path.join(DATA_DIR, "images_id_to_key.pkl")
+# versioned bundles published with `manage.py publish_index_bundle` (see core/index_bundle.py)
+BUNDLES_DIR = os.path.join(DATA_DIR, "bundles")
+
+INDEX_PATHS = {
+    "products": products_index_path,
+    "extra_features": extra_features_index_path,
+    "categories": categories_index_path,
+    "images": images_index_path,
+}
 
 URL_ID_TO_KEY = "https://drive.google.com/uc?id=1biSHt_AJeEYO5erpJGN_aBFHZcdBE-Qw"
 URL_PRODUCTS = "https://drive.google.com/uc?id=1TtUlCllCnXXyDuvjoMpiwpFWJmWl5feb"
@@ -29,96 +46,370 @@ URL_IMAGES_EMBEDDING = "https://drive.google.com/uc?id=10hIr22ZOMv4Sgfoesly7Y7iS
 URL_IMAGES_ID_TO_KEY = "https://drive.google.com/uc?id=1hA_3kNGsHslZRSTC32jeDcJZfv4fK8Pg"
 
 
-_index_product = None
-_index_extra_features = None
-_index_categories = None
-_index_images = None
-_categories_keys = None
-_images_keys = None
-_keys = None
+# Indexes downloaded before per-index metadata existed were all built with these embeddings
+LEGACY_TEXT_EMBEDDING = {"embedding_provider": "openai", "embedding_model": "text-embedding-3-small"}
+LEGACY_IMAGE_EMBEDDING = {"embedding_provider": "clip", "embedding_model": "openai/clip-vit-base-patch32"}
+TEXT_INDEXES = ("index_product", "index_extra_features", "index_categories")
+
+
+def meta_path(index_path):
+    return f"{index_path}.meta.json"
+
+
+def _metric_name(index):
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def read_index_meta(index_path, index, default):
+    """متادیتای ایندکس (dim، metric، مدل embedding، تعداد بردار)؛ برای ایندکس‌های قدیمی از default"""
+    meta = dict(default)
+    try:
+        with open(meta_path(index_path), "r", encoding="utf-8") as f:
+            meta.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    meta.setdefault("dim", index.d)
+    meta.setdefault("metric", _metric_name(index))
+    meta.setdefault("count", index.ntotal)
+    if meta["dim"] != index.d:
+        raise ValueError(f"{index_path}: metadata says dim={meta['dim']} but the index has d={index.d}")
+    return meta
+
+
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_index(index, index_path, **meta):
+    """ایندکس و فایل متادیتای کنار آن را به صورت اتمیک می‌نویسد"""
+    meta = {"dim": index.d, "metric": _metric_name(index), "count": index.ntotal, **meta}
+    _atomic_write(index_path, lambda tmp: faiss.write_index(index, tmp))
+
+    def write_meta(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    _atomic_write(meta_path(index_path), write_meta)
+
+
+def write_pickle(obj, path):
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _atomic_write(path, write)
+
+
+def write_json(obj, path):
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+    _atomic_write(path, write)
+
+
+def _check_text_embedding(meta):
+    """ایندکس‌های متنی باید با همان provider/مدلی ساخته شده باشند که برای query استفاده می‌شود"""
+    from django.core.exceptions import ImproperlyConfigured
+    from core.embedding_providers import get_embedding_provider
+
+    provider = get_embedding_provider()
+    for name in TEXT_INDEXES:
+        index_meta = meta[name]
+        built_with = (index_meta["embedding_provider"], index_meta["embedding_model"])
+        if built_with != (provider.name, provider.model) or (provider.dim and provider.dim != index_meta["dim"]):
+            raise ImproperlyConfigured(
+                f"{name} was built with {built_with[0]}/{built_with[1]} (dim={index_meta['dim']}) but "
+                f"EMBEDDING_PROVIDER is {provider.name}/{provider.model} (dim={provider.dim}); "
+                f"run `manage.py rebuild_text_indexes` or switch the provider back"
+            )
+
+
+_faiss_dict = None
+_load_lock = threading.Lock()
+# idle → loading → warming → ready (or failed); reported by /healthz and /readyz
+_status = {"state": "idle", "error": None, "version": None, "timings": {}, "swap_error": None}
+_swap_lock = threading.Lock()
+
+
+def artifacts():
+    """فایل‌هایی که بدون باندل از Google Drive (یا ARTIFACT_SOURCES) گرفته می‌شوند"""
+    return [
+        Artifact(os.path.basename(path), path, url)
+        for path, url in (
+            (id_to_key_path, URL_ID_TO_KEY),
+            (products_index_path, URL_PRODUCTS),
+            (extra_features_index_path, URL_EXTRA_FEATURES),
+            (categories_index_path, URL_CATEGORIES_EMBEDDING),
+            (categories_id_to_key_path, URL_CATEGORIES_ID_TO_KEY),
+            (images_id_to_key_path, URL_IMAGES_ID_TO_KEY),
+            (images_index_path, URL_IMAGES_EMBEDDING),
+        )
+    ]
 
 
 def _download_if_missing():
-    if not os.path.exists(id_to_key_path):
-        logging.info("Downloading id_to_key.pkl ...")
-        gdown.download(URL_ID_TO_KEY, id_to_key_path, quiet=False)
-        logging.info("Downloaded id_to_key.pkl ✅")
-    else:
-        logging.info("id_to_key.pkl already exists")
-
-    if not os.path.exists(products_index_path):
-        logging.info("Downloading products.index ...")
-        gdown.download(URL_PRODUCTS, products_index_path, quiet=False)
-        logging.info("Downloaded products.index ✅")
-    else:
-        logging.info("products.index already exists")
-
-    if not os.path.exists(extra_features_index_path):
-        logging.info("Downloading extra_features.index ...")
-        gdown.download(URL_EXTRA_FEATURES, extra_features_index_path, quiet=False)
-        logging.info("Downloaded extra_features.index ✅")
-    else:
-        logging.info("extra_features.index already exists")
-
-    if not os.path.exists(categories_index_path):
-        logging.info("Downloading categories.index ...")
-        gdown.download(URL_CATEGORIES_EMBEDDING, categories_index_path, quiet=False)
-        logging.info("Downloaded categories.index ✅")
-    else:
-        logging.info("categories.index already exists")
-
-    if not os.path.exists(categories_id_to_key_path):
-        logging.info("Downloading categories_id_to_key.index ...")
-        gdown.download(URL_CATEGORIES_ID_TO_KEY, categories_id_to_key_path, quiet=False)
-        logging.info("Downloaded categories_id_to_key.index ✅")
-    else:
-        logging.info("categories_id_to_key.index already exists")
-
-    if not os.path.exists(images_id_to_key_path):
-        logging.info("Downloading images_id_to_key.index ...")
-        gdown.download(URL_IMAGES_ID_TO_KEY, images_id_to_key_path, quiet=False)
-        logging.info("Downloaded images_id_to_key.index ✅")
-    else:
-        logging.info("images_id_to_key.index already exists")
-
-    if not os.path.exists(images_index_path):
-        logging.info("Downloading images.index ...")
-        gdown.download(URL_IMAGES_EMBEDDING, images_index_path, quiet=False)
-        logging.info("Downloaded images.index ✅")
-    else:
-        logging.info("images.index already exists")
+    """artifactهای ناموجود یا ناقص به صورت موازی دریافت می‌شوند (core/artifact_fetcher.py)"""
+    fetched = fetch_all(
+        with_manifest(artifacts(), load_manifest(settings.ARTIFACT_MANIFEST)),
+        parse_sources(settings.ARTIFACT_SOURCES),
+        workers=settings.ARTIFACT_FETCH_WORKERS,
+    )
+    for name, (source, _) in fetched.items():
+        if source is None:
+            logging.info(f"{name} already exists")
 
 
-def get_faiss_index():
-    """لود singleton FAISS index و keys"""
-    global _index_product, _index_extra_features, _index_categories, _categories_keys, _keys, _images_keys, _index_images
+def product_rows(faiss_dict, keys):
+    """ردیف‌های index_product/index_extra_features برای کلیدهای base (کلیدهای ناموجود نادیده گرفته می‌شوند)"""
+    return faiss_dict['product_keys'].rows(keys)
+
+
+def _read_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _read_images_keys(path):
+    # images_id_to_key.pkl is a JSON dict {"<row>": key} despite its name
+    with open(path, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    keys = [mapping.get(str(row)) for row in range(len(mapping))]
+    if None in keys:
+        raise ValueError(f"{path}: rows are not 0..{len(mapping) - 1}")
+    return keys
+
+
+def load_key_table(path, read_legacy):
+    """
+    جدول packed کنار فایل pickle/JSON (id_to_key.keys)؛ اگر وجود نداشته باشد یا از
+    فایل اصلی قدیمی‌تر باشد یک بار از روی آن ساخته می‌شود.
+    """
+    packed_path = key_table_path(path)
+    if not os.path.exists(packed_path) or os.path.getmtime(packed_path) < os.path.getmtime(path):
+        logging.info(f"Converting {path} → {packed_path}")
+        write_key_table(read_legacy(path), packed_path)
+    return KeyTable(packed_path)
+
 
-    if "runserver" not in sys.argv:
-        logging.info("Not running under runserver → skipping FAISS load")
-        return {}
+def _load_ann(index_path, flat_meta):
+    """نسخه‌ی ANN ایندکس (FAISS_ANN_INDEX_TYPE) اگر با build_ann_index ساخته شده باشد"""
+    from core.ann import ann_index_path
 
-    if _index_product is None or _keys is None or _index_extra_features is None or _index_categories is None or _categories_keys is None or _index_images is None or _images_keys is None:
-        logging.info("FAISS index/keys not loaded → loading now")
+    kind = settings.FAISS_ANN_INDEX_TYPE
+    if not kind:
+        return None, None
+    path = ann_index_path(index_path, kind)
+    if not os.path.exists(path):
+        logging.warning(f"{path} not found → using the flat index (run `manage.py build_ann_index --type {kind}`)")
+        return None, None
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    meta = read_index_meta(path, index, flat_meta)
+    if index.ntotal != flat_meta["count"]:
+        logging.warning(f"{path} has {index.ntotal} vectors, the flat index {flat_meta['count']} → ignoring it")
+        return None, None
+    logging.info(f"Loaded {kind} index {path} ✅")
+    return index, meta
+
+
+@contextmanager
+def _timed(timings, name):
+    start = time.perf_counter()
+    yield
+    timings[name] = round(time.perf_counter() - start, 3)
+
+
+def _read_index(timings, path):
+    with _timed(timings, os.path.basename(path)):
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+
+
+def _load_key_table(timings, path, read_legacy):
+    with _timed(timings, os.path.basename(key_table_path(path))):
+        return load_key_table(path, read_legacy)
+
+
+def _warm(faiss_dict, timings):
+    """
+    یک جستجوی ساختگی روی هر ایندکس و یک lookup روی هر جدول کلید تا صفحات mmap
+    قبل از اولین درخواست واقعی در حافظه باشند.
+    """
+    for name in ('index_product', 'index_extra_features', 'index_categories', 'index_images', 'index_product_ann'):
+        index = faiss_dict[name]
+        if index is not None and index.ntotal:
+            with _timed(timings, f"warm {name}"):
+                index.search(np.zeros((1, index.d), dtype=np.float32), 1)
+    for name in ('product_keys', 'category_keys', 'images_keys'):
+        keys = faiss_dict[name]
+        with _timed(timings, f"warm {name}"):
+            keys.warm()
+
+
+# faiss_dict names of the bundle's indexes and key tables
+DICT_INDEXES = {
+    "products": "index_product",
+    "extra_features": "index_extra_features",
+    "categories": "index_categories",
+    "images": "index_images",
+}
+DICT_KEYS = {"id_to_key": "product_keys", "categories_id_to_key": "category_keys", "images_id_to_key": "images_keys"}
+
+
+def _load_indexes(paths, key_tables, timings):
+    """ایندکس‌های paths (فایل‌های DATA_DIR یا یک باندل) به همراه جدول‌های کلید → faiss_dict"""
+    indexes = {name: _read_index(timings, paths[name]) for name in DICT_INDEXES}
+    meta = {
+        DICT_INDEXES[name]: read_index_meta(
+            paths[name], index, LEGACY_IMAGE_EMBEDDING if name == "images" else LEGACY_TEXT_EMBEDDING
+        )
+        for name, index in indexes.items()
+    }
+    _check_text_embedding(meta)
+    with _timed(timings, "ann"):
+        index_product_ann, meta['index_product_ann'] = _load_ann(paths["products"], meta['index_product'])
+
+    faiss_dict = {DICT_INDEXES[name]: index for name, index in indexes.items()}
+    faiss_dict.update({DICT_KEYS[name]: keys for name, keys in key_tables.items()})
+    faiss_dict.update(index_product_ann=index_product_ann, meta=meta)
+    return faiss_dict, indexes
+
+
+def _load_legacy(timings):
+    with _timed(timings, "download"):
         _download_if_missing()
+    key_tables = {
+        "id_to_key": _load_key_table(timings, id_to_key_path, _read_pickle),
+        "categories_id_to_key": _load_key_table(timings, categories_id_to_key_path, _read_pickle),
+        "images_id_to_key": _load_key_table(timings, images_id_to_key_path, _read_images_keys),
+    }
+    faiss_dict, indexes = _load_indexes(INDEX_PATHS, key_tables, timings)
+    for name, index in indexes.items():
+        keys = key_tables[INDEX_FILES[name][1]]
+        if len(keys) != index.ntotal:
+            logging.warning(f"{INDEX_PATHS[name]} has {index.ntotal} vectors but its key map {len(keys)} keys")
+    faiss_dict["version"] = None
+    return faiss_dict
+
+
+def _load_bundle(version, timings):
+    directory = bundle_dir(BUNDLES_DIR, version)
+    manifest = read_manifest(directory)
+    with _timed(timings, "verify"):
+        verify_files(directory, manifest, checksums=settings.FAISS_BUNDLE_VERIFY == "sha256")
+    key_tables = {}
+    for name, file in KEY_FILES.items():
+        with _timed(timings, file):
+            key_tables[name] = KeyTable(os.path.join(directory, file))
+    paths = {name: os.path.join(directory, file) for name, (file, _) in INDEX_FILES.items()}
+    faiss_dict, indexes = _load_indexes(paths, key_tables, timings)
+    check_alignment(manifest, indexes, key_tables)
+    faiss_dict["version"] = version
+    return faiss_dict
+
+
+def _load(version, timings, on_warm=None):
+    """یک نسخه (None → فایل‌های قدیمی DATA_DIR) را کامل لود و گرم می‌کند"""
+    logging.info(f"Loading FAISS indexes and key tables ({f'bundle {version}' if version else DATA_DIR})")
+    faiss_dict = _load_bundle(version, timings) if version else _load_legacy(timings)
+    logging.info(f"Loaded {len(faiss_dict['product_keys'])} keys ✅")
+    if on_warm is not None:
+        on_warm()
+    _warm(faiss_dict, timings)
+    breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    logging.info(f"FAISS index loaded in {sum(timings.values()):.2f}s ✅ ({breakdown})")
+    return faiss_dict
+
+
+def _initial_load():
+    timings = {}
+    _status.update(state="loading", error=None)
+    try:
+        faiss_dict = _load(read_current(BUNDLES_DIR), timings, on_warm=lambda: _status.update(state="warming"))
+    except Exception as e:
+        _status.update(state="failed", error=f"{type(e).__name__}: {e}", timings=timings)
+        raise
+    _status.update(state="ready", version=faiss_dict["version"], timings=timings)
+    return faiss_dict
+
+
+def get_faiss_index():
+    """لود singleton FAISS index و keys (single-flight: فقط یک thread لود می‌کند و بقیه منتظر می‌مانند)"""
+    global _faiss_dict
+
+    faiss_dict = _faiss_dict
+    if faiss_dict is None:
+        with _load_lock:
+            if _faiss_dict is None:
+                _faiss_dict = _initial_load()
+            faiss_dict = _faiss_dict
+    return faiss_dict
+
+
+def swap_bundle(version):
+    """
+    نسخه‌ی جدید کنار نسخه‌ی فعلی لود و گرم می‌شود و بعد فقط اشاره‌گر عوض می‌شود؛
+    درخواست‌هایی که faiss_dict قبلی را گرفته‌اند روی همان تمام می‌شوند و حافظه‌ی
+    آن با رها شدن آخرین ارجاع آزاد می‌شود.
+    """
+    global _faiss_dict
+
+    with _swap_lock:
+        timings = {}
+        faiss_dict = _load(version, timings)
+        with _load_lock:
+            previous, _faiss_dict = _faiss_dict, faiss_dict
+        _status.update(state="ready", error=None, version=version, timings=timings, swap_error=None)
+        logging.info(f"Switched FAISS indexes {previous['version'] if previous else None} → {version} ✅")
+
+
+def _watch(interval):
+    """هر interval ثانیه bundles/CURRENT را بررسی می‌کند و نسخه‌ی جدید را جایگزین می‌کند"""
+    failed = None
+    while True:
+        time.sleep(interval)
+        current = _faiss_dict
+        if current is None:
+            # nothing loaded yet: the first request (or a retried preload) loads CURRENT itself
+            continue
+        version = None
+        try:
+            version = read_current(BUNDLES_DIR)
+            if version is None or version in (current["version"], failed):
+                continue
+            swap_bundle(version)
+        except Exception as e:
+            # keep serving the loaded version; retry only when CURRENT changes again
+            failed = version
+            _status["swap_error"] = f"{version}: {type(e).__name__}: {e}"
+            logging.exception(f"Loading FAISS bundle {version} failed → still serving {current.get('version')}")
+
+
+def _preload():
+    try:
+        get_faiss_index()
+    except Exception:
+        logging.exception("FAISS preload failed; /readyz stays 503 until a request loads the indexes")
+    if settings.FAISS_BUNDLE_POLL_SECONDS > 0:
+        _watch(settings.FAISS_BUNDLE_POLL_SECONDS)
 
-        logging.info(f"Loading keys from {id_to_key_path}")
-        with open(id_to_key_path, "rb") as f:
-            _keys = pickle.load(f)
 
-        with open(categories_id_to_key_path, "rb") as f:
-            _categories_keys = pickle.load(f)
+def preload(block=False):
+    """
+    از config/asgi.py و config/wsgi.py صدا زده می‌شود تا ایندکس‌ها هنگام بالا آمدن
+    سرور لود شوند، نه در اولین درخواست. block=False در یک thread پس‌زمینه لود می‌کند
+    و تا آماده شدن /readyz جواب 503 می‌دهد. همان thread بعد از لود باندل‌های جدید را
+    دنبال می‌کند (FAISS_BUNDLE_POLL_SECONDS).
+    """
+    if block:
+        get_faiss_index()
+    threading.Thread(target=_preload, name="faiss-preload", daemon=True).start()
 
-        with open(images_id_to_key_path, "r", encoding="utf-8") as f:
-            _images_keys = json.load(f)
 
-        logging.info(f"Loaded {len(_keys)} keys ✅")
+def index_version():
+    """نسخه‌ی باندل ایندکسی که الان سرو می‌شود (None برای فایل‌های قدیمی بدون باندل)"""
+    return _status["version"]
 
-        logging.info("Loading FAISS index")
-        _index_product = faiss.read_index(products_index_path, faiss.IO_FLAG_MMAP)
-        _index_extra_features = faiss.read_index(extra_features_index_path, faiss.IO_FLAG_MMAP)
-        _index_categories = faiss.read_index(categories_index_path, faiss.IO_FLAG_MMAP)
-        _index_images = faiss.read_index(images_index_path, faiss.IO_FLAG_MMAP)
-        logging.info("FAISS index loaded ✅")
 
-    ret_dict = {'index_product': _index_product, 'index_extra_features': _index_extra_features, 'index_categories': _index_categories, 'product_keys': _keys, 'category_keys': _categories_keys, 'images_keys': _images_keys, 'index_images': _index_images}
-    return ret_dict
+def index_status():
+    status = dict(_status, timings=dict(_status["timings"]))
+    status["ready"] = status["state"] == "ready"
+    return status
@@ -0,0 +1,273 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from core.clients import get_image_client, get_async_image_client
+from core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+    _PIL_AVAILABLE = True
+except ImportError:
+    _PIL_AVAILABLE = False
+
+
+def to_data_url(content, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(content).decode('utf-8')}"
+
+
+def make_thumbnail(content, size):
+    """نسخه‌ی کوچک‌شده‌ی JPEG تصویر (حداکثر size پیکسل در هر بعد) یا None"""
+    if not _PIL_AVAILABLE or size <= 0:
+        return None
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if max(image.size) <= size:
+                return None
+            image = image.convert("RGB")
+            image.thumbnail((size, size))
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=85)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning(f"[image_cache] could not build thumbnail: {e}")
+        return None
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache of product images, stored as ready-to-send
+    base64 data URLs. A SQLite index (WAL, shared by every worker on the node)
+    maps URL → SHA-256 of the image bytes, so the same image served under
+    different URLs is stored once. Blobs are evicted least-recently-used once
+    their total size exceeds max_bytes; the total is kept in a one-row stats
+    table that triggers update in the same transaction as every blob change.
+    """
+
+    VARIANTS = ("full", "thumb")
+
+    def __init__(self, directory, max_bytes, thumbnail_size):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self._init_db()
+        if thumbnail_size > 0 and not _PIL_AVAILABLE:
+            logger.warning("[image_cache] Pillow is not installed → thumbnails fall back to full images")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, content_hash TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS urls_content_hash ON urls (content_hash)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "content_hash TEXT PRIMARY KEY, has_thumb INTEGER NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), items INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS blobs_added AFTER INSERT ON blobs BEGIN "
+                "UPDATE stats SET items = items + 1, bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS blobs_removed AFTER DELETE ON blobs BEGIN "
+                "UPDATE stats SET items = items - 1, bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+            # once per cache directory: caches created before the stats table start from the real totals
+            conn.execute("INSERT OR IGNORE INTO stats SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM blobs")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _path(self, content_hash, variant):
+        return os.path.join(self.directory, "blobs", content_hash[:2], f"{content_hash}.{variant}")
+
+    def _count(self, field):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def contains(self, url):
+        row = self._conn().execute(
+            "SELECT 1 FROM urls JOIN blobs USING (content_hash) WHERE url = ?", (url,)
+        ).fetchone()
+        return row is not None
+
+    def get(self, url, thumbnail=False):
+        """data URL ذخیره‌شده برای url یا None"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT content_hash, has_thumb FROM urls JOIN blobs USING (content_hash) WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        content_hash, has_thumb = row
+        variant = "thumb" if thumbnail and has_thumb else "full"
+        try:
+            with open(self._path(content_hash, variant), encoding="ascii") as f:
+                data_url = f.read()
+        except OSError:
+            # evicted by another worker between the lookup and the read
+            self._count("misses")
+            return None
+        conn.execute("UPDATE blobs SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+        self._count("hits")
+        return data_url
+
+    def _write(self, path, data_url):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="ascii") as f:
+            f.write(data_url)
+        os.replace(tmp_path, path)
+        return len(data_url)
+
+    def put(self, url, content, mime_type):
+        """تصویر دانلودشده را ذخیره می‌کند و (full, thumb) data URL برمی‌گرداند"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        full = to_data_url(content, mime_type)
+        thumb_content = make_thumbnail(content, self.thumbnail_size)
+        thumb = to_data_url(thumb_content, "image/jpeg") if thumb_content is not None else full
+
+        conn = self._conn()
+        exists = conn.execute("SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone()
+        if exists is None:
+            size = self._write(self._path(content_hash, "full"), full)
+            if thumb_content is not None:
+                size += self._write(self._path(content_hash, "thumb"), thumb)
+            # OR IGNORE, not OR REPLACE: REPLACE deletes without firing blobs_removed
+            conn.execute(
+                "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)",
+                (content_hash, int(thumb_content is not None), size, time.time()),
+            )
+        conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, content_hash))
+        self._evict()
+        return full, thumb
+
+    def _evict(self):
+        conn = self._conn()
+        total = conn.execute("SELECT bytes FROM stats WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # evict down to 90% so that every insert does not trigger another pass
+        target = int(self.max_bytes * 0.9)
+        for content_hash, size in conn.execute("SELECT content_hash, size FROM blobs ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+                conn.execute("DELETE FROM urls WHERE content_hash = ?", (content_hash,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            for variant in self.VARIANTS:
+                try:
+                    os.remove(self._path(content_hash, variant))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self._count("evictions")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        items, nbytes = self._conn().execute("SELECT items, bytes FROM stats WHERE id = 0").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "items": items,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+            "thumbnails": self.thumbnail_size > 0 and _PIL_AVAILABLE,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ImageCache(
+                    settings.IMAGE_CACHE_DIR,
+                    max_bytes=settings.IMAGE_CACHE_MAX_BYTES,
+                    thumbnail_size=settings.IMAGE_CACHE_THUMBNAIL_SIZE,
+                )
+    return _cache
+
+
+def _cached(image_url, thumbnail):
+    try:
+        return get_image_cache().get(image_url, thumbnail)
+    except sqlite3.Error as e:
+        logger.warning(f"[image_cache] lookup failed: {e}")
+        return None
+
+
+def _store(image_url, content, mime_type, thumbnail):
+    try:
+        full, thumb = get_image_cache().put(image_url, content, mime_type)
+        return thumb if thumbnail else full
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"[image_cache] store failed: {e}")
+        return to_data_url(content, mime_type)
+
+
+def fetch_image_data_url(image_url, thumbnail=False):
+    """تصویر به صورت base64 data URL؛ از کش دیسکی یا با دانلود و ذخیره در کش"""
+    data_url = _cached(image_url, thumbnail)
+    if data_url is not None:
+        return data_url
+    response = get_image_client().get(image_url)
+    response.raise_for_status()
+    return _store(image_url, response.content, response.headers.get('content-type', 'image/jpeg'), thumbnail)
+
+
+async def afetch_image_data_url(image_url, thumbnail=False):
+    data_url = await run_blocking(_cached, image_url, thumbnail)
+    if data_url is not None:
+        return data_url
+    response = await get_async_image_client().get(image_url)
+    response.raise_for_status()
+    return await run_blocking(
+        _store, image_url, response.content, response.headers.get('content-type', 'image/jpeg'), thumbnail
+    )
+
+
+def image_cache_stats():
+    return _cache.stats() if _cache is not None else None
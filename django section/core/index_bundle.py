@@ -0,0 +1,117 @@
+"""
+باندل نسخه‌دار ایندکس‌ها: ایندکس‌های FAISS، جدول‌های کلید و manifest در یک پوشه.
+
+    bundles/
+        CURRENT                 نام نسخه‌ی فعال (با os.replace عوض می‌شود)
+        20261018-120000/
+            manifest.json
+            products.index, products.index.meta.json, ...
+            id_to_key.keys, categories_id_to_key.keys, images_id_to_key.keys
+
+manifest هر ایندکس را به جدول کلیدش گره می‌زند (dim، metric، count) و اندازه و
+SHA-256 همه‌ی فایل‌ها را نگه می‌دارد؛ یک پوشه‌ی نسخه بعد از انتشار تغییر نمی‌کند.
+"""
+import hashlib
+import json
+import os
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+# index → (file, key table it is row-aligned with)
+INDEX_FILES = {
+    "products": ("products.index", "id_to_key"),
+    "extra_features": ("extra_features.index", "id_to_key"),
+    "categories": ("categories.index", "categories_id_to_key"),
+    "images": ("images.index", "images_id_to_key"),
+}
+KEY_FILES = {
+    "id_to_key": "id_to_key.keys",
+    "categories_id_to_key": "categories_id_to_key.keys",
+    "images_id_to_key": "images_id_to_key.keys",
+}
+
+
+class BundleError(ValueError):
+    pass
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    # hashlib releases the GIL on large buffers, so verifying in a background
+    # thread does not stall request threads
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bundle_dir(bundles_dir, version):
+    return os.path.join(bundles_dir, version)
+
+
+def read_current(bundles_dir):
+    """نسخه‌ی فعال، یا None اگر هنوز باندلی منتشر نشده باشد"""
+    try:
+        with open(os.path.join(bundles_dir, CURRENT), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_current(bundles_dir, version):
+    path = os.path.join(bundles_dir, CURRENT)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise BundleError(f"{directory} has no {MANIFEST}")
+    if manifest.get("format") != FORMAT:
+        raise BundleError(f"{directory}: unsupported bundle format {manifest.get('format')!r}")
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def verify_files(directory, manifest, checksums=True):
+    """اندازه (و در صورت checksums، SHA-256) همه‌ی فایل‌های manifest"""
+    for name, entry in manifest["files"].items():
+        path = os.path.join(directory, name)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            raise BundleError(f"{path} is missing")
+        if size != entry["size"]:
+            raise BundleError(f"{path}: {size} bytes, manifest says {entry['size']}")
+        if checksums and sha256_file(path) != entry["sha256"]:
+            raise BundleError(f"{path}: SHA-256 does not match the manifest")
+
+
+def check_alignment(manifest, indexes, key_tables):
+    """
+    ایندکس‌ها و جدول‌های لودشده باید با manifest و با هم بخوانند: هر ایندکس همان
+    dim/count را دارد و به اندازه‌ی جدول کلیدش بردار دارد.
+    """
+    for name, index in indexes.items():
+        entry = manifest["indexes"][name]
+        if (index.d, index.ntotal) != (entry["dim"], entry["count"]):
+            raise BundleError(
+                f"{name}: index has dim={index.d} count={index.ntotal}, "
+                f"manifest says dim={entry['dim']} count={entry['count']}"
+            )
+        keys = key_tables[entry["keys"]]
+        if len(keys) != index.ntotal:
+            raise BundleError(f"{name}: {index.ntotal} vectors but {entry['keys']} has {len(keys)} keys")
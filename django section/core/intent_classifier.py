@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from core.embedding_cache import embed_text, embed_texts, aembed_text, normalize_text
+from core.embedding_providers import embedding_model_id
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = (1, 2, 3, 4, 5, 6, 7)
+TEXT_SCENARIOS = (1, 2, 3, 4, 5)
+IMAGE_SCENARIOS = (6, 7)
+
+_CODE_RE = re.compile(r"کد\s*[:#]?\s*[\w\-]+")
+_WORD_GROUPS = {
+    "seller": ("فروشگاه", "فروشنده", "فروشگاه‌ها", "عضو", "اعضا", "گارانتی", "امتیاز", "شهر"),
+    "price": ("قیمت", "کمترین", "بیشترین", "ارزان", "گران", "میانگین", "تومان"),
+    "compare": ("مقایسه", "کدام", "کدوم", "بهتر", "مناسب‌تر", "یا", "بین"),
+    "attribute": ("ابعاد", "اندازه", "رنگ", "جنس", "وزن", "ظرفیت", "حجم", "مشخصات", "ویژگی", "چیست", "چند"),
+    "request": ("میخوام", "می خواهم", "میخواهم", "تهیه", "پیدا", "خرید", "بخرم", "معرفی", "دنبال"),
+    "image": ("تصویر", "عکس", "شیء", "شی", "آبجکت"),
+}
+# short words (e.g. "یا") only count as whole words, longer ones also inside inflected forms
+_WORD_GROUP_RES = [
+    re.compile("|".join(
+        re.escape(normalize_text(w)) if len(w) > 3 else rf"\b{re.escape(normalize_text(w))}\b"
+        for w in words
+    ))
+    for words in _WORD_GROUPS.values()
+]
+
+
+def rule_features(message, message_type):
+    """ویژگی‌های قاعده‌محور پیام (نوع پیام، تعداد کد محصول، کلمات کلیدی)"""
+    text = normalize_text(message)
+    codes = len(_CODE_RE.findall(text))
+    features = [
+        1.0 if str(message_type).lower() == "image" else 0.0,
+        float(min(codes, 3)),
+        1.0 if codes >= 2 else 0.0,
+        float(min(len(text) / 200.0, 3.0)),
+        1.0 if "?" in text or "؟" in text else 0.0,
+    ]
+    for pattern in _WORD_GROUP_RES:
+        features.append(float(min(len(pattern.findall(text)), 3)))
+    return np.array(features, dtype=np.float32)
+
+
+def allowed_scenarios(message_type):
+    return IMAGE_SCENARIOS if str(message_type).lower() == "image" else TEXT_SCENARIOS
+
+
+class IntentClassifier:
+    """
+    Multinomial logistic regression over [query embedding, rule features].
+    Predictions are restricted to the scenarios allowed for the message type
+    (text → 1-5, image → 6-7) and renormalized.
+    """
+
+    # models saved before the embedding provider was recorded
+    LEGACY_EMBEDDING_MODEL = "openai/text-embedding-3-small"
+
+    def __init__(self, weights=None, bias=None, rule_mean=None, rule_std=None, embedding_model=None):
+        self.weights = weights
+        self.bias = bias
+        self.rule_mean = rule_mean
+        self.rule_std = rule_std
+        self.embedding_model = embedding_model
+
+    def _features(self, embeddings, rules):
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        rules = (rules - self.rule_mean) / self.rule_std
+        return np.hstack([embeddings, rules]).astype(np.float32)
+
+    def fit(self, embeddings, rules, labels, epochs=300, lr=0.5, l2=1e-4):
+        labels = np.asarray(labels)
+        self.rule_mean = rules.mean(axis=0)
+        self.rule_std = np.maximum(rules.std(axis=0), 1e-6)
+        X = self._features(embeddings, rules)
+        Y = np.zeros((len(labels), len(SCENARIOS)), dtype=np.float32)
+        Y[np.arange(len(labels)), labels - 1] = 1.0
+
+        self.weights = np.zeros((X.shape[1], len(SCENARIOS)), dtype=np.float32)
+        self.bias = np.zeros(len(SCENARIOS), dtype=np.float32)
+        for _ in range(epochs):
+            P = self._softmax(X @ self.weights + self.bias)
+            grad = (P - Y) / len(X)
+            self.weights -= lr * (X.T @ grad + l2 * self.weights)
+            self.bias -= lr * grad.sum(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, embeddings, rules, message_types):
+        P = self._softmax(self._features(embeddings, rules) @ self.weights + self.bias)
+        for row, message_type in enumerate(message_types):
+            mask = np.zeros(len(SCENARIOS), dtype=bool)
+            mask[[s - 1 for s in allowed_scenarios(message_type)]] = True
+            P[row, ~mask] = 0.0
+            P[row] /= max(P[row].sum(), 1e-12)
+        return P
+
+    def predict(self, embedding, message, message_type):
+        """(scenario, confidence) برای یک پیام"""
+        P = self.predict_proba(embedding.reshape(1, -1), rule_features(message, message_type).reshape(1, -1), [message_type])
+        best = int(P[0].argmax())
+        return SCENARIOS[best], float(P[0, best])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path, weights=self.weights, bias=self.bias, rule_mean=self.rule_mean, rule_std=self.rule_std,
+            embedding_model=np.array(self.embedding_model or embedding_model_id()),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            embedding_model = str(data["embedding_model"]) if "embedding_model" in data.files else cls.LEGACY_EMBEDDING_MODEL
+            return cls(data["weights"], data["bias"], data["rule_mean"], data["rule_std"], embedding_model)
+
+
+# -------------------- Decision log --------------------
+
+_log_lock = threading.Lock()
+
+
+def log_decision(message, message_type, scenario, latency_ms):
+    """ثبت تصمیم LLM برای آموزش/ارزیابی بعدی طبقه‌بند"""
+    record = {
+        "message": message,
+        "message_type": message_type,
+        "scenario": scenario,
+        "latency_ms": round(latency_ms, 1),
+        "ts": time.time(),
+    }
+    try:
+        with _log_lock, open(settings.INTENT_DECISIONS_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"[intent_classifier] could not log decision: {e}")
+
+
+def load_decisions(path):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("scenario") in SCENARIOS and record.get("message"):
+                records.append(record)
+    return records
+
+
+def build_dataset(records, batch_size=256):
+    messages = [r["message"] for r in records]
+    embeddings = np.vstack([
+        embed_texts(messages[i:i + batch_size]) for i in range(0, len(messages), batch_size)
+    ])
+    rules = np.vstack([rule_features(r["message"], r["message_type"]) for r in records])
+    labels = np.array([r["scenario"] for r in records])
+    return embeddings, rules, labels
+
+
+# -------------------- Runtime --------------------
+
+_classifier = None
+_classifier_mtime = None
+_load_lock = threading.Lock()
+
+
+def get_intent_classifier():
+    """مدل ذخیره‌شده را (در صورت وجود) لود می‌کند؛ با تغییر فایل دوباره لود می‌شود"""
+    global _classifier, _classifier_mtime
+    path = settings.INTENT_CLASSIFIER_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if mtime != _classifier_mtime:
+        with _load_lock:
+            if mtime != _classifier_mtime:
+                _classifier = IntentClassifier.load(path)
+                _classifier_mtime = mtime
+                logger.info(f"[intent_classifier] loaded model from {path}")
+                if _classifier.embedding_model != embedding_model_id():
+                    logger.warning(
+                        f"[intent_classifier] model was trained on {_classifier.embedding_model} embeddings, "
+                        f"not {embedding_model_id()} → disabled until retrained"
+                    )
+    if _classifier is not None and _classifier.embedding_model != embedding_model_id():
+        return None
+    return _classifier
+
+
+def classifier_version():
+    """هویت مدل فعلی (زمان فایل و مدل embedding)؛ None اگر مدلی در کار نباشد"""
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    return f"{_classifier_mtime}:{classifier.embedding_model}"
+
+
+def predict_scenario(message, message_type):
+    """(scenario, confidence) یا None اگر مدلی آموزش داده نشده باشد"""
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    return classifier.predict(embed_text(message)[0], message, message_type)
+
+
+async def apredict_scenario(message, message_type, embedding=None):
+    """embedding: awaitable اختیاری (مثلاً task بازیابی پیش‌دستانه) به جای embedding دوباره‌ی پیام"""
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    query_vec = await embedding if embedding is not None else await aembed_text(message)
+    return classifier.predict(query_vec[0], message, message_type)
+
+
+_route_lock = threading.Lock()
+_route_counts = {"classifier": 0, "llm": 0}
+
+
+def count_route(route):
+    with _route_lock:
+        _route_counts[route] += 1
+
+
+def intent_classifier_stats():
+    with _route_lock:
+        total = sum(_route_counts.values())
+        return {
+            **_route_counts,
+            "classifier_ratio": round(_route_counts["classifier"] / total, 4) if total else None,
+            "model_loaded": _classifier is not None,
+            "threshold": settings.INTENT_CLASSIFIER_THRESHOLD,
+        }
@@ -0,0 +1,168 @@
+"""
+جدول کلید فشرده (packed key table) برای نگاشت ردیف FAISS ↔ کلید محصول.
+
+یک فایل که با mmap خوانده می‌شود؛ همه‌ی workerها صفحات آن را به اشتراک می‌گذارند
+و هیچ شیء پایتونی به ازای هر کلید ساخته نمی‌شود:
+
+    header   KEYTBL01 + count, slots, blob_size, kind   (5 × 8 بایت)
+    offsets  uint64[count + 1]    کلید i = blob[offsets[i]:offsets[i + 1]] (UTF-8)
+    slots    int64[slots]         جدول هش open addressing: ردیف یا -1
+    blob     bytes[blob_size]
+
+row → key با دو خواندن offset (O(1)) و key → row با هش blake2b و linear probing.
+"""
+import hashlib
+import mmap
+import os
+
+import numpy as np
+
+MAGIC = b"KEYTBL01"
+HEADER_SIZE = len(MAGIC) + 4 * 8
+KIND_STR = 0
+KIND_INT = 1
+EMPTY = -1
+
+
+def key_table_path(path):
+    """id_to_key.pkl → id_to_key.keys"""
+    return f"{os.path.splitext(path)[0]}.keys"
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _encode(key):
+    return str(key).encode("utf-8")
+
+
+def _slot_count(count):
+    # load factor <= 0.5 keeps linear probes short
+    return 1 << max(3, (2 * count - 1).bit_length())
+
+
+def _build_slots(hashes, rows, slots):
+    """
+    درج همه‌ی ردیف‌ها با linear probing، برداری: در هر دور، هر slot خالی به اولین
+    ردیف منتظرش می‌رسد و بقیه یک خانه جلو می‌روند. هر خانه‌ای که ردیفی از آن رد
+    شده پر می‌ماند، پس جستجو با همان probe به کلید می‌رسد.
+    """
+    table = np.full(slots, EMPTY, dtype=np.int64)
+    mask = np.uint64(slots - 1)
+    position = hashes & mask
+    pending = np.arange(len(rows))
+    while len(pending):
+        free = table[position[pending]] == EMPTY
+        candidates = pending[free]
+        taken, first = np.unique(position[candidates], return_index=True)
+        table[taken] = rows[candidates[first]]
+        placed = np.zeros(len(rows), dtype=bool)
+        placed[candidates[first]] = True
+        pending = pending[~placed[pending]]
+        position[pending] = (position[pending] + np.uint64(1)) & mask
+    return table
+
+
+def write_key_table(keys, path):
+    """keys (لیست str یا int) را به صورت اتمیک در قالب packed می‌نویسد"""
+    keys = list(keys)
+    kind = KIND_INT if keys and all(isinstance(k, (int, np.integer)) and not isinstance(k, bool) for k in keys) else KIND_STR
+    encoded = [_encode(key) for key in keys]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+
+    # reverse index: the first row of every distinct key (images repeat a base key per image)
+    first_rows = {}
+    for row, data in enumerate(encoded):
+        first_rows.setdefault(data, row)
+    rows = np.fromiter(first_rows.values(), dtype=np.int64, count=len(first_rows))
+    hashes = np.fromiter((_hash(data) for data in first_rows), dtype=np.uint64, count=len(first_rows))
+    slots = _slot_count(len(rows))
+    table = _build_slots(hashes, rows, slots)
+
+    header = np.array([len(keys), slots, int(offsets[-1]), kind], dtype=np.uint64)
+    # per-process temp name: several workers may convert the same legacy file at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(header.tobytes())
+        f.write(offsets.tobytes())
+        f.write(table.tobytes())
+        for data in encoded:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class KeyTable:
+    """
+    نمای فقط‌خواندنی روی فایل packed؛ مثل لیست کلیدها رفتار می‌کند
+    (len، table[row]، پیمایش) و row(key) / rows(keys) جستجوی معکوس است.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a packed key table")
+        count, slots, blob_size, kind = (
+            int(v) for v in np.frombuffer(self._mm, dtype=np.uint64, count=4, offset=len(MAGIC))
+        )
+        self._count = count
+        self._kind = kind
+        self._offsets = np.frombuffer(self._mm, dtype=np.uint64, count=count + 1, offset=HEADER_SIZE)
+        slots_start = HEADER_SIZE + 8 * (count + 1)
+        self._slots = np.frombuffer(self._mm, dtype=np.int64, count=slots, offset=slots_start)
+        self._mask = slots - 1
+        self._blob_start = slots_start + 8 * slots
+        if self._blob_start + blob_size != len(self._mm):
+            raise ValueError(f"{path} is truncated ({len(self._mm)} bytes, expected {self._blob_start + blob_size})")
+
+    def __len__(self):
+        return self._count
+
+    def _bytes(self, row):
+        start = self._blob_start + int(self._offsets[row])
+        end = self._blob_start + int(self._offsets[row + 1])
+        return self._mm[start:end]
+
+    def __getitem__(self, row):
+        row = int(row)
+        if row < 0:
+            row += self._count
+        if not 0 <= row < self._count:
+            raise IndexError(f"row {row} out of range for {self._count} keys")
+        data = self._bytes(row).decode("utf-8")
+        return int(data) if self._kind == KIND_INT else data
+
+    def __iter__(self):
+        for row in range(self._count):
+            yield self[row]
+
+    def warm(self):
+        """از kernel می‌خواهد کل فایل را از قبل در page cache بخواند"""
+        if hasattr(mmap, "MADV_WILLNEED"):
+            self._mm.madvise(mmap.MADV_WILLNEED)
+        if self._count:
+            self.row(self[0])
+
+    def row(self, key):
+        """اولین ردیف کلید، یا -1 اگر وجود نداشته باشد"""
+        data = _encode(key)
+        position = _hash(data) & self._mask
+        while True:
+            row = int(self._slots[position])
+            if row == EMPTY:
+                return -1
+            if self._bytes(row) == data:
+                return row
+            position = (position + 1) & self._mask
+
+    def __contains__(self, key):
+        return self.row(key) >= 0
+
+    def rows(self, keys):
+        """ردیف‌های مرتب کلیدهای موجود (کلیدهای ناموجود نادیده گرفته می‌شوند)"""
+        rows = [self.row(key) for key in keys]
+        return np.array(sorted(row for row in rows if row >= 0), dtype=np.int64)
@@ -0,0 +1,79 @@
+import os
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core import faiss_index
+from core.ann import INDEX_TYPES, ann_index_path, search_params
+
+
+class Command(BaseCommand):
+    help = "Recall@k against the flat index and p50/p99 latency for every ANN variant and nprobe/efSearch value"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", choices=sorted(faiss_index.INDEX_PATHS), default="products")
+        parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 8, 16, 32, 64, 128])
+        parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128, 256])
+        parser.add_argument(
+            "--noise", type=float, default=0.05,
+            help="Gaussian noise added to sampled index vectors so queries are not exact duplicates",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    @staticmethod
+    def _timed_search(index, queries, k, params):
+        timings, results = [], []
+        for q in queries:
+            start = time.perf_counter()
+            _, ids = index.search(q.reshape(1, -1), k, params=params)
+            timings.append((time.perf_counter() - start) * 1000)
+            results.append(ids[0])
+        return np.array(timings), np.vstack(results)
+
+    @staticmethod
+    def _recall(ids, truth, k):
+        return np.mean([len(set(a[:k]) & set(b[:k])) / k for a, b in zip(ids, truth)])
+
+    def _row(self, label, timings, recall):
+        self.stdout.write(
+            f"{label:<28} {recall:>9.4f} {np.percentile(timings, 50):>9.3f} {np.percentile(timings, 99):>9.3f}"
+        )
+
+    def handle(self, *args, **options):
+        path = faiss_index.INDEX_PATHS[options["index"]]
+        try:
+            flat = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except RuntimeError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        k = options["k"]
+
+        rng = np.random.default_rng(options["seed"])
+        sample = np.sort(rng.choice(flat.ntotal, size=min(options["queries"], flat.ntotal), replace=False))
+        queries = flat.reconstruct_batch(sample).astype(np.float32)
+        queries += rng.normal(0, options["noise"] / np.sqrt(flat.d), queries.shape).astype(np.float32)
+        faiss.normalize_L2(queries)
+
+        self.stdout.write(f"{path}: {flat.ntotal} vectors, dim={flat.d}, {len(queries)} queries, k={k}")
+        self.stdout.write(f"{'config':<28} {'recall@' + str(k):>9} {'p50 ms':>9} {'p99 ms':>9}")
+
+        timings, truth = self._timed_search(flat, queries, k, None)
+        self._row("flat (exact)", timings, 1.0)
+
+        for kind in options["types"]:
+            ann_path = ann_index_path(path, kind)
+            if not os.path.exists(ann_path):
+                self.stdout.write(self.style.WARNING(f"{ann_path} not found → skipping {kind}"))
+                continue
+            index = faiss.read_index(ann_path, faiss.IO_FLAG_MMAP)
+            if kind == "hnsw":
+                sweep = [("efSearch", ef, search_params(index, k, ef_search=ef)) for ef in options["ef_search"]]
+            else:
+                sweep = [("nprobe", nprobe, search_params(index, k, nprobe=nprobe)) for nprobe in options["nprobe"]]
+            for param, value, params in sweep:
+                timings, ids = self._timed_search(index, queries, k, params)
+                self._row(f"{kind} {param}={value}", timings, self._recall(ids, truth, k))
@@ -0,0 +1,59 @@
+import base64
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.clients import get_clip_client
+from core.image_cache import fetch_image_data_url
+from core.scenarios.scenario7 import _clip_request, _query_vector
+
+
+class Command(BaseCommand):
+    help = "Compare payload sizes and round-trip times of the JSON and binary CLIP transports"
+
+    def add_arguments(self, parser):
+        parser.add_argument("image", help="Local image file or image URL")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+
+    def _data_url(self, image):
+        if image.startswith(("http://", "https://")):
+            return fetch_image_data_url(image)
+        try:
+            with open(image, "rb") as f:
+                return f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        except OSError as e:
+            raise CommandError(f"Cannot read {image}: {e}")
+
+    def handle(self, *args, **options):
+        data_url = self._data_url(options["image"])
+        client = get_clip_client()
+        vectors = {}
+
+        self.stdout.write(f"{'transport':<10} {'request B':>10} {'response B':>11} {'p50 ms':>8} {'p95 ms':>8}")
+        for transport in ("json", "binary"):
+            kwargs = _clip_request(data_url, transport)
+            request = client.build_request("POST", "/embed_image", **kwargs)
+            request_bytes = len(request.read())
+
+            timings = []
+            for i in range(options["warmup"] + options["repeat"]):
+                start = time.perf_counter()
+                response = client.post("/embed_image", **kwargs)
+                vec = _query_vector(response)
+                if i >= options["warmup"]:
+                    timings.append((time.perf_counter() - start) * 1000)
+            vectors[transport] = vec
+
+            self.stdout.write(
+                f"{transport:<10} {request_bytes:>10} {len(response.content):>11} "
+                f"{np.percentile(timings, 50):>8.1f} {np.percentile(timings, 95):>8.1f}"
+            )
+
+        diff = float(np.abs(vectors["json"] - vectors["binary"]).max())
+        self.stdout.write(f"max |json - binary| = {diff:.2e}")
+        if diff > 1e-5:
+            self.stdout.write(self.style.ERROR("❌ Transports disagree"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Transports agree"))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.management.commands.import_parquet import TABLES, Command as ImportCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the same rows of one parquet table with the ORM path and the COPY path and "
+        "report the speedup. Each run is rolled back, so the database is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", choices=sorted(TABLES), default="members")
+        parser.add_argument("--limit", type=int, default=100_000, help="Rows per run (0 = whole file)")
+        parser.add_argument("--data-dir", default=".", help="Directory containing the parquet files")
+        parser.add_argument("--drop-indexes", action="store_true", help="Passed to the COPY run")
+        parser.add_argument("--drop-foreign-keys", action="store_true", help="Passed to the COPY run")
+
+    def _run(self, table, limit, **options):
+        importer = ImportCommand(stdout=self.stdout, stderr=self.stderr)
+        importer.configure(**options)
+        with transaction.atomic():
+            with importer.without_indexes(table):
+                rows, elapsed = importer._import(table, limit=limit or None)
+            transaction.set_rollback(True)
+        return rows, elapsed
+
+    def handle(self, *args, **options):
+        table = options["table"]
+        model = TABLES[table]["model"]
+        if model.objects.exists():
+            # both paths would mostly skip conflicting rows and the comparison would be meaningless
+            raise CommandError(f"{model._meta.db_table} is not empty; run the benchmark on an empty table")
+
+        results = {
+            "orm": self._run(table, options["limit"], mode="orm", data_dir=options["data_dir"]),
+            "copy": self._run(
+                table, options["limit"], mode="copy", data_dir=options["data_dir"],
+                drop_indexes=options["drop_indexes"], drop_foreign_keys=options["drop_foreign_keys"],
+            ),
+        }
+        self.stdout.write(self.style.NOTICE(f"{'mode':<6} {'rows':>10} {'seconds':>9} {'rows/s':>10}"))
+        for mode, (rows, elapsed) in results.items():
+            self.stdout.write(f"{mode:<6} {rows:>10} {elapsed:>9.2f} {rows / max(elapsed, 1e-9):>10.0f}")
+        speedup = results["orm"][1] / max(results["copy"][1], 1e-9)
+        self.stdout.write(self.style.SUCCESS(f"✅ COPY is {speedup:.1f}x faster than the ORM path for {table}"))
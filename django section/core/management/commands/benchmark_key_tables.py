@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import faiss_index
+from core.key_table import KeyTable
+
+KEY_MAPS = {
+    "products": (faiss_index.id_to_key_path, faiss_index._read_pickle),
+    "categories": (faiss_index.categories_id_to_key_path, faiss_index._read_pickle),
+    "images": (faiss_index.images_id_to_key_path, faiss_index._read_images_keys),
+}
+
+
+def _rss():
+    """(RSS, سهم private) فعلی به MiB؛ صفحات فایل mmap شده shared حساب می‌شوند"""
+    with open("/proc/self/statm") as f:
+        _, resident, shared = (int(v) for v in f.read().split()[:3])
+    page = os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    return resident * page, (resident - shared) * page
+
+
+def _measure(name, packed, lookups, seed):
+    """در یک پروسه‌ی تازه اجرا می‌شود تا RSS هر روش جدا اندازه گرفته شود"""
+    path, read_legacy = KEY_MAPS[name]
+    rss_before, private_before = _rss()
+    start = time.perf_counter()
+    if packed:
+        keys = KeyTable(faiss_index.key_table_path(path))
+        row_of = keys.row
+    else:
+        keys = read_legacy(path)
+    load_s = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    rows = [rng.randrange(len(keys)) for _ in range(lookups)]
+    start = time.perf_counter()
+    if not packed:
+        # what product_rows() used to build on the first filtered search
+        reverse = {}
+        for row, key in enumerate(keys):
+            reverse.setdefault(key, row)
+        row_of = reverse.get
+    first_lookup_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in rows:
+        row_of(keys[row])
+    lookup_us = (time.perf_counter() - start) / max(lookups, 1) * 1e6
+
+    rss_after, private_after = _rss()
+    return {
+        "keys": len(keys),
+        "load_ms": load_s * 1000,
+        "reverse_ms": first_lookup_s * 1000,
+        "lookup_us": lookup_us,
+        "rss_mib": rss_after - rss_before,
+        "private_mib": private_after - private_before,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the pickle/JSON key maps to packed key tables and compare load time, "
+        "RSS and lookup latency of both formats (each measured in a fresh process)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--maps", nargs="+", choices=sorted(KEY_MAPS), default=sorted(KEY_MAPS))
+        parser.add_argument("--lookups", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("spawn")
+        self.stdout.write(
+            f"{'map':<11} {'format':<7} {'keys':>9} {'load ms':>9} {'reverse ms':>11} "
+            f"{'lookup µs':>10} {'RSS MiB':>8} {'private MiB':>12}"
+        )
+        for name in options["maps"]:
+            path, read_legacy = KEY_MAPS[name]
+            if not os.path.exists(path):
+                raise CommandError(f"{path} not found (start the server once or run build_faiss_indexes)")
+            faiss_index.load_key_table(path, read_legacy)
+
+            for label, packed in (("legacy", False), ("packed", True)):
+                with context.Pool(1) as pool:
+                    result = pool.apply(_measure, (name, packed, options["lookups"], options["seed"]))
+                self.stdout.write(
+                    f"{name:<11} {label:<7} {result['keys']:>9} {result['load_ms']:>9.1f} "
+                    f"{result['reverse_ms']:>11.1f} {result['lookup_us']:>10.2f} "
+                    f"{result['rss_mib']:>8.1f} {result['private_mib']:>12.1f}"
+                )
+        self.stdout.write(self.style.SUCCESS("✅ Packed key tables are up to date"))
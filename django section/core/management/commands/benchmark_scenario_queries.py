@@ -0,0 +1,128 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import BaseProduct, City, Member, Shop
+from core.scenarios.scenario4 import filter_members
+
+# models whose Meta.indexes come from migration 0004 (scenario hot paths)
+INDEXED_MODELS = (Member, Shop, City, BaseProduct)
+EXECUTION_TIME = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN ANALYZE the scenario 3/4/5 hot queries with parameters sampled from the database. "
+        "With --compare each query is also explained with the scenario indexes dropped (rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compare", action="store_true",
+            help=(
+                "Also run every query without the 0004 indexes: they are dropped inside a transaction "
+                "that is rolled back. DROP INDEX locks the tables, so don't use this on a live database"
+            ),
+        )
+        parser.add_argument(
+            "--products", type=int, default=50,
+            help="Candidate products for the scenario 4 query (stands in for the FAISS matches)",
+        )
+        parser.add_argument("--quiet", action="store_true", help="Only print the timing summary, not the plans")
+
+    def _samples(self, products):
+        """یک member با shop/city/extra_features واقعی، تا فیلترها شبیه درخواست‌های واقعی باشند"""
+        member = (
+            Member.objects.select_related("shop__city", "base_product")
+            .exclude(shop__city=None).exclude(base_product=None)
+            .filter(base_product__extra_features__isnull=False)
+            .first()
+        )
+        if member is None:
+            raise CommandError("No member with a shop, city and product features; import the data first")
+        features = member.base_product.extra_features
+        feature_key = next(iter(features), None) if isinstance(features, dict) else None
+        name_words = [word for word in member.base_product.persian_name.split() if len(word) > 2]
+        candidates = list(dict.fromkeys(
+            Member.objects.exclude(base_product=None).values_list("base_product_id", flat=True)[:products * 10]
+        ))[:products]
+        return member, feature_key, (name_words or [member.base_product.persian_name])[0], candidates
+
+    def _queries(self, products):
+        member, feature_key, name_word, candidates = self._samples(products)
+        customer_data = {
+            "city": member.shop.city.title,
+            "score": str(member.shop.score),
+            "has_warranty": str(member.shop.has_warranty),
+            "price": str(member.price),
+        }
+        extra_features = {feature_key: "yes"} if feature_key else {}
+        filtered, _ = filter_members(Member.objects.all(), customer_data, extra_features)
+        queries = {
+            # scenario 3/5: get_member_descriptions
+            "members of a product": Member.objects.filter(base_product_id=member.base_product_id).select_related(
+                "shop", "shop__city"
+            ),
+            # scenario 4, step 1: products that pass the customer's filters
+            "scenario 4 eligible products": filtered.values_list("base_product_id", flat=True).distinct(),
+            # scenario 4, step 3: members of the FAISS matches that pass the filters
+            "scenario 4 matched members": filtered.filter(base_product__random_key__in=candidates)
+            .distinct().values_list("random_key", "base_product__random_key"),
+            "products by city (shop__city__title)": Member.objects.filter(
+                shop__city__title=customer_data["city"]
+            ).values_list("base_product_id", flat=True)[:100],
+            "product name contains": BaseProduct.objects.filter(persian_name__contains=name_word)
+            .values_list("random_key", flat=True)[:20],
+        }
+        if feature_key:
+            queries["extra_features has_key"] = BaseProduct.objects.filter(
+                extra_features__has_key=feature_key
+            ).values_list("random_key", flat=True)
+        self.stdout.write(self.style.NOTICE(
+            f"Samples: product {member.base_product_id}, filters {customer_data}, "
+            f"feature {feature_key!r}, name {name_word!r}, {len(candidates)} candidate products"
+        ))
+        return queries
+
+    def _explain(self, queries, title, quiet):
+        """برمی‌گرداند: {query: Execution Time به ms}"""
+        for queryset in queries.values():
+            # warm-up so both runs read from the same (warm) buffer cache
+            list(queryset.all())
+        timings = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain(analyze=True, buffers=True)
+            match = EXECUTION_TIME.search(plan)
+            timings[name] = float(match.group(1)) if match else None
+            if not quiet:
+                self.stdout.write(self.style.NOTICE(f"\n=== {name} ({title}) ==="))
+                self.stdout.write(plan)
+        return timings
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("EXPLAIN ANALYZE output is only parsed for PostgreSQL")
+        queries = self._queries(options["products"])
+        results = {"with indexes": self._explain(queries, "with indexes", options["quiet"])}
+
+        if options["compare"]:
+            index_names = [index.name for model in INDEXED_MODELS for index in model._meta.indexes]
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in index_names:
+                        cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+                results["without indexes"] = self._explain(queries, "without indexes", options["quiet"])
+                transaction.set_rollback(True)
+
+        columns = list(results)
+        self.stdout.write(self.style.NOTICE(
+            f"\n{'query':<40}" + "".join(f"{column + ' (ms)':>24}" for column in columns)
+        ))
+        for name in queries:
+            row = "".join(
+                f"{results[column][name]:>24.2f}" if results[column][name] is not None else f"{'-':>24}"
+                for column in columns
+            )
+            self.stdout.write(f"{name:<40}{row}")
+        self.stdout.write(self.style.SUCCESS("✅ Done"))
@@ -0,0 +1,58 @@
+import time
+
+import faiss
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+
+from core import faiss_index
+from core.ann import INDEX_TYPES, ann_index_path, build_ann_index
+
+
+class Command(BaseCommand):
+    help = "Build an IVF-Flat, IVF-PQ or HNSW variant of a flat FAISS index (e.g. products.ivf_flat.index)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", choices=sorted(faiss_index.INDEX_PATHS), default="products")
+        parser.add_argument("--type", choices=INDEX_TYPES, required=True)
+        parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4·sqrt(n))")
+        parser.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (default dim/16)")
+        parser.add_argument("--hnsw-m", type=int, default=32)
+        parser.add_argument("--ef-construction", type=int, default=200)
+        parser.add_argument("--train-size", type=int, default=200000)
+        parser.add_argument("--output", default=None, help="Default: <index>.<type>.index next to the flat index")
+
+    def handle(self, *args, **options):
+        source_path = faiss_index.INDEX_PATHS[options["index"]]
+        try:
+            source = faiss.read_index(source_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError as e:
+            raise CommandError(f"Cannot read {source_path}: {e}")
+        default_meta = (
+            faiss_index.LEGACY_IMAGE_EMBEDDING if options["index"] == "images" else faiss_index.LEGACY_TEXT_EMBEDDING
+        )
+        source_meta = faiss_index.read_index_meta(source_path, source, default_meta)
+        output = options["output"] or ann_index_path(source_path, options["type"])
+
+        self.stdout.write(self.style.NOTICE(
+            f"Building {options['type']} from {source_path} ({source.ntotal} vectors, dim={source.d})"
+        ))
+        start = time.perf_counter()
+        with tqdm(total=source.ntotal, desc="Vectors", unit="vec") as bar:
+            index, params = build_ann_index(
+                source,
+                options["type"],
+                nlist=options["nlist"],
+                pq_m=options["pq_m"],
+                hnsw_m=options["hnsw_m"],
+                ef_construction=options["ef_construction"],
+                train_size=options["train_size"],
+                progress=bar.update,
+            )
+        elapsed = time.perf_counter() - start
+
+        meta = {k: v for k, v in source_meta.items() if k not in ("dim", "metric", "count")}
+        faiss_index.write_index(index, output, **meta, **params)
+        self.stdout.write(f"{params} in {elapsed:.1f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {output} written; set FAISS_ANN_INDEX_TYPE={options['type']} to serve it"
+        ))
@@ -0,0 +1,213 @@
+import os
+import resource
+import time
+
+import faiss
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+
+from core import faiss_index
+from core.key_table import key_table_path, write_key_table
+
+
+def list_vectors(array):
+    """ستون Arrow از نوع list<float> → آرایه‌ی (rows, dim) float32 بدون عبور از لیست‌های پایتون"""
+    lengths = pc.list_value_length(array).to_numpy(zero_copy_only=False)
+    if len(lengths) and (lengths != lengths[0]).any():
+        raise ValueError(f"vectors of different lengths ({lengths.min()}..{lengths.max()})")
+    values = pc.list_flatten(array).to_numpy(zero_copy_only=False)
+    return np.ascontiguousarray(values, dtype=np.float32).reshape(len(array), -1)
+
+
+def is_nested_list(array):
+    """list<list<float>>: چند بردار (مثلاً چند تصویر) برای هر ردیف"""
+    return pa.types.is_list(array.type.value_type) or pa.types.is_large_list(array.type.value_type)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build products/extra_features/categories/images FAISS indexes and their key maps "
+        "from base_products_embeddings.parquet, streaming one row group at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--parquet", default="base_products_embeddings.parquet")
+        parser.add_argument("--output-dir", default=faiss_index.DATA_DIR)
+        parser.add_argument("--key-column", default="random_key")
+        parser.add_argument("--product-column", default="embedding")
+        parser.add_argument("--extra-features-column", default="extra_features_embedding")
+        parser.add_argument("--image-column", default="image_embedding")
+        parser.add_argument("--category-id-column", default="category_id")
+        parser.add_argument(
+            "--category-column", default=None,
+            help="Category embedding column; without it each category is the centroid of its products",
+        )
+        parser.add_argument("--embedding-provider", default=faiss_index.LEGACY_TEXT_EMBEDDING["embedding_provider"])
+        parser.add_argument("--embedding-model", default=faiss_index.LEGACY_TEXT_EMBEDDING["embedding_model"])
+
+    # -------------------- Helpers --------------------
+    @staticmethod
+    def _peak_rss_mib():
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    @staticmethod
+    def _add(indexes, name, vectors):
+        index = indexes.get(name)
+        if index is None:
+            index = indexes[name] = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+
+    def _columns(self, schema, options):
+        available = set(schema.names)
+        if options["key_column"] not in available:
+            raise CommandError(f"Key column {options['key_column']!r} not in {options['parquet']}")
+        if options["product_column"] not in available:
+            raise CommandError(f"Product embedding column {options['product_column']!r} not in {options['parquet']}")
+        columns = {"key": options["key_column"], "product": options["product_column"]}
+        for name, option in (
+            ("extra_features", "extra_features_column"),
+            ("image", "image_column"),
+            ("category_id", "category_id_column"),
+            ("category", "category_column"),
+        ):
+            if options[option] and options[option] in available:
+                columns[name] = options[option]
+            elif options[option]:
+                self.stdout.write(self.style.WARNING(f"⚠️ Column {options[option]!r} not found → skipping {name}"))
+        return columns
+
+    # -------------------- Row group --------------------
+    def _process(self, table, columns, indexes, state):
+        product = table.column(columns["product"]).combine_chunks()
+        valid = product.is_valid()
+        table = table.filter(valid)
+        product = list_vectors(table.column(columns["product"]).combine_chunks())
+        keys = table.column(columns["key"]).to_pylist()
+
+        self._add(indexes, "products", product)
+        state["product_keys"].extend(keys)
+
+        if "extra_features" in columns:
+            # extra_features.index shares id_to_key with products.index, so rows must stay aligned:
+            # products without an extra-features vector fall back to their name vector
+            extra = table.column(columns["extra_features"]).combine_chunks()
+            extra_valid = extra.is_valid().to_numpy(zero_copy_only=False)
+            extra_vectors = product.copy()
+            if extra_valid.any():
+                extra_vectors[extra_valid] = list_vectors(extra.filter(extra.is_valid()))
+            self._add(indexes, "extra_features", extra_vectors)
+
+        if "category_id" in columns:
+            category_ids = table.column(columns["category_id"]).to_numpy(zero_copy_only=False)
+            if "category" in columns:
+                category = table.column(columns["category"]).combine_chunks()
+                for i, category_id in enumerate(category_ids):
+                    if category_id and category_id not in state["category_vectors"] and category[i].is_valid:
+                        state["category_vectors"][category_id] = np.asarray(category[i].as_py(), dtype=np.float32)
+            else:
+                for category_id in np.unique(category_ids):
+                    if not category_id:
+                        continue
+                    rows = category_ids == category_id
+                    total, count = state["category_sums"].get(category_id, (0.0, 0))
+                    state["category_sums"][category_id] = (total + product[rows].sum(axis=0), count + int(rows.sum()))
+
+        image_count = 0
+        if "image" in columns:
+            images = table.column(columns["image"]).combine_chunks()
+            if is_nested_list(images):
+                parents = pc.list_parent_indices(images).to_numpy(zero_copy_only=False)
+                images = pc.list_flatten(images)
+            else:
+                parents = np.arange(len(images))
+            image_valid = images.is_valid()
+            parents = parents[image_valid.to_numpy(zero_copy_only=False)]
+            image_count = len(parents)
+            if image_count:
+                self._add(indexes, "images", list_vectors(images.filter(image_valid)))
+                state["image_keys"].extend(keys[i] for i in parents)
+
+        return len(product) * (2 if "extra_features" in columns else 1) + image_count
+
+    def _categories(self, state):
+        # category ids are ints in categories_id_to_key, as in the original pickle
+        if state["category_vectors"]:
+            items = sorted(state["category_vectors"].items())
+            return [int(k) for k, _ in items], np.vstack([v for _, v in items])
+        if not state["category_sums"]:
+            return [], None
+        items = sorted(state["category_sums"].items())
+        vectors = np.vstack([total / count for _, (total, count) in items]).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        return [int(k) for k, _ in items], vectors
+
+    # -------------------- Main --------------------
+    def handle(self, *args, **options):
+        try:
+            pf = pq.ParquetFile(options["parquet"])
+        except (OSError, pa.ArrowInvalid) as e:
+            raise CommandError(f"Cannot open {options['parquet']}: {e}")
+        columns = self._columns(pf.schema_arrow, options)
+        output_dir = options["output_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+
+        indexes = {}
+        state = {
+            "product_keys": [], "image_keys": [],
+            "category_sums": {}, "category_vectors": {},
+        }
+        vectors = 0
+        start = time.perf_counter()
+        with tqdm(total=pf.num_row_groups, desc="Row groups") as bar:
+            for row_group in range(pf.num_row_groups):
+                table = pf.read_row_group(row_group, columns=list(columns.values()))
+                vectors += self._process(table, columns, indexes, state)
+                del table
+                bar.update(1)
+                bar.set_postfix(vectors=vectors, rss_mib=f"{self._peak_rss_mib():.0f}")
+
+        category_keys, category_vectors = self._categories(state)
+        if category_vectors is not None:
+            self._add(indexes, "categories", category_vectors)
+            vectors += len(category_keys)
+        elapsed = time.perf_counter() - start
+
+        if "products" not in indexes:
+            raise CommandError("No product vectors found")
+
+        # -------------------- Write --------------------
+        text_meta = {"embedding_provider": options["embedding_provider"], "embedding_model": options["embedding_model"]}
+        outputs = [
+            ("products", faiss_index.products_index_path, text_meta),
+            ("extra_features", faiss_index.extra_features_index_path, text_meta),
+            ("categories", faiss_index.categories_index_path, text_meta),
+            ("images", faiss_index.images_index_path, faiss_index.LEGACY_IMAGE_EMBEDDING),
+        ]
+        # key maps first: a reader that sees a new index must also see its keys
+        out = lambda path: os.path.join(output_dir, os.path.basename(path))
+        faiss_index.write_pickle(state["product_keys"], out(faiss_index.id_to_key_path))
+        write_key_table(state["product_keys"], key_table_path(out(faiss_index.id_to_key_path)))
+        if "categories" in indexes:
+            faiss_index.write_pickle(category_keys, out(faiss_index.categories_id_to_key_path))
+            write_key_table(category_keys, key_table_path(out(faiss_index.categories_id_to_key_path)))
+        if "images" in indexes:
+            # JSON despite the .pkl name (see faiss_index._read_images_keys)
+            faiss_index.write_json(
+                {str(i): key for i, key in enumerate(state["image_keys"])}, out(faiss_index.images_id_to_key_path)
+            )
+            write_key_table(state["image_keys"], key_table_path(out(faiss_index.images_id_to_key_path)))
+        for name, path, meta in outputs:
+            if name in indexes:
+                faiss_index.write_index(indexes[name], out(path), **meta)
+                self.stdout.write(f"  {out(path)}: {indexes[name].ntotal} vectors, dim={indexes[name].d}")
+
+        self.stdout.write(
+            f"{vectors} vectors in {elapsed:.1f}s ({vectors / elapsed:.0f} vectors/s), "
+            f"peak RSS {self._peak_rss_mib():.0f} MiB"
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ FAISS indexes written to {output_dir}"))
@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.intent_classifier import SCENARIOS, IntentClassifier, load_decisions, build_dataset
+
+
+class Command(BaseCommand):
+    help = "Report agreement of the local scenario classifier with logged LLM decisions and the latency it saves"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", default=settings.INTENT_DECISIONS_LOG, help="JSONL log of LLM decisions")
+        parser.add_argument("--model", default=settings.INTENT_CLASSIFIER_PATH, help="Saved model to evaluate")
+        parser.add_argument("--threshold", type=float, default=settings.INTENT_CLASSIFIER_THRESHOLD)
+        parser.add_argument(
+            "--holdout", type=float, default=0.0,
+            help="Train a fresh model on (1 - holdout) of the log and evaluate on the rest instead of using --model",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        records = load_decisions(options["log"])
+        if not records:
+            raise CommandError(f"No usable decisions in {options['log']}")
+
+        embeddings, rules, labels = build_dataset(records)
+        message_types = np.array([r["message_type"] for r in records], dtype=object)
+        llm_latency = np.array([r.get("latency_ms", 0.0) for r in records])
+
+        if options["holdout"] > 0:
+            order = np.random.default_rng(options["seed"]).permutation(len(records))
+            split = int(len(order) * (1 - options["holdout"]))
+            train, test = order[:split], order[split:]
+            if len(test) == 0:
+                raise CommandError("Holdout split is empty")
+            classifier = IntentClassifier().fit(embeddings[train], rules[train], labels[train])
+            self.stdout.write(f"Trained on {len(train)} decisions, evaluating on {len(test)}")
+        else:
+            classifier = IntentClassifier.load(options["model"])
+            test = np.arange(len(records))
+
+        start = time.perf_counter()
+        P = classifier.predict_proba(embeddings[test], rules[test], list(message_types[test]))
+        classify_ms = (time.perf_counter() - start) * 1000 / len(test)
+
+        predicted = P.argmax(axis=1) + 1
+        confidence = P.max(axis=1)
+        expected = labels[test]
+        confident = confidence >= options["threshold"]
+        agree = predicted == expected
+
+        self.stdout.write(self.style.NOTICE(f"Threshold: {options['threshold']}"))
+        self.stdout.write(f"Overall agreement with LLM:      {agree.mean():.2%}")
+        self.stdout.write(f"Answered locally (coverage):     {confident.mean():.2%}")
+        if confident.any():
+            self.stdout.write(f"Agreement when answered locally: {agree[confident].mean():.2%}")
+
+        mean_llm = llm_latency[test].mean()
+        saved = llm_latency[test][confident].sum() / len(test)
+        self.stdout.write(f"Mean LLM detection latency:      {mean_llm:.0f} ms")
+        self.stdout.write(f"Classifier latency (excl. embedding): {classify_ms:.3f} ms")
+        self.stdout.write(f"Estimated latency saved/request: {saved:.0f} ms")
+
+        self.stdout.write("Per scenario (LLM label → count, agreement, coverage):")
+        for scenario in SCENARIOS:
+            rows = expected == scenario
+            if rows.any():
+                self.stdout.write(
+                    f"  {scenario}: n={rows.sum():5d}  agree={agree[rows].mean():.2%}  local={confident[rows].mean():.2%}"
+                )
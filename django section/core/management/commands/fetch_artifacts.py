@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import faiss_index
+from core.artifact_fetcher import ArtifactError, fetch_all, load_manifest, parse_sources, record_manifest, with_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the FAISS indexes and key maps in parallel (resuming partial files, "
+        "verifying against ARTIFACT_MANIFEST), or record a manifest from the current files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sources", default=None, help="Default: ARTIFACT_SOURCES")
+        parser.add_argument("--manifest", default=None, help="Default: ARTIFACT_MANIFEST")
+        parser.add_argument("--workers", type=int, default=None, help="Default: ARTIFACT_FETCH_WORKERS")
+        parser.add_argument(
+            "--record", metavar="PATH", default=None,
+            help="Write sizes and SHA-256s of the current (trusted) files to PATH instead of fetching",
+        )
+
+    def handle(self, *args, **options):
+        artifacts = faiss_index.artifacts()
+        if options["record"]:
+            manifest = record_manifest(artifacts, options["record"])
+            for name, entry in manifest.items():
+                self.stdout.write(f"  {name}: {entry['size']} bytes, sha256 {entry['sha256']}")
+            self.stdout.write(self.style.SUCCESS(f"✅ Manifest written to {options['record']}"))
+            return
+
+        manifest = load_manifest(options["manifest"] if options["manifest"] is not None else settings.ARTIFACT_MANIFEST)
+        try:
+            sources = parse_sources(options["sources"] or settings.ARTIFACT_SOURCES)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.NOTICE(f"Sources: {', '.join(source.name for source in sources)}"))
+
+        start = time.perf_counter()
+        try:
+            results = fetch_all(
+                with_manifest(artifacts, manifest), sources,
+                workers=options["workers"] or settings.ARTIFACT_FETCH_WORKERS,
+            )
+        except ArtifactError as e:
+            raise CommandError(str(e))
+        for name, (source, seconds) in results.items():
+            self.stdout.write(f"  {name}: {f'{source} in {seconds:.1f}s' if source else 'up to date'}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Artifacts ready in {time.perf_counter() - start:.1f}s"))
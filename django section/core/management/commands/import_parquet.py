@@ -1,256 +1,774 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from datetime import datetime, timezone
-import pandas as pd
-import numpy as np
-import pyarrow.parquet as pq
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from datetime import timezone
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+import hashlib
 import json
+import multiprocessing
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 
+from core import pg_copy
 from core.models import (
     Search, BaseView, FinalClick, BaseProduct,
-    Member, Shop, Category, Brand, City
+    Member, Shop, Category, Brand, City, ImportCheckpoint
 )
 
+# small lookup tables: every primary key is loaded once; larger targets are checked per chunk
+PRELOADED_FK_MODELS = (City, Brand, Category, Shop)
+
+# columns: table column → parquet column
+# foreign_keys: table column → (referenced model, parquet column, "no reference" value, label)
+# depends: tables that must be fully imported first (the FK targets)
+# delta: supports --mode delta (the model has a content_hash field)
+TABLES = {
+    "categories": {
+        "label": "Categories", "model": Category, "file": "categories.parquet", "build": "_categories",
+        "columns": {"id": "id", "title": "title", "parent_id": "parent_id"},
+        "foreign_keys": {},
+        "depends": (),
+    },
+    "brands": {
+        "label": "Brands", "model": Brand, "file": "brands.parquet", "build": "_brands",
+        "columns": {"id": "id", "title": "title"},
+        "foreign_keys": {},
+        "depends": (),
+    },
+    "cities": {
+        "label": "Cities", "model": City, "file": "cities.parquet", "build": "_cities",
+        "columns": {"id": "id", "title": "name"},
+        "foreign_keys": {},
+        "depends": (),
+    },
+    "shops": {
+        "label": "Shops", "model": Shop, "file": "shops.parquet", "build": "_shops",
+        "columns": {"id": "id", "score": "score", "has_warranty": "has_warranty"},
+        "foreign_keys": {"city_id": (City, "city_id", None, "city")},
+        "depends": ("cities",),
+        "delta": True,
+    },
+    "baseproducts": {
+        # the embedding columns are skipped: only build_faiss_indexes needs them
+        "label": "BaseProducts", "model": BaseProduct, "file": "base_products_embeddings.parquet", "build": "_baseproducts",
+        "columns": {
+            "random_key": "random_key", "persian_name": "persian_name", "english_name": "english_name",
+            "extra_features": "extra_features", "image_url": "image_url",
+        },
+        "foreign_keys": {
+            "category_id": (Category, "category_id", 0, "category"),
+            "brand_id": (Brand, "brand_id", -1, "brand"),
+        },
+        "depends": ("categories", "brands"),
+        "delta": True,
+    },
+    "members": {
+        "label": "Members", "model": Member, "file": "members.parquet", "build": "_members",
+        "columns": {"random_key": "random_key", "price": "price"},
+        "foreign_keys": {
+            "base_product_id": (BaseProduct, "base_random_key", None, "base product"),
+            "shop_id": (Shop, "shop_id", None, "shop"),
+        },
+        "depends": ("baseproducts", "shops"),
+        "delta": True,
+    },
+    "searches": {
+        "label": "Searches", "model": Search, "file": "searches.parquet", "build": "_searches",
+        "columns": {
+            "id": "id", "uid": "uid", "query": "query", "page": "page", "timestamp": "timestamp",
+            "session_id": "session_id", "result_base_product_rks": "result_base_product_rks",
+            "category_brand_boosts": "category_brand_boosts",
+        },
+        "foreign_keys": {"category_id": (Category, "category_id", 0, "category")},
+        "depends": ("categories",),
+    },
+    "baseviews": {
+        "label": "BaseViews", "model": BaseView, "file": "base_views.parquet", "build": "_baseviews",
+        "columns": {"id": "id", "base_product_rk": "base_product_rk", "timestamp": "timestamp"},
+        "foreign_keys": {"search_id": (Search, "search_id", None, "search")},
+        "depends": ("searches",),
+    },
+    "finalclicks": {
+        "label": "FinalClicks", "model": FinalClick, "file": "final_clicks.parquet", "build": "_finalclicks",
+        "columns": {"id": "id", "timestamp": "timestamp"},
+        "foreign_keys": {
+            "base_view_id": (BaseView, "base_view_id", None, "base view"),
+            "shop_id": (Shop, "shop_id", 0, "shop"),
+        },
+        "depends": ("baseviews", "shops"),
+    },
+}
+
+DEFAULT_CHUNKSIZE = {"orm": 1000, "copy": 65536, "delta": 1000}
+
+
+class Checkpoints:
+    """
+    پیشرفت commit شده‌ی یک جدول به تفکیک row group (ImportCheckpoint). هر chunk همراه
+    با checkpoint خودش در یک تراکنش commit می‌شود، پس بعد از crash با --resume فقط
+    chunk نیمه‌کاره دوباره خوانده می‌شود. بدون resume (یا اگر فایل parquet عوض شده
+    باشد) از اول شروع می‌شود.
+    """
+
+    def __init__(self, name, path, pf, row_groups, resume):
+        stat = os.stat(path)
+        self.name = name
+        self.source = f"{stat.st_size}:{stat.st_mtime_ns}"
+        self.pf = pf
+        self.row_groups = list(row_groups)
+        self.skipped = 0
+        existing = ImportCheckpoint.objects.filter(table=name, row_group__in=self.row_groups)
+        if resume:
+            self.committed = {
+                row_group: (rows, done)
+                for row_group, rows, done in existing.filter(source=self.source).values_list("row_group", "rows", "done")
+            }
+        else:
+            existing.delete()
+            self.committed = {}
+
+    def _num_rows(self, row_group):
+        return self.pf.metadata.row_group(row_group).num_rows
+
+    def pending(self, bar):
+        """(row group، تعداد ردیف‌های commit شده‌ی قبلی) برای row groupهای تمام‌نشده"""
+        for row_group in self.row_groups:
+            rows, done = self.committed.get(row_group, (0, False))
+            if done:
+                rows = self._num_rows(row_group)
+            if rows:
+                self.skipped += rows
+                bar.update(rows)
+            if not done:
+                yield row_group, rows
+
+    def batches(self, row_group, offset, columns, chunksize):
+        return self.pf.read_row_group(row_group, columns=columns).slice(offset).to_batches(max_chunksize=chunksize)
+
+    def commit(self, row_group, rows):
+        """داخل تراکنش همان chunk صدا زده می‌شود؛ rows: ردیف‌های commit شده از ابتدای row group"""
+        ImportCheckpoint.objects.update_or_create(
+            table=self.name, row_group=row_group,
+            defaults={"source": self.source, "rows": rows, "done": rows >= self._num_rows(row_group)},
+        )
+
+# -------------------- Worker processes --------------------
+# each worker is a separate (spawned) process with its own Command and its own DB connection.
+# the pool initializer is django.setup itself: this module imports core.models, so it can only
+# be unpickled (with the first task) once the app registry is ready
+_worker = None
+
+
+def _import_partition(options, name, limit, row_groups, part):
+    global _worker
+    if _worker is None:
+        _worker = Command()
+        _worker.configure(**options)
+    return _worker._import(name, limit=limit, row_groups=row_groups, part=part)
+
 
 class Command(BaseCommand):
-    help = "Import all parquet data into Postgres via Django ORM efficiently with progress bar"
+    help = (
+        "Import the parquet data into Postgres, table by table in FK dependency order; "
+        "independent tables and row-group partitions of big tables run in parallel worker processes"
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pk_cache = {}
+        self.configure()
+
+    def configure(self, mode="orm", drop_indexes=False, drop_foreign_keys=False, chunksize=None, data_dir=".",
+                  delete_missing=False, changes_dir=None, resume=False):
+        self.mode = mode
+        self.resume = resume
+        self.delete_missing = delete_missing
+        self.changes_dir = changes_dir
+        self.drop_indexes = drop_indexes
+        self.drop_foreign_keys = drop_foreign_keys
+        self.chunksize = chunksize or DEFAULT_CHUNKSIZE[mode]
+        self.data_dir = data_dir
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tables", default=",".join(TABLES),
+            help=f"Comma-separated subset of: {', '.join(TABLES)}. Tables that are not selected are assumed to be loaded",
+        )
+        parser.add_argument("--limit", type=int, default=None, help="Import at most this many rows per table")
+        parser.add_argument(
+            "--chunksize", type=int, default=None,
+            help=f"Rows per bulk_create / CSV batch (default: {DEFAULT_CHUNKSIZE['orm']} for orm, {DEFAULT_CHUNKSIZE['copy']} for copy)",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Worker processes; big tables are split into this many row-group partitions",
+        )
+        parser.add_argument("--data-dir", default=".", help="Directory containing the parquet files")
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Skip the chunks that a previous (interrupted) run already committed",
+        )
+        parser.add_argument(
+            "--mode", choices=("orm", "copy", "delta"), default="orm",
+            help=(
+                "orm: bulk_create; copy: COPY into an unlogged staging table, then INSERT ... ON CONFLICT DO NOTHING; "
+                "delta: insert new and update changed rows (by content hash) of shops, baseproducts and members"
+            ),
+        )
+        parser.add_argument(
+            "--delete-missing", action="store_true",
+            help="delta mode: also delete rows that are no longer in the parquet file",
+        )
+        parser.add_argument(
+            "--changes-dir", default=None,
+            help="delta mode: write <table>.changes.json (inserted/updated/deleted keys) here for cache invalidation",
+        )
+        parser.add_argument(
+            "--drop-indexes", action="store_true",
+            help="copy mode: drop secondary indexes during the load and rebuild them afterwards",
+        )
+        parser.add_argument(
+            "--drop-foreign-keys", action="store_true",
+            help="copy mode, with --drop-indexes: also drop and re-add the table's FK constraints",
+        )
 
     # -------------------- Helpers --------------------
     @staticmethod
-    def _to_timestamp(ts):
-        if isinstance(ts, pd.Timestamp):
-            return ts.to_pydatetime().replace(tzinfo=timezone.utc)
-        return datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+    def _to_timestamps(array):
+        """ستون Arrow (timestamp یا میلی‌ثانیه‌ی epoch) → datetimeهای UTC"""
+        if pa.types.is_integer(array.type):
+            array = array.cast(pa.timestamp("ms"))
+        return [
+            None if ts is None else ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+            for ts in array.to_pylist()
+        ]
 
     @staticmethod
-    def _safe_get(model, **kwargs):
-        try:
-            return model.objects.get(**kwargs)
-        except model.DoesNotExist:
-            return None
+    def _column(batch, name):
+        """ستون به صورت لیست پایتون؛ ستون‌های اختیاری ناموجود → None"""
+        index = batch.schema.get_field_index(name)
+        return batch.column(index).to_pylist() if index >= 0 else [None] * batch.num_rows
+
+    def _existing(self, model, values):
+        """زیرمجموعه‌ی values که در model کلید اصلی موجود است"""
+        if model in PRELOADED_FK_MODELS:
+            if model not in self._pk_cache:
+                self._pk_cache[model] = set(model.objects.values_list("pk", flat=True).iterator(chunk_size=10000))
+            return values & self._pk_cache[model]
+        if not values:
+            return set()
+        return set(model.objects.filter(pk__in=values).values_list("pk", flat=True))
+
+    def _resolve(self, model, values, missing, name, null_values=()):
+        """
+        مقادیر FK یک chunk → مقدار *_id یا None، با حداکثر یک کوئری برای کل chunk.
+        null_values (مثل 0 یا -1 در داده‌ها) یعنی «بدون مرجع»؛ مرجع‌های ناموجود
+        هم None می‌شوند و در missing[name] شمرده می‌شوند.
+        """
+        to_python = model._meta.pk.to_python
+        values = [None if v is None or v in null_values else to_python(v) for v in values]
+        existing = self._existing(model, {v for v in values if v is not None})
+        resolved = []
+        for v in values:
+            if v is not None and v not in existing:
+                missing[name] += 1
+                v = None
+            resolved.append(v)
+        return resolved
+
+    def _orm_load(self, spec, pf, columns, checkpoints, limit, bar, missing):
+        """هر chunk Arrow با builder جدول به اشیای مدل تبدیل و با bulk_create درج می‌شود"""
+        build = getattr(self, spec["build"])
+        rows = 0
+        for row_group, offset in checkpoints.pending(bar):
+            for batch in checkpoints.batches(row_group, offset, columns, self.chunksize):
+                if limit:
+                    batch = batch.slice(0, limit - rows)
+                objs = build(batch, missing)
+                offset += batch.num_rows
+                with transaction.atomic():
+                    if objs:
+                        spec["model"].objects.bulk_create(objs, ignore_conflicts=True, batch_size=self.chunksize)
+                    checkpoints.commit(row_group, offset)
+                rows += batch.num_rows
+                bar.update(batch.num_rows)
+                if limit and rows >= limit:
+                    return rows
+        return rows
+
+    def _copy_load(self, spec, pf, columns, checkpoints, limit, bar, missing):
+        """
+        هر row group با یک COPY در staging و یک INSERT ... SELECT در جدول اصلی،
+        در تراکنش خودش (هر row group یک chunk است). FKها در همان INSERT با LEFT JOIN روی جدول مرجع resolve می‌شوند.
+        """
+        table = spec["model"]._meta.db_table
+        staging = f"{table}_staging_{os.getpid()}"
+        with connection.cursor() as cursor:
+            target_types = pg_copy.column_types(cursor, table)
+            copy_columns = {target: source for target, source in spec["columns"].items() if source in columns}
+            prepare_types = {source: target_types[target] for target, source in copy_columns.items()}
+            foreign_keys = {}
+            for target, (model, source, null_value, label) in spec["foreign_keys"].items():
+                ref_table, ref_pk = model._meta.db_table, model._meta.pk.column
+                ref_type = pg_copy.column_types(cursor, ref_table)[ref_pk]
+                foreign_keys[target] = (ref_table, ref_pk, ref_type, source, null_value, label)
+                prepare_types[source] = ""
+
+            def prepared(row_group, offset, remaining):
+                for batch in checkpoints.batches(row_group, offset, columns, self.chunksize):
+                    if remaining is not None:
+                        batch = batch.slice(0, remaining)
+                        remaining -= batch.num_rows
+                    batch, invalid = pg_copy.prepare_batch(batch, prepare_types)
+                    if invalid:
+                        missing["valid JSON value"] += invalid
+                    yield batch
+                    if remaining == 0:
+                        return
+
+            rows = inserted = 0
+            created = False
+            try:
+                for row_group, offset in checkpoints.pending(bar):
+                    with transaction.atomic():
+                        copied = pg_copy.copy_batches(
+                            cursor, staging, prepared(row_group, offset, limit - rows if limit else None),
+                            create=not created,
+                        )
+                        added, row_missing = 0, {}
+                        if copied:
+                            created = True
+                            added, row_missing = pg_copy.merge(
+                                cursor, staging, table, target_types, copy_columns, foreign_keys
+                            )
+                            # the next row group must only merge its own rows
+                            pg_copy.truncate_staging(cursor, staging)
+                        checkpoints.commit(row_group, offset + copied)
+                    missing.update(row_missing)
+                    rows += copied
+                    inserted += added
+                    bar.update(copied)
+                    if limit and rows >= limit:
+                        break
+            finally:
+                cursor.execute(f"DROP TABLE IF EXISTS {pg_copy.quote(staging)}")
+        self.stdout.write(f"  {inserted} new rows ({rows - inserted} already present)")
+        return rows
 
     @staticmethod
-    def _load_parquet_chunks(path, chunksize=1000):
-        pf = pq.ParquetFile(path)
-        for row_group in range(pf.num_row_groups):
-            for batch in pf.read_row_group(row_group).to_batches(max_chunksize=chunksize):
-                yield batch.to_pandas()
-
-    # -------------------- Importers --------------------
-    def import_categories(self):
-        self.stdout.write(self.style.NOTICE("Starting import of Categories..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("categories.parquet"), desc="Categories"):
-                objs = [
-                    Category(id=row.id, title=row.title, parent_id=row.parent_id)
-                    for row in chunk.itertuples(index=False)
-                ]
-                Category.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Categories imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Categories: {str(e)}"))
-            raise
+    def _row_hashes(batch, columns, resolved=()):
+        """
+        هش ۶۴ بیتی (signed، برای BigIntegerField) از مقادیر خام هر ردیف parquet و FKهای
+        resolve شده‌ی آن؛ ردیفی که مرجعش بعداً اضافه شود هش جدید می‌گیرد و به‌روز می‌شود
+        """
+        values = [Command._column(batch, column) for column in columns] + list(resolved)
+        return [
+            int.from_bytes(
+                hashlib.blake2b(json.dumps(row, default=str, ensure_ascii=False).encode(), digest_size=8).digest(),
+                "little", signed=True,
+            )
+            for row in zip(*values)
+        ]
 
-    def import_brands(self):
-        self.stdout.write(self.style.NOTICE("Starting import of Brands..."))
+    def _delta_load(self, spec, pf, columns, checkpoints, limit, bar, missing):
+        """
+        فقط ردیف‌های جدید یا تغییرکرده (هش متفاوت با content_hash ذخیره‌شده) ساخته و با
+        bulk_create(update_conflicts=True) نوشته می‌شوند؛ با --delete-missing ردیف‌هایی که
+        دیگر در فایل نیستند حذف می‌شوند. کلیدهای تغییرکرده در خلاصه‌ی تغییرات می‌آیند.
+        """
+        model = spec["model"]
+        changes = {"inserted": [], "updated": [], "deleted": [], "cascaded": {}}
+        seen = key_type = None
+        if self.delete_missing:
+            seen = f"{model._meta.db_table}_seen_{os.getpid()}"
+            key_type = self._create_seen_table(model, seen)
+        rows = 0
         try:
-            for chunk in tqdm(self._load_parquet_chunks("brands.parquet"), desc="Brands"):
-                objs = [Brand(id=row.id, title=row.title) for row in chunk.itertuples(index=False)]
-                Brand.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Brands imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Brands: {str(e)}"))
-            raise
+            rows = self._delta_chunks(spec, columns, checkpoints, limit, bar, missing, changes, seen, key_type)
+            if seen:
+                if limit or checkpoints.skipped:
+                    self.stdout.write(self.style.WARNING(
+                        f"⚠️ {spec['label']}: --delete-missing is ignored with --limit or when resuming"
+                    ))
+                else:
+                    self._delete_stale(model, seen, changes)
+        finally:
+            if seen:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {pg_copy.quote(seen)}")
+        self._report_changes(spec, changes, rows)
+        return rows
 
-    def import_cities(self):
-        self.stdout.write(self.style.NOTICE("Starting import of Cities..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("cities.parquet"), desc="Cities"):
-                objs = [City(id=row.id, title=row.name) for row in chunk.itertuples(index=False)]
-                City.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Cities imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Cities: {str(e)}"))
-            raise
+    def _create_seen_table(self, model, seen):
+        """جدول موقت کلیدهای دیده‌شده در فایل، برای anti-join حذف‌ها؛ نوع کلید را برمی‌گرداند"""
+        with connection.cursor() as cursor:
+            key_type = pg_copy.column_types(cursor, model._meta.db_table)[model._meta.pk.column]
+            cursor.execute(f"DROP TABLE IF EXISTS {pg_copy.quote(seen)}")
+            cursor.execute(f"CREATE TEMP TABLE {pg_copy.quote(seen)} (key {key_type} PRIMARY KEY)")
+        return key_type
 
-    def import_shops(self):
-        self.stdout.write(self.style.NOTICE("Starting import of Shops..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("shops.parquet"), desc="Shops"):
-                objs = [
-                    Shop(
-                        id=int(row.id),
-                        city=self._safe_get(City, id=row.city_id),
-                        score=float(row.score),
-                        has_warranty=bool(row.has_warranty),
+    def _delete_stale(self, model, seen, changes):
+        """
+        ردیف‌هایی که در فایل نبودند (anti-join با جدول موقت، فقط همین کلیدها به پایتون
+        می‌آیند) حذف می‌شوند؛ ردیف‌هایی که با CASCADE همراهشان حذف می‌شوند (مثلاً
+        Memberهای یک BaseProduct یا Shop) هم در خلاصه‌ی تغییرات می‌آیند.
+        """
+        pk_column = pg_copy.quote(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT t.{pk_column} FROM {pg_copy.quote(model._meta.db_table)} t "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {pg_copy.quote(seen)} s WHERE s.key = t.{pk_column})"
+            )
+            stale = [row[0] for row in cursor.fetchall()]
+        cascades = [rel for rel in model._meta.related_objects if rel.on_delete is models.CASCADE]
+        for start in range(0, len(stale), self.chunksize):
+            chunk = stale[start:start + self.chunksize]
+            with transaction.atomic():
+                for rel in cascades:
+                    keys = list(
+                        rel.related_model.objects.filter(**{f"{rel.field.name}__in": chunk}).values_list("pk", flat=True)
                     )
-                    for row in chunk.itertuples(index=False)
-                ]
-                Shop.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Shops imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Shops: {str(e)}"))
-            raise
+                    if keys:
+                        changes["cascaded"].setdefault(rel.related_model._meta.db_table, []).extend(keys)
+                model.objects.filter(pk__in=chunk).delete()
+        changes["deleted"] = stale
 
-    def import_baseproducts(self):
-        self.stdout.write(self.style.NOTICE("Starting import of BaseProducts..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("base_products_embeddings.parquet"), desc="BaseProducts"):
-                objs = []
-                for row in chunk.itertuples(index=False):
-                    # extra_features -> JSONField
-                    extra_features = None
-                    if isinstance(row.extra_features, str) and row.extra_features.strip() != "":
-                        try:
-                            extra_features = json.loads(row.extra_features)
-                        except json.JSONDecodeError:
-                            self.stdout.write(self.style.WARNING(
-                                f"⚠️ Could not parse extra_features for random_key={row.random_key}"
-                            ))
-                            extra_features = None
-
-                    objs.append(
-                        BaseProduct(
-                            random_key=row.random_key,
-                            persian_name=row.persian_name,
-                            english_name=row.english_name,
-                            category=None if row.category_id == 0 else self._safe_get(Category, id=row.category_id),
-                            brand=None if row.brand_id == -1 else self._safe_get(Brand, id=row.brand_id),
-                            extra_features=extra_features,
-                            image_url=row.image_url,
-                        )
+    def _delta_chunks(self, spec, columns, checkpoints, limit, bar, missing, changes, seen, key_type):
+        """درج/به‌روزرسانی chunk به chunk؛ کلیدهای هر chunk (با seen) در جدول موقت ثبت می‌شوند"""
+        model = spec["model"]
+        pk = model._meta.pk
+        key_column = spec["columns"][pk.attname]
+        build = getattr(self, spec["build"])
+        update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        fk_columns = {source for _, source, _, _ in spec["foreign_keys"].values()}
+        plain_columns = [column for column in columns if column not in fk_columns]
+        rows = 0
+        for row_group, offset in checkpoints.pending(bar):
+            for batch in checkpoints.batches(row_group, offset, columns, self.chunksize):
+                if limit:
+                    batch = batch.slice(0, limit - rows)
+                keys = [pk.to_python(key) for key in self._column(batch, key_column)]
+                # missing references are counted by the builder, only for the rows that are written
+                resolved = [
+                    self._resolve(
+                        ref_model, self._column(batch, source), Counter(), label,
+                        null_values=() if null_value is None else (null_value,),
                     )
-                if objs:
-                    BaseProduct.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
+                    for ref_model, source, null_value, label in spec["foreign_keys"].values()
+                ]
+                hashes = self._row_hashes(batch, plain_columns, resolved)
+                stored = dict(model.objects.filter(pk__in=keys).values_list("pk", "content_hash"))
+                # the last occurrence of a key wins: one INSERT ... ON CONFLICT DO UPDATE can't touch a row twice
+                latest = {key: i for i, key in enumerate(keys)}
+                changed = []
+                for key, i in latest.items():
+                    if key not in stored:
+                        changes["inserted"].append(key)
+                    elif stored[key] != hashes[i]:
+                        changes["updated"].append(key)
+                    else:
+                        continue
+                    changed.append(i)
+                objs = build(batch.take(changed), missing) if changed else []
+                for obj, i in zip(objs, changed):
+                    obj.content_hash = hashes[i]
+                offset += batch.num_rows
+                with transaction.atomic():
+                    if objs:
+                        model.objects.bulk_create(
+                            objs, update_conflicts=True, unique_fields=[pk.name], update_fields=update_fields,
+                            batch_size=self.chunksize,
+                        )
+                    if seen:
+                        with connection.cursor() as cursor:
+                            cursor.execute(
+                                f"INSERT INTO {pg_copy.quote(seen)} (key) SELECT unnest(%s::{key_type}[]) "
+                                f"ON CONFLICT DO NOTHING",
+                                [list(latest)],
+                            )
+                    checkpoints.commit(row_group, offset)
+                rows += batch.num_rows
+                bar.update(batch.num_rows)
+                if limit and rows >= limit:
+                    return rows
+        return rows
 
-            self.stdout.write(self.style.SUCCESS("BaseProducts imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing BaseProducts: {str(e)}"))
-            raise
+    def _report_changes(self, spec, changes, rows):
+        """
+        خلاصه‌ی تغییرات؛ با --changes-dir در <table>.changes.json هم نوشته می‌شود
+        تا cacheها و ایندکس‌ها فقط همین کلیدها را باطل کنند
+        """
+        counts = {kind: len(changes[kind]) for kind in ("inserted", "updated", "deleted")}
+        counts["cascaded"] = {table: len(keys) for table, keys in changes["cascaded"].items()}
+        unchanged = rows - counts["inserted"] - counts["updated"]
+        cascaded = "".join(f", {count} {table} rows deleted by cascade" for table, count in counts["cascaded"].items())
+        self.stdout.write(
+            f"  {spec['label']}: {counts['inserted']} inserted, {counts['updated']} updated, "
+            f"{counts['deleted']} deleted{cascaded}, {unchanged} unchanged"
+        )
+        if not self.changes_dir:
+            return
+        table = spec["model"]._meta.db_table
+        os.makedirs(self.changes_dir, exist_ok=True)
+        path = os.path.join(self.changes_dir, f"{table}.changes.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"table": table, "counts": counts, **changes}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.stdout.write(f"  change summary → {path}")
 
+    @contextmanager
+    def without_indexes(self, name):
+        """--drop-indexes در حالت copy: ایندکس‌های ثانویه‌ی جدول تا پایان بارگذاری همه‌ی partitionها حذف می‌شوند"""
+        if self.mode != "copy" or not self.drop_indexes:
+            yield
+            return
+        table = TABLES[name]["model"]._meta.db_table
+        with connection.cursor() as cursor:
+            with pg_copy.without_secondary_indexes(cursor, table, foreign_keys=self.drop_foreign_keys) as dropped:
+                if dropped:
+                    self.stdout.write(f"  {table}: dropped until the load finishes: {', '.join(dropped)}")
+                yield
 
+    def _path(self, name):
+        return os.path.join(self.data_dir, TABLES[name]["file"])
 
-    def import_members(self):
-        self.stdout.write(self.style.NOTICE("Starting import of Members..."))
+    def _import(self, name, limit=None, row_groups=None, part=None):
+        """
+        جدول name از TABLES (یا فقط row_groups آن) با روش self.mode؛ در پایان تعداد
+        ردیف، سرعت (ردیف در ثانیه) و مرجع‌های ناموجود گزارش می‌شود.
+        برمی‌گرداند: (ردیف‌ها، ثانیه)
+        """
+        spec = TABLES[name]
+        label = spec["label"] if part is None else f"{spec['label']} [{part}]"
+        self.stdout.write(self.style.NOTICE(f"Starting import of {label} ({self.mode})..."))
         try:
-            for chunk in tqdm(self._load_parquet_chunks("members.parquet"), desc="Members"):
-                objs = [
-                    Member(
-                        random_key=row.random_key,
-                        base_product=self._safe_get(BaseProduct, random_key=row.base_random_key),
-                        shop=self._safe_get(Shop, id=row.shop_id),
-                        price=row.price,
-                    )
-                    for row in chunk.itertuples(index=False)
-                ]
-                Member.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Members imported successfully!"))
+            path = self._path(name)
+            pf = pq.ParquetFile(path)
+            if row_groups is None:
+                row_groups = range(pf.num_row_groups)
+            checkpoints = Checkpoints(name, path, pf, row_groups, self.resume)
+            wanted = [*spec["columns"].values(), *(source for _, source, _, _ in spec["foreign_keys"].values())]
+            # optional columns (e.g. category_brand_boosts) may be absent from older exports
+            columns = [column for column in wanted if column in pf.schema_arrow.names]
+            total = sum(pf.metadata.row_group(row_group).num_rows for row_group in row_groups)
+            if limit:
+                total = min(total, limit)
+            missing = Counter()
+            load = {"copy": self._copy_load, "delta": self._delta_load}.get(self.mode, self._orm_load)
+            if self.mode == "delta" and not spec.get("delta"):
+                # reference and click-log tables have no content hash: plain insert of new rows
+                load = self._orm_load
+            start = time.perf_counter()
+            with tqdm(total=total, desc=label, unit="rows") as bar:
+                rows = load(spec, pf, columns, checkpoints, limit, bar, missing)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"{label} imported successfully! {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)"
+            ))
+            if checkpoints.skipped:
+                self.stdout.write(f"  resumed: {checkpoints.skipped} rows were already committed")
+            for reference, count in missing.items():
+                self.stdout.write(self.style.WARNING(f"⚠️ {label}: {count} rows without a {reference} → NULL"))
+            return rows, elapsed
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Members: {str(e)}"))
+            self.stdout.write(self.style.ERROR(f"Error importing {label}: {str(e)}"))
             raise
 
-    def import_searches(self, limit=None):
-        self.stdout.write(self.style.NOTICE("Starting import of Searches..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("searches.parquet"), desc="Searches"):
-                objs = []
-                for idx, row in enumerate(chunk.itertuples(index=False)):
-                    category = None if row.category_id == 0 else self._safe_get(Category, id=row.category_id)
-
-                    result_rks = row.result_base_product_rks
-                    if isinstance(result_rks, (pd.Series, np.ndarray)):
-                        result_rks = result_rks.tolist()
-
-                    category_boosts = getattr(row, "category_brand_boosts", None)
-                    if isinstance(category_boosts, (pd.Series, np.ndarray)):
-                        category_boosts = category_boosts.tolist()
-
-                    objs.append(
-                        Search(
-                            id=row.id,
-                            uid=row.uid,
-                            query=row.query,
-                            page=row.page,
-                            timestamp=self._to_timestamp(row.timestamp),
-                            session_id=row.session_id,
-                            result_base_product_rks=result_rks,
-                            category=category,
-                            category_brand_boosts=category_boosts,
-                        )
-                    )
+    # -------------------- Builders (Arrow batch → model objects) --------------------
+    def _categories(self, batch, missing):
+        return [
+            Category(id=id_, title=title, parent_id=parent_id)
+            for id_, title, parent_id in zip(
+                self._column(batch, "id"), self._column(batch, "title"), self._column(batch, "parent_id")
+            )
+        ]
 
-                    if limit and idx + 1 >= limit:
-                        break
+    def _brands(self, batch, missing):
+        return [Brand(id=id_, title=title) for id_, title in zip(self._column(batch, "id"), self._column(batch, "title"))]
 
-                if objs:
-                    Search.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("Searches imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing Searches: {str(e)}"))
-            raise
+    def _cities(self, batch, missing):
+        return [City(id=id_, title=name) for id_, name in zip(self._column(batch, "id"), self._column(batch, "name"))]
 
+    def _shops(self, batch, missing):
+        city_ids = self._resolve(City, self._column(batch, "city_id"), missing, "city")
+        return [
+            Shop(id=int(id_), city_id=city_id, score=float(score), has_warranty=bool(has_warranty))
+            for id_, city_id, score, has_warranty in zip(
+                self._column(batch, "id"), city_ids, self._column(batch, "score"), self._column(batch, "has_warranty")
+            )
+        ]
 
-    def import_baseviews(self, limit=None):
-        self.stdout.write(self.style.NOTICE("Starting import of BaseViews..."))
+    def _extra_features(self, random_key, value):
+        # extra_features -> JSONField
+        if not isinstance(value, str) or value.strip() == "":
+            return None
         try:
-            for chunk in tqdm(self._load_parquet_chunks("base_views.parquet"), desc="BaseViews"):
-                objs = []
-                for idx, row in enumerate(chunk.itertuples(index=False)):
-                    objs.append(
-                        BaseView(
-                            id=row.id,
-                            search=self._safe_get(Search, id=row.search_id),
-                            base_product_rk=row.base_product_rk,
-                            timestamp=self._to_timestamp(row.timestamp),
-                        )
-                    )
-                    if limit and idx + 1 >= limit:
-                        break
+            return json.loads(value)
+        except json.JSONDecodeError:
+            self.stdout.write(self.style.WARNING(f"⚠️ Could not parse extra_features for random_key={random_key}"))
+            return None
 
-                if objs:
-                    BaseView.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("BaseViews imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing BaseViews: {str(e)}"))
-            raise
+    def _baseproducts(self, batch, missing):
+        category_ids = self._resolve(Category, self._column(batch, "category_id"), missing, "category", null_values=(0,))
+        brand_ids = self._resolve(Brand, self._column(batch, "brand_id"), missing, "brand", null_values=(-1,))
+        return [
+            BaseProduct(
+                random_key=random_key,
+                persian_name=persian_name,
+                english_name=english_name,
+                category_id=category_id,
+                brand_id=brand_id,
+                extra_features=self._extra_features(random_key, extra_features),
+                image_url=image_url,
+            )
+            for random_key, persian_name, english_name, category_id, brand_id, extra_features, image_url in zip(
+                self._column(batch, "random_key"), self._column(batch, "persian_name"),
+                self._column(batch, "english_name"), category_ids, brand_ids,
+                self._column(batch, "extra_features"), self._column(batch, "image_url"),
+            )
+        ]
 
+    def _members(self, batch, missing):
+        base_product_ids = self._resolve(BaseProduct, self._column(batch, "base_random_key"), missing, "base product")
+        shop_ids = self._resolve(Shop, self._column(batch, "shop_id"), missing, "shop")
+        return [
+            Member(random_key=random_key, base_product_id=base_product_id, shop_id=shop_id, price=price)
+            for random_key, base_product_id, shop_id, price in zip(
+                self._column(batch, "random_key"), base_product_ids, shop_ids, self._column(batch, "price")
+            )
+        ]
 
-    def import_finalclicks(self, limit=None):
-        self.stdout.write(self.style.NOTICE("Starting import of FinalClicks..."))
-        try:
-            for chunk in tqdm(self._load_parquet_chunks("final_clicks.parquet"), desc="FinalClicks"):
-                objs = []
-                for idx, row in enumerate(chunk.itertuples(index=False)):
-                    objs.append(
-                        FinalClick(
-                            id=row.id,
-                            base_view=self._safe_get(BaseView, id=row.base_view_id),
-                            shop=None if row.shop_id == 0 else self._safe_get(Shop, id=row.shop_id),
-                            timestamp=self._to_timestamp(row.timestamp),
-                        )
-                    )
-                    if limit and idx + 1 >= limit:
-                        break
+    def _searches(self, batch, missing):
+        category_ids = self._resolve(Category, self._column(batch, "category_id"), missing, "category", null_values=(0,))
+        return [
+            Search(
+                id=id_,
+                uid=uid,
+                query=query,
+                page=page,
+                timestamp=timestamp,
+                session_id=session_id,
+                result_base_product_rks=result_rks,
+                category_id=category_id,
+                category_brand_boosts=category_boosts,
+            )
+            for id_, uid, query, page, timestamp, session_id, result_rks, category_id, category_boosts in zip(
+                self._column(batch, "id"), self._column(batch, "uid"), self._column(batch, "query"),
+                self._column(batch, "page"), self._to_timestamps(batch.column("timestamp")),
+                self._column(batch, "session_id"), self._column(batch, "result_base_product_rks"),
+                category_ids, self._column(batch, "category_brand_boosts"),
+            )
+        ]
 
-                if objs:
-                    FinalClick.objects.bulk_create(objs, ignore_conflicts=True, batch_size=1000)
-            self.stdout.write(self.style.SUCCESS("FinalClicks imported successfully!"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error importing FinalClicks: {str(e)}"))
-            raise
+    def _baseviews(self, batch, missing):
+        search_ids = self._resolve(Search, self._column(batch, "search_id"), missing, "search")
+        return [
+            BaseView(id=id_, search_id=search_id, base_product_rk=base_product_rk, timestamp=timestamp)
+            for id_, search_id, base_product_rk, timestamp in zip(
+                self._column(batch, "id"), search_ids, self._column(batch, "base_product_rk"),
+                self._to_timestamps(batch.column("timestamp")),
+            )
+        ]
 
+    def _finalclicks(self, batch, missing):
+        base_view_ids = self._resolve(BaseView, self._column(batch, "base_view_id"), missing, "base view")
+        shop_ids = self._resolve(Shop, self._column(batch, "shop_id"), missing, "shop", null_values=(0,))
+        return [
+            FinalClick(id=id_, base_view_id=base_view_id, shop_id=shop_id, timestamp=timestamp)
+            for id_, base_view_id, shop_id, timestamp in zip(
+                self._column(batch, "id"), base_view_ids, shop_ids, self._to_timestamps(batch.column("timestamp"))
+            )
+        ]
+
+    # -------------------- Scheduling --------------------
+    def _partitions(self, name, workers, limit):
+        """row groupهای جدول به حداکثر workers بخش (یک در میان، تا بخش‌ها هم‌اندازه باشند)؛ None = کل فایل"""
+        if workers < 2 or limit or (self.mode == "delta" and TABLES[name].get("delta")):
+            # a delta load needs every key of the table in one place for --delete-missing
+            return [None]
+        num_row_groups = pq.ParquetFile(self._path(name)).num_row_groups
+        count = min(workers, num_row_groups)
+        if count < 2:
+            return [None]
+        return [list(range(i, num_row_groups, count)) for i in range(count)]
+
+    def _run_serial(self, names, limit):
+        done = set()
+        while len(done) < len(names):
+            # dependencies outside the selection are assumed to be loaded already
+            name = next(n for n in names if n not in done and all(d in done or d not in names for d in TABLES[n]["depends"]))
+            with self.without_indexes(name):
+                self._import(name, limit=limit)
+            done.add(name)
+
+    def _run_parallel(self, names, limit, workers, options):
+        """
+        هر جدول وقتی همه‌ی وابستگی‌هایش تمام شد به صورت partitionهایی از row groupها
+        به workerها سپرده می‌شود؛ حذف/بازسازی ایندکس‌ها در همین پروسه و یک بار برای کل جدول است.
+        """
+        waiting = {name: {d for d in TABLES[name]["depends"] if d in names} for name in names}
+        remaining, running, tables = {}, {}, {}
+        context = multiprocessing.get_context("spawn")
+        with ExitStack() as stack, ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=django.setup
+        ) as pool:
+            while waiting or running:
+                for name in [n for n, deps in waiting.items() if not deps]:
+                    del waiting[name]
+                    tables[name] = stack.enter_context(ExitStack())
+                    tables[name].enter_context(self.without_indexes(name))
+                    parts = self._partitions(name, workers, limit)
+                    remaining[name] = len(parts)
+                    for i, row_groups in enumerate(parts):
+                        part = f"{i + 1}/{len(parts)}" if len(parts) > 1 else None
+                        running[pool.submit(_import_partition, options, name, limit, row_groups, part)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        pool.shutdown(cancel_futures=True)
+                        raise CommandError(f"Importing {TABLES[name]['label']} failed: {e}") from e
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        tables.pop(name).close()
+                        self.stdout.write(self.style.SUCCESS(f"✅ {TABLES[name]['label']} done"))
+                        for deps in waiting.values():
+                            deps.discard(name)
 
     # -------------------- Main Handle --------------------
     def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.NOTICE("Starting data import process..."))
-        # self.import_categories()
-        # self.import_brands()
-        # self.import_cities()
-        # self.import_shops()
-        # self.import_baseproducts()
-        self.import_members()
-        # self.import_searches()
-        # self.import_baseviews()
-        # self.import_finalclicks()
-        self.stdout.write(self.style.SUCCESS("✅ All parquet data imported successfully!"))
\ No newline at end of file
+        names = [name.strip() for name in kwargs["tables"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in TABLES]
+        if unknown:
+            raise CommandError(f"Unknown tables: {', '.join(unknown)} (choose from {', '.join(TABLES)})")
+        options = {
+            "mode": kwargs["mode"],
+            "drop_indexes": kwargs["drop_indexes"],
+            "drop_foreign_keys": kwargs["drop_foreign_keys"],
+            "chunksize": kwargs["chunksize"],
+            "data_dir": kwargs["data_dir"],
+            "delete_missing": kwargs["delete_missing"],
+            "changes_dir": kwargs["changes_dir"],
+            "resume": kwargs["resume"],
+        }
+        self.configure(**options)
+        workers = max(1, kwargs["workers"])
+
+        self.stdout.write(self.style.NOTICE(f"Starting data import process ({', '.join(names)}; {workers} workers)..."))
+        start = time.perf_counter()
+        if workers == 1:
+            self._run_serial(names, kwargs["limit"])
+        else:
+            self._run_parallel(names, kwargs["limit"], workers, options)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ All parquet data imported successfully! ({time.perf_counter() - start:.1f}s)"
+        ))
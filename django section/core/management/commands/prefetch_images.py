@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from core.image_cache import get_image_cache, fetch_image_data_url
+from core.models import BaseProduct
+
+
+class Command(BaseCommand):
+    help = "Warm the on-disk product image cache from BaseProduct.image_url"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Only prefetch the first N products")
+        parser.add_argument("--workers", type=int, default=16, help="Concurrent downloads")
+        parser.add_argument("--chunksize", type=int, default=2000, help="URLs read from the DB per batch")
+
+    def _urls(self, limit, chunksize):
+        queryset = (
+            BaseProduct.objects
+            .exclude(image_url__isnull=True)
+            .exclude(image_url="")
+            .order_by("random_key")
+            .values_list("image_url", flat=True)
+        )
+        if limit:
+            queryset = queryset[:limit]
+        return queryset.iterator(chunk_size=chunksize)
+
+    def handle(self, *args, **options):
+        cache = get_image_cache()
+        counts = {"fetched": 0, "cached": 0, "failed": 0}
+        start = time.perf_counter()
+
+        def prefetch(url):
+            if cache.contains(url):
+                return "cached"
+            fetch_image_data_url(url)
+            return "fetched"
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool, tqdm(desc="Images", unit="img") as bar:
+            pending = set()
+            for url in self._urls(options["limit"], options["chunksize"]):
+                pending.add(pool.submit(prefetch, url))
+                if len(pending) >= options["workers"] * 4:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    self._record(done, counts, bar)
+            for done in as_completed(pending):
+                self._record(done, counts, bar)
+
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        self.stdout.write(
+            f"fetched={counts['fetched']} already_cached={counts['cached']} failed={counts['failed']} "
+            f"in {elapsed:.1f}s"
+        )
+        self.stdout.write(f"cache: {stats['items']} images, {stats['bytes'] / 1024 ** 2:.1f} MiB "
+                          f"(limit {stats['max_bytes'] / 1024 ** 2:.0f} MiB, evictions {stats['evictions']})")
+        if stats["evictions"]:
+            self.stdout.write(self.style.WARNING("⚠️ Cache limit reached during prefetch; raise IMAGE_CACHE_MAX_BYTES"))
+        self.stdout.write(self.style.SUCCESS("✅ Image cache warmed"))
+
+    @staticmethod
+    def _record(future, counts, bar):
+        try:
+            counts[future.result()] += 1
+        except Exception:
+            counts["failed"] += 1
+        bar.update(1)
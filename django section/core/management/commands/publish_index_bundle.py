@@ -0,0 +1,148 @@
+import os
+import shutil
+import time
+
+import faiss
+from django.core.management.base import BaseCommand, CommandError
+
+from core import faiss_index
+from core.ann import INDEX_TYPES, ann_index_path
+from core.index_bundle import (
+    FORMAT, INDEX_FILES, KEY_FILES, BundleError, bundle_dir, check_alignment, read_current,
+    sha256_file, write_current, write_manifest,
+)
+from core.key_table import KeyTable
+
+LEGACY_KEY_MAPS = {
+    "id_to_key": (faiss_index.id_to_key_path, faiss_index._read_pickle),
+    "categories_id_to_key": (faiss_index.categories_id_to_key_path, faiss_index._read_pickle),
+    "images_id_to_key": (faiss_index.images_id_to_key_path, faiss_index._read_images_keys),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Package the indexes and key tables of a data directory as a versioned bundle "
+        "(manifest with dim/metric/count/SHA-256) and make it the CURRENT one; running "
+        "workers switch to it without a restart"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source-dir", default=faiss_index.DATA_DIR)
+        parser.add_argument("--bundles-dir", default=faiss_index.BUNDLES_DIR)
+        parser.add_argument("--bundle-version", default=None, help="Default: current UTC time")
+        parser.add_argument("--no-activate", action="store_true", help="Publish without updating CURRENT")
+        parser.add_argument("--keep", type=int, default=3, help="Older bundles to keep besides the current one")
+
+    # -------------------- Helpers --------------------
+    @staticmethod
+    def _place(source, target):
+        # hard link when possible: the builders replace files atomically, so a
+        # linked file never changes under the bundle
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def _place_index(self, source, directory):
+        target = os.path.join(directory, os.path.basename(source))
+        self._place(source, target)
+        if os.path.exists(faiss_index.meta_path(source)):
+            self._place(faiss_index.meta_path(source), faiss_index.meta_path(target))
+        return target
+
+    def _key_table(self, name, source_dir):
+        legacy_path, read_legacy = LEGACY_KEY_MAPS[name]
+        legacy_path = os.path.join(source_dir, os.path.basename(legacy_path))
+        packed_path = os.path.join(source_dir, KEY_FILES[name])
+        if os.path.exists(legacy_path):
+            # converts (or refreshes) the packed table next to the legacy map
+            faiss_index.load_key_table(legacy_path, read_legacy)
+        if not os.path.exists(packed_path):
+            raise CommandError(f"Neither {legacy_path} nor {packed_path} exists")
+        return packed_path
+
+    @staticmethod
+    def _index_entry(path, keys, default_meta):
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        meta = faiss_index.read_index_meta(path, index, default_meta)
+        return index, {**meta, "file": os.path.basename(path), "keys": keys}
+
+    def _prune(self, bundles_dir, keep, protected):
+        versions = sorted(
+            name for name in os.listdir(bundles_dir)
+            if os.path.isdir(os.path.join(bundles_dir, name)) and not name.endswith(".tmp") and name not in protected
+        )
+        for version in versions[:max(len(versions) - keep, 0)]:
+            # workers still on that version keep their mmaps; the space is freed when they let go
+            shutil.rmtree(bundle_dir(bundles_dir, version))
+            self.stdout.write(f"  removed old bundle {version}")
+
+    # -------------------- Main --------------------
+    def handle(self, *args, **options):
+        source_dir, bundles_dir = options["source_dir"], options["bundles_dir"]
+        version = options["bundle_version"] or time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        target = bundle_dir(bundles_dir, version)
+        if os.path.exists(target):
+            raise CommandError(f"Bundle {target} already exists")
+        tmp_dir = f"{target}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        try:
+            manifest = {
+                "format": FORMAT, "version": version,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "indexes": {}, "ann": {}, "keys": {}, "files": {},
+            }
+            key_tables = {}
+            for name, file in KEY_FILES.items():
+                self._place(self._key_table(name, source_dir), os.path.join(tmp_dir, file))
+                key_tables[name] = KeyTable(os.path.join(tmp_dir, file))
+                manifest["keys"][name] = {"file": file, "count": len(key_tables[name])}
+
+            indexes = {}
+            for name, (file, keys) in INDEX_FILES.items():
+                source = os.path.join(source_dir, file)
+                if not os.path.exists(source):
+                    raise CommandError(f"{source} not found")
+                default_meta = (
+                    faiss_index.LEGACY_IMAGE_EMBEDDING if name == "images" else faiss_index.LEGACY_TEXT_EMBEDDING
+                )
+                indexes[name], manifest["indexes"][name] = self._index_entry(
+                    self._place_index(source, tmp_dir), keys, default_meta
+                )
+                if name == "products":
+                    for kind in INDEX_TYPES:
+                        ann_source = ann_index_path(source, kind)
+                        if os.path.exists(ann_source):
+                            _, manifest["ann"][kind] = self._index_entry(
+                                self._place_index(ann_source, tmp_dir), keys, default_meta
+                            )
+
+            try:
+                check_alignment(manifest, indexes, key_tables)
+            except BundleError as e:
+                raise CommandError(str(e))
+
+            for file in sorted(os.listdir(tmp_dir)):
+                path = os.path.join(tmp_dir, file)
+                self.stdout.write(f"  {file}: hashing {os.path.getsize(path) / 1024 ** 2:.0f} MiB")
+                manifest["files"][file] = {"size": os.path.getsize(path), "sha256": sha256_file(path)}
+            write_manifest(tmp_dir, manifest)
+            os.rename(tmp_dir, target)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        products = manifest["indexes"]["products"]
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Published bundle {version} ({products['count']} products, dim={products['dim']}, "
+            f"{products['metric']}) to {target}"
+        ))
+        if options["no_activate"]:
+            self.stdout.write(self.style.NOTICE(f"CURRENT is still {read_current(bundles_dir)}"))
+        else:
+            write_current(bundles_dir, version)
+            self.stdout.write(self.style.SUCCESS(f"✅ CURRENT → {version}; workers switch within FAISS_BUNDLE_POLL_SECONDS"))
+        self._prune(bundles_dir, options["keep"], {version, read_current(bundles_dir)})
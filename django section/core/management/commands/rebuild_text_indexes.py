@@ -0,0 +1,127 @@
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from core import faiss_index
+from core.embedding_providers import get_embedding_provider
+from core.key_table import key_table_path, write_key_table
+from core.models import BaseProduct, Category
+
+
+def extra_features_text(persian_name, extra_features):
+    """متن ردیف extra_features.index؛ محصولات بدون ویژگی با نامشان نمایه می‌شوند تا ردیف‌ها با id_to_key هم‌تراز بمانند"""
+    if not extra_features:
+        return persian_name
+    if isinstance(extra_features, dict):
+        features = "، ".join(f"{k}: {v}" for k, v in extra_features.items())
+    else:
+        features = json.dumps(extra_features, ensure_ascii=False)
+    return f"{persian_name} | {features}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed products and categories with an embedding provider and rebuild "
+        "products.index, extra_features.index and categories.index (+ key maps)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", default=None, help="openai or local (default: EMBEDDING_PROVIDER)")
+        parser.add_argument("--model", default=None, help="Embedding model (default: EMBEDDING_MODEL)")
+        parser.add_argument("--output-dir", default=faiss_index.DATA_DIR)
+        parser.add_argument("--batch-size", type=int, default=256)
+        parser.add_argument("--limit", type=int, default=None, help="Only index the first N products (testing)")
+
+    def _embed(self, provider, texts):
+        # unit vectors + L2, like the original indexes: scenario thresholds are L2 distances
+        vectors = np.ascontiguousarray(provider.embed(texts), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def handle(self, *args, **options):
+        provider = get_embedding_provider(options["provider"], options["model"])
+        output_dir = options["output_dir"]
+        batch_size = options["batch_size"]
+        os.makedirs(output_dir, exist_ok=True)
+        meta = {"embedding_provider": provider.name, "embedding_model": provider.model}
+        self.stdout.write(self.style.NOTICE(f"Embedding with {provider.name}/{provider.model}"))
+
+        # -------------------- Products + extra features --------------------
+        products = BaseProduct.objects.order_by("random_key").values_list("random_key", "persian_name", "extra_features")
+        if options["limit"]:
+            products = products[:options["limit"]]
+
+        keys = []
+        index_product = index_extra_features = None
+        start = time.perf_counter()
+        batch = []
+        with tqdm(desc="Products", unit="vec") as bar:
+            for row in products.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    index_product, index_extra_features = self._add_products(
+                        provider, batch, keys, index_product, index_extra_features
+                    )
+                    bar.update(len(batch))
+                    batch = []
+            if batch:
+                index_product, index_extra_features = self._add_products(
+                    provider, batch, keys, index_product, index_extra_features
+                )
+                bar.update(len(batch))
+
+        if not keys:
+            self.stdout.write(self.style.ERROR("No products to index"))
+            return
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Embedded {len(keys)} products ({2 * len(keys) / elapsed:.0f} vectors/s)")
+
+        # -------------------- Categories --------------------
+        categories = list(Category.objects.order_by("id").values_list("id", "title"))
+        # ints, like build_faiss_indexes (the column is an integer in the database, a CharField in models.py)
+        category_keys = [int(category_id) for category_id, _ in categories]
+        index_categories = faiss.IndexFlatL2(index_product.d)
+        titles = [title for _, title in categories]
+        for i in range(0, len(titles), batch_size):
+            index_categories.add(self._embed(provider, titles[i:i + batch_size]))
+
+        # -------------------- Write --------------------
+        paths = {
+            "products": os.path.join(output_dir, os.path.basename(faiss_index.products_index_path)),
+            "extra_features": os.path.join(output_dir, os.path.basename(faiss_index.extra_features_index_path)),
+            "categories": os.path.join(output_dir, os.path.basename(faiss_index.categories_index_path)),
+            "id_to_key": os.path.join(output_dir, os.path.basename(faiss_index.id_to_key_path)),
+            "categories_id_to_key": os.path.join(output_dir, os.path.basename(faiss_index.categories_id_to_key_path)),
+        }
+        faiss_index.write_pickle(keys, paths["id_to_key"])
+        faiss_index.write_pickle(category_keys, paths["categories_id_to_key"])
+        write_key_table(keys, key_table_path(paths["id_to_key"]))
+        write_key_table(category_keys, key_table_path(paths["categories_id_to_key"]))
+        faiss_index.write_index(index_product, paths["products"], **meta)
+        faiss_index.write_index(index_extra_features, paths["extra_features"], **meta)
+        faiss_index.write_index(index_categories, paths["categories"], **meta)
+
+        for path in paths.values():
+            self.stdout.write(f"  {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Text indexes rebuilt (dim={index_product.d}); set EMBEDDING_PROVIDER={provider.name} "
+            f"EMBEDDING_MODEL={provider.model} and restart"
+        ))
+
+    def _add_products(self, provider, batch, keys, index_product, index_extra_features):
+        names = [persian_name for _, persian_name, _ in batch]
+        extra = [extra_features_text(persian_name, features) for _, persian_name, features in batch]
+        name_vectors = self._embed(provider, names)
+        extra_vectors = self._embed(provider, extra)
+        if index_product is None:
+            index_product = faiss.IndexFlatL2(name_vectors.shape[1])
+            index_extra_features = faiss.IndexFlatL2(name_vectors.shape[1])
+        index_product.add(name_vectors)
+        index_extra_features.add(extra_vectors)
+        keys.extend(key for key, _, _ in batch)
+        return index_product, index_extra_features
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.intent_classifier import IntentClassifier, load_decisions, build_dataset
+
+
+class Command(BaseCommand):
+    help = "Train the local scenario classifier from logged LLM scenario decisions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", default=settings.INTENT_DECISIONS_LOG, help="JSONL log of LLM decisions")
+        parser.add_argument("--output", default=settings.INTENT_CLASSIFIER_PATH, help="Where to write the model (.npz)")
+        parser.add_argument("--epochs", type=int, default=300)
+        parser.add_argument("--lr", type=float, default=0.5)
+        parser.add_argument("--l2", type=float, default=1e-4)
+
+    def handle(self, *args, **options):
+        records = load_decisions(options["log"])
+        if not records:
+            raise CommandError(f"No usable decisions in {options['log']}")
+
+        self.stdout.write(self.style.NOTICE(f"Embedding {len(records)} logged messages..."))
+        embeddings, rules, labels = build_dataset(records)
+
+        self.stdout.write(self.style.NOTICE("Training classifier..."))
+        classifier = IntentClassifier().fit(
+            embeddings, rules, labels, epochs=options["epochs"], lr=options["lr"], l2=options["l2"]
+        )
+        classifier.save(options["output"])
+
+        message_types = [r["message_type"] for r in records]
+        predicted = classifier.predict_proba(embeddings, rules, message_types).argmax(axis=1) + 1
+        self.stdout.write(f"Training agreement with LLM: {(predicted == labels).mean():.2%}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Classifier written to {options['output']}"))
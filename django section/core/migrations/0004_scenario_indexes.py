@@ -0,0 +1,36 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY: the tables stay writable while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ("core", "0003_importcheckpoint"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="member",
+            index=models.Index(fields=["base_product", "price"], name="member_product_price_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="shop",
+            index=models.Index(fields=["city_id", "score", "has_warranty"], name="shop_city_score_warranty_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="city",
+            index=models.Index(fields=["title"], name="city_title_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="baseproduct",
+            index=GinIndex(fields=["extra_features"], name="baseproduct_features_gin"),
+        ),
+        AddIndexConcurrently(
+            model_name="baseproduct",
+            index=GinIndex(fields=["persian_name"], name="baseproduct_name_trgm", opclasses=["gin_trgm_ops"]),
+        ),
+    ]
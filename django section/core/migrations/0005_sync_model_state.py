@@ -0,0 +1,184 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def integer_to_foreign_key(model_name, name, to, on_delete, orphans_sql, **state_operations):
+    """
+    0001_initial stored <name>_id as a plain NOT NULL IntegerField; models.py has a
+    nullable ForeignKey on the same column. The column and its values are kept:
+    make it nullable, NULL out ids without a target (as import_parquet does), swap
+    the field in the migration state only, then let AlterField add the index and
+    the FK constraint.
+    """
+    foreign_key = dict(blank=True, null=True, on_delete=on_delete, to=to)
+    return [
+        migrations.AlterField(model_name=model_name, name=f"{name}_id", field=models.IntegerField(null=True)),
+        migrations.RunSQL(orphans_sql, migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(state_operations=[
+            *state_operations.get("before", []),
+            migrations.RemoveField(model_name=model_name, name=f"{name}_id"),
+            migrations.AddField(
+                model_name=model_name, name=name,
+                field=models.ForeignKey(db_constraint=False, db_index=False, **foreign_key),
+            ),
+            *state_operations.get("after", []),
+        ]),
+    ], migrations.AlterField(model_name=model_name, name=name, field=models.ForeignKey(**foreign_key))
+
+
+def orphans(table, column, target):
+    return (
+        f'UPDATE "{table}" SET "{column}" = NULL WHERE "{column}" IS NOT NULL '
+        f'AND NOT EXISTS (SELECT 1 FROM "{target}" t WHERE t.id = "{table}"."{column}")'
+    )
+
+
+shop_city, shop_city_constraint = integer_to_foreign_key(
+    "shop", "city", "core.city", django.db.models.deletion.CASCADE, orphans("core_shop", "city_id", "core_city"),
+    # 0004 indexed city_id by its old state name; the index itself stays as it is
+    before=[migrations.RemoveIndex(model_name="shop", name="shop_city_score_warranty_idx")],
+    after=[migrations.AddIndex(
+        model_name="shop",
+        index=models.Index(fields=["city", "score", "has_warranty"], name="shop_city_score_warranty_idx"),
+    )],
+)
+member_shop, member_shop_constraint = integer_to_foreign_key(
+    "member", "shop", "core.shop", django.db.models.deletion.CASCADE, orphans("core_member", "shop_id", "core_shop"),
+)
+finalclick_shop, finalclick_shop_constraint = integer_to_foreign_key(
+    "finalclick", "shop", "core.shop", django.db.models.deletion.CASCADE,
+    orphans("core_finalclick", "shop_id", "core_shop"),
+)
+search_category, search_category_constraint = integer_to_foreign_key(
+    # category_id defaulted to 0 for "no category"
+    "search", "category", "core.category", django.db.models.deletion.SET_NULL,
+    'UPDATE "core_search" SET "category_id" = NULL WHERE "category_id" = 0; '
+    + orphans("core_search", "category_id", "core_category"),
+)
+
+
+class Migration(migrations.Migration):
+    """Bring the migration state (and the schema) in line with models.py"""
+
+    dependencies = [
+        ("core", "0004_scenario_indexes"),
+    ]
+
+    operations = [
+        *shop_city,
+        *member_shop,
+        *finalclick_shop,
+        *search_category,
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="brand",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="core.brand"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="category",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.category"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="english_name",
+            field=models.TextField(),
+        ),
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="image_url",
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="persian_name",
+            field=models.TextField(),
+        ),
+        migrations.AlterField(
+            model_name="baseproduct",
+            name="random_key",
+            field=models.CharField(max_length=1024, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="baseview",
+            name="id",
+            field=models.CharField(max_length=100, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="baseview",
+            name="search",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="core.search"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="baseview",
+            name="timestamp",
+            field=models.DateTimeField(),
+        ),
+        # before search.category gets its constraint: both FK columns follow the new type
+        migrations.AlterField(
+            model_name="category",
+            name="id",
+            field=models.CharField(max_length=100, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="finalclick",
+            name="base_view",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="core.baseview"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="finalclick",
+            name="id",
+            field=models.CharField(max_length=100, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="finalclick",
+            name="timestamp",
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name="member",
+            name="base_product",
+            field=models.ForeignKey(
+                blank=True, null=True, on_delete=django.db.models.deletion.CASCADE,
+                related_name="members", to="core.baseproduct",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="member",
+            name="price",
+            field=models.DecimalField(decimal_places=2, max_digits=25),
+        ),
+        migrations.AlterField(
+            model_name="search",
+            name="id",
+            field=models.CharField(max_length=100, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="search",
+            name="timestamp",
+            field=models.DateTimeField(),
+        ),
+        shop_city_constraint,
+        member_shop_constraint,
+        finalclick_shop_constraint,
+        search_category_constraint,
+        migrations.CreateModel(
+            name="Chat",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("chat_id", models.TextField(unique=True)),
+                ("messages", models.JSONField(default=list)),
+                ("responses", models.JSONField(default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 class Category(models.Model):
@@ -39,6 +40,10 @@ class City(models.Model):
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
 
+    class Meta:
+        # scenario 4: shop__city__title=...
+        indexes = [models.Index(fields=["title"], name="city_title_idx")]
+
     def __str__(self):
         return self.title
     
@@ -48,6 +53,12 @@ class Shop(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE, null=True, blank=True)
     score = models.FloatField()
     has_warranty = models.BooleanField(default=False)
+    # hash of the source parquet row, compared by import_parquet --mode delta
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # scenario 4: city, then score ≥ and has_warranty filters
+        indexes = [models.Index(fields=["city", "score", "has_warranty"], name="shop_city_score_warranty_idx")]
 
     def __str__(self):
         return f"Shop {self.id} - score {self.score}"
@@ -80,6 +91,16 @@ class BaseProduct(models.Model):
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE, null=True, blank=True)
     extra_features = models.JSONField(null=True, blank=True)
     image_url = models.TextField(null=True)
+    # hash of the source parquet row, compared by import_parquet --mode delta
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # extra_features__has_key (the ? operator needs the default jsonb_ops, not jsonb_path_ops)
+            GinIndex(fields=["extra_features"], name="baseproduct_features_gin"),
+            # persian_name__contains (LIKE '%...%') / trigram similarity
+            GinIndex(fields=["persian_name"], name="baseproduct_name_trgm", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return self.persian_name
@@ -90,6 +111,12 @@ class Member(models.Model):
     base_product = models.ForeignKey(BaseProduct, on_delete=models.CASCADE, related_name="members", null=True, blank=True)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, null=True, blank=True)
     price = models.DecimalField(max_digits=25, decimal_places=2)
+    # hash of the source parquet row, compared by import_parquet --mode delta
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # scenarios 3/5: members of a product; scenario 4: products × price range
+        indexes = [models.Index(fields=["base_product", "price"], name="member_product_price_idx")]
 
     def __str__(self):
         return f"{self.random_key} - {self.price}"
@@ -114,4 +141,19 @@ class Chat(models.Model):
 
     def get_conversation_history(self):
         """Get the entire conversation history as a list of tuples"""
-        return list(zip(self.messages, self.responses))
\ No newline at end of file
+        return list(zip(self.messages, self.responses))
+
+class ImportCheckpoint(models.Model):
+    """Rows of one parquet row group that import_parquet has committed (see --resume)"""
+    table = models.CharField(max_length=100)
+    row_group = models.IntegerField()
+    source = models.CharField(max_length=100)  # size:mtime of the parquet file the rows came from
+    rows = models.IntegerField(default=0)
+    done = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [("table", "row_group")]
+
+    def __str__(self):
+        return f"{self.table}[{self.row_group}]: {self.rows} rows{' (done)' if self.done else ''}"
@@ -0,0 +1,225 @@
+"""
+بارگذاری حجیم Arrow → PostgreSQL با COPY.
+
+batchهای Arrow به صورت CSV (با writer خود Arrow، بدون اشیای پایتونی به ازای هر
+ردیف) مستقیم به COPY ... FROM STDIN یک جدول staging از نوع UNLOGGED داده می‌شوند؛
+بعد یک INSERT ... SELECT ... ON CONFLICT DO NOTHING ردیف‌ها را با resolve کردن FKها
+(LEFT JOIN روی جدول مرجع) در جدول اصلی ادغام می‌کند.
+"""
+import io
+import json
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+JSON_TYPES = ("json", "jsonb")
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# -------------------- Arrow → CSV --------------------
+
+class ArrowCsvStream(io.RawIOBase):
+    """فایل فقط‌خواندنی روی batchها: هر batch فقط وقتی COPY به آن رسید به CSV تبدیل می‌شود"""
+
+    def __init__(self, batches):
+        self._batches = iter(batches)
+        self._buffer = b""
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        for batch in self._batches:
+            if batch.num_rows:
+                self.rows += batch.num_rows
+                sink = io.BytesIO()
+                pa_csv.write_csv(batch, sink, pa_csv.WriteOptions(include_header=False))
+                return sink.getvalue()
+        return b""
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            self._buffer = self._next_chunk()
+            if not self._buffer:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _json_strings(array, nested):
+    """ستون nested → متن JSON؛ ستون متنی → همان متن اگر JSON معتبر باشد (وگرنه NULL)"""
+    values = []
+    invalid = 0
+    for value in array.to_pylist():
+        if value is None:
+            values.append(None)
+        elif nested:
+            values.append(json.dumps(value, ensure_ascii=False))
+        elif value.strip() == "":
+            values.append(None)
+        else:
+            try:
+                json.loads(value)
+                values.append(value)
+            except json.JSONDecodeError:
+                values.append(None)
+                invalid += 1
+    return pa.array(values, type=pa.string()), invalid
+
+
+def prepare_batch(batch, target_types):
+    """
+    ستون‌های batch را برای CSV آماده می‌کند. target_types: نوع ستون مقصد هر ستون
+    parquet در PostgreSQL؛ timestamp عددی (میلی‌ثانیه‌ی epoch) به timestamp UTC و
+    ستون‌های JSON به متن JSON تبدیل می‌شوند. برمی‌گرداند: (batch، تعداد JSON نامعتبر)
+    """
+    arrays, names, invalid = [], [], 0
+    for name, target_type in target_types.items():
+        array = batch.column(batch.schema.get_field_index(name))
+        if target_type.startswith("timestamp") and pa.types.is_integer(array.type):
+            array = array.cast(pa.timestamp("ms", tz="UTC"))
+        elif target_type in JSON_TYPES:
+            nested = pa.types.is_nested(array.type)
+            if nested or pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+                array, bad = _json_strings(array, nested)
+                invalid += bad
+        elif pa.types.is_dictionary(array.type):
+            array = pc.cast(array, array.type.value_type)
+        arrays.append(array)
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names), invalid
+
+
+def staging_type(arrow_type):
+    if pa.types.is_boolean(arrow_type):
+        return "boolean"
+    if pa.types.is_integer(arrow_type):
+        return "bigint"
+    if pa.types.is_floating(arrow_type):
+        return "double precision"
+    if pa.types.is_decimal(arrow_type):
+        return "numeric"
+    if pa.types.is_timestamp(arrow_type):
+        return "timestamptz"
+    return "text"
+
+
+# -------------------- Catalog --------------------
+
+def column_types(cursor, table):
+    """نوع واقعی ستون‌های جدول در دیتابیس (ممکن است با models.py فرق داشته باشد)"""
+    cursor.execute(
+        "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+        [table],
+    )
+    return dict(cursor.fetchall())
+
+
+@contextmanager
+def without_secondary_indexes(cursor, table, foreign_keys=False):
+    """
+    ایندکس‌های ثانویه (و در صورت foreign_keys، قیدهای FK) جدول در طول بارگذاری
+    حذف و در پایان (حتی اگر بارگذاری شکست بخورد) با همان تعریف دوباره ساخته می‌شوند.
+    کلید اصلی و قیدهای unique می‌مانند چون ON CONFLICT به آن‌ها نیاز دارد.
+    """
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    constraints = cursor.fetchall() if foreign_keys else []
+    cursor.execute(
+        "SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = %s::regclass AND NOT i.indisprimary AND NOT i.indisunique",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    for name, _ in constraints:
+        cursor.execute(f"ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}")
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    try:
+        yield [name for name, _ in indexes + constraints]
+    finally:
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+
+
+# -------------------- Load --------------------
+
+def create_staging(cursor, name, schema):
+    columns = ", ".join(f"{quote(field.name)} {staging_type(field.type)}" for field in schema)
+    cursor.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+    cursor.execute(f"CREATE UNLOGGED TABLE {quote(name)} ({columns})")
+
+
+def truncate_staging(cursor, name):
+    cursor.execute(f"TRUNCATE {quote(name)}")
+
+
+def copy_batches(cursor, staging, batches, create=False):
+    """
+    همه‌ی batchها با یک COPY در staging؛ تعداد ردیف‌ها را برمی‌گرداند. با create
+    جدول staging اول از روی schema اولین batch ساخته می‌شود (اگر batchی نباشد ساخته نمی‌شود).
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return 0
+    if create:
+        create_staging(cursor, staging, first.schema)
+    stream = ArrowCsvStream(_chain(first, batches))
+    columns = ", ".join(quote(field.name) for field in first.schema)
+    cursor.copy_expert(
+        f"COPY {quote(staging)} ({columns}) FROM STDIN WITH (FORMAT csv)",
+        io.BufferedReader(stream, buffer_size=1 << 20),
+    )
+    return stream.rows
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def merge(cursor, staging, table, target_types, columns, foreign_keys):
+    """
+    INSERT ... SELECT از staging به table با ON CONFLICT DO NOTHING.
+
+    columns: ستون مقصد → ستون staging
+    foreign_keys: ستون مقصد → (جدول مرجع، کلید مرجع، نوع کلید مرجع، ستون staging، مقدار «بدون مرجع»، برچسب)
+    مرجع‌های ناموجود NULL می‌شوند. برمی‌گرداند: (تعداد درج‌شده، {برچسب: تعداد مرجع ناموجود})
+    """
+    select, joins, missing = [], [], []
+    for target, source in columns.items():
+        select.append(f"CAST(s.{quote(source)} AS {target_types[target]}) AS {quote(target)}")
+    for i, (target, (ref_table, ref_pk, ref_type, source, null_value, label)) in enumerate(foreign_keys.items()):
+        alias = f"r{i}"
+        # compared as text: the staging column is bigint or text depending on the parquet file
+        value = f"s.{quote(source)}" if null_value is None else f"NULLIF(s.{quote(source)}::text, '{null_value}')"
+        joins.append(
+            f"LEFT JOIN {quote(ref_table)} {alias} ON {alias}.{quote(ref_pk)} = CAST({value} AS {ref_type})"
+        )
+        select.append(f"{alias}.{quote(ref_pk)} AS {quote(target)}")
+        select.append(f"({value} IS NOT NULL AND {alias}.{quote(ref_pk)} IS NULL) AS {quote(f'_missing_{i}')}")
+        missing.append(label)
+
+    targets = ", ".join(quote(target) for target in [*columns, *foreign_keys])
+    counts = "".join(f", (SELECT count(*) FROM src WHERE {quote(f'_missing_{i}')})" for i in range(len(missing)))
+    cursor.execute(
+        f"WITH src AS (SELECT {', '.join(select)} FROM {quote(staging)} s {' '.join(joins)}), "
+        f"ins AS (INSERT INTO {quote(table)} ({targets}) SELECT {targets} FROM src ON CONFLICT DO NOTHING RETURNING 1) "
+        f"SELECT (SELECT count(*) FROM ins){counts}"
+    )
+    row = cursor.fetchone()
+    return row[0], {label: count for label, count in zip(missing, row[1:]) if count}
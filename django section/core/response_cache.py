@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core.faiss_index import index_version
+from core.intent_classifier import classifier_version
+
+
+def request_cache_key(messages, **flags):
+    """
+    کلید canonical برای یک درخواست /chat: محتوا و نوع پیام‌ها به‌همراه flagهای
+    اثرگذار بر سناریو. chat_id عمداً در کلید نیست تا retryها و اجرای دوباره‌ی
+    ارزیابی‌ها با chat_id جدید هم به کش بخورند. نسخه‌ی باندل FAISS و مدل
+    classifier هم در کلید هستند تا بعد از hot swap یا آموزش دوباره جواب کهنه برنگردد.
+    """
+    canonical = json.dumps(
+        {
+            "messages": [
+                {"type": str(m.get("type") or "").strip().lower(), "content": m.get("content", "")}
+                for m in messages
+            ],
+            "flags": flags,
+            "versions": {"faiss": index_version(), "classifier": classifier_version()},
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.loop = asyncio.get_running_loop()
+        self.waiters = 0
+        self.cacheable = True
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of /chat responses with single-flight de-duplication:
+    concurrent identical requests share one computation. The computation is
+    cancelled only when every request waiting on it has gone away.
+    """
+
+    def __init__(self, ttl, max_items):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def _own_flight(self, key):
+        flight = self._inflight.get(key)
+        return flight if flight is not None and flight.task is asyncio.current_task() else None
+
+    async def _run(self, key, compute):
+        try:
+            value, cacheable = await compute()
+            flight = self._own_flight(key)
+            if flight is not None:
+                flight.cacheable = cacheable
+            if cacheable:
+                self._put(key, value)
+            return value
+        finally:
+            if self._own_flight(key) is not None:
+                del self._inflight[key]
+
+    async def get_or_compute(self, key, compute):
+        """
+        compute: coroutine function returning (value, cacheable). A result
+        marked non-cacheable (e.g. a scenario 4 turn that depends on chat
+        state) is not shared with coalesced requests either; they compute
+        their own.
+        """
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        flight = self._inflight.get(key)
+        # futures cannot be shared across event loops (e.g. under WSGI + async_to_sync)
+        leader = flight is None or flight.loop is not asyncio.get_running_loop()
+        if leader:
+            flight = _Flight(asyncio.ensure_future(self._run(key, compute)))
+            self._inflight[key] = flight
+            self.misses += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            value = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.task.cancel()
+
+        if not leader and not flight.cacheable:
+            value, _ = await compute()
+        return value
+
+    def bypass(self):
+        self.bypassed += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            "items": len(self._entries),
+            "inflight": len(self._inflight),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_MAX_ITEMS)
+    return _cache
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import threading
+
+from django.db.models import Prefetch
+
+from core.models import BaseProduct, Member
+from core.faiss_index import get_faiss_index
+from core.ann import search_index
+from core.embedding_cache import embed_text, aembed_text
+from core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class ProductRetrieval:
+    """
+    نتیجه‌ی مشترک گام اول سناریوهای ۱ تا ۳: embedding پیام، نزدیک‌ترین base
+    در index_product و (در صورت prefetch) خود محصول همراه با members/shop/city.
+    """
+
+    def __init__(self, query_vec, best_key, product=None, prefetched=False):
+        self.query_vec = query_vec
+        self.best_key = best_key
+        self.product = product
+        self.prefetched = prefetched
+
+
+def retrieve_products(query_vec, prefetch=True):
+    faiss_dict = get_faiss_index()
+
+    k = 1
+    distances, indices = search_index(faiss_dict, 'index_product', query_vec, k, profile="top1")
+    best_idx = indices[0][0]
+
+    # ANN searches return -1 when the probed lists hold no vector
+    if best_idx < 0 or best_idx >= len(faiss_dict['product_keys']):
+        return ProductRetrieval(query_vec, None)
+
+    best_key = faiss_dict['product_keys'][best_idx]
+    if not prefetch:
+        return ProductRetrieval(query_vec, best_key)
+
+    product = (
+        BaseProduct.objects
+        .filter(random_key=best_key)
+        .prefetch_related(Prefetch("members", queryset=Member.objects.select_related("shop", "shop__city")))
+        .first()
+    )
+    if product is not None:
+        # evaluate the prefetch here, on the executor thread, not later on the event loop
+        list(product.members.all())
+    return ProductRetrieval(query_vec, best_key, product, prefetched=True)
+
+
+def retrieve_products_for_text(message, prefetch=True):
+    return retrieve_products(embed_text(message), prefetch=prefetch)
+
+
+async def aretrieve_products_for_text(message, prefetch=True):
+    query_vec = await aembed_text(message)
+    return await run_blocking(retrieve_products, query_vec, prefetch)
+
+
+# -------------------- Speculation --------------------
+
+_stats_lock = threading.Lock()
+_stats = {"started": 0, "used": 0, "cancelled": 0}
+
+
+def _count(field):
+    with _stats_lock:
+        _stats[field] += 1
+
+
+class Speculation:
+    """
+    Embedding و جستجوی محصول را همزمان با تشخیص سناریو شروع می‌کند.
+    اگر سناریوی انتخاب‌شده ۱، ۲ یا ۳ باشد نتیجه با take() تحویل داده می‌شود،
+    در غیر این صورت cancel() کار نیمه‌تمام را لغو می‌کند.
+    """
+
+    def __init__(self, message):
+        self.embedding = asyncio.ensure_future(aembed_text(message))
+        self.retrieval = asyncio.ensure_future(self._retrieve())
+        self._settled = False
+        _count("started")
+
+    async def _retrieve(self):
+        return await run_blocking(retrieve_products, await self.embedding)
+
+    async def take(self):
+        self._settled = True
+        _count("used")
+        return await self.retrieval
+
+    def cancel(self):
+        if self._settled:
+            return
+        self._settled = True
+        _count("cancelled")
+        for task in (self.retrieval, self.embedding):
+            if not task.done():
+                task.cancel()
+            else:
+                # mark exceptions as retrieved so asyncio does not log them
+                task.cancelled() or task.exception()
+
+
+def speculation_stats():
+    with _stats_lock:
+        settled = _stats["used"] + _stats["cancelled"]
+        return {
+            **_stats,
+            "use_ratio": round(_stats["used"] / settled, 4) if settled else None,
+        }
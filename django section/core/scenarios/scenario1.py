@@ -1,35 +1,29 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
 import re
-import numpy as np
 import json
-import os
 import logging
-from core.faiss_index import get_faiss_index
+from core.retrieval import retrieve_products_for_text, aretrieve_products_for_text
 
 logger = logging.getLogger(__name__)
 
-def find_product_based_name(last_message):
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
-
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=last_message
-    )
-
-    faiss_dict = get_faiss_index()
-    query_vec = np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)  # 2D array
-
-    k = 1
-    distances, indices = faiss_dict['index_product'].search(query_vec, k)
-    best_idx = indices[0][0]
-
-    if best_idx >= len(faiss_dict['product_keys']):
+def _result(best_key):
+    if best_key is None:
         return None, None
 
     return {
         "message": None,
-        "base_random_keys": [faiss_dict['product_keys'][best_idx]],
+        "base_random_keys": [best_key],
         "member_random_keys": None
-    }
\ No newline at end of file
+    }
+
+
+def find_product_based_name(last_message):
+    retrieval = retrieve_products_for_text(last_message, prefetch=False)
+    return _result(retrieval.best_key)
+
+
+async def afind_product_based_name(last_message, retrieval=None):
+    if retrieval is None:
+        retrieval = await aretrieve_products_for_text(last_message, prefetch=False)
+    return _result(retrieval.best_key)
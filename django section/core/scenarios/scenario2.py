@@ -1,48 +1,23 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import get_openai_client, get_async_openai_client
 import re
-import numpy as np
 import json
 import logging
-import os
-from core.faiss_index import get_faiss_index
+from core.retrieval import retrieve_products_for_text, aretrieve_products_for_text
 
 logger = logging.getLogger(__name__)
 
-def find_property_of_good(last_message):
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
-
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=last_message
-    )
-
-    faiss_dict = get_faiss_index()
-
-    query_vec = np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
-
-    k = 1
-    distances, indices = faiss_dict['index_product'].search(query_vec, k)
-
-    best_keys = []
-    for idx in indices[0]:
-        if idx < len(faiss_dict['product_keys']):
-            best_keys.append(faiss_dict['product_keys'][idx])
-        else:
-            best_keys.append(None) 
-
-    # logger.info(f"[find_property_of_good] best_keys: {best_keys}")
-
-    products = BaseProduct.objects.filter(random_key__in=best_keys)
-    products_ordered = sorted(
-        products,
-        key=lambda p: best_keys.index(p.random_key)
-    )
+def _nearest_products(retrieval):
+    products_ordered = [retrieval.product] if retrieval.product is not None else []
 
     for i, prod in enumerate(products_ordered, 1):
         logger.info(f"[find_property_of_good] محصول {i}: {prod.random_key} - {prod.persian_name}")
 
+    return products_ordered
+
+
+def _build_prompt(last_message, products_ordered):
     prompt = f"""
 شما یک دستیار هوش مصنوعی هستید. 
 با توجه به نمونه‌های زیر، فقط به سوال کاربر پاسخ دهید. 
@@ -77,14 +52,19 @@ def find_property_of_good(last_message):
 
     logger.info(f"[find_property_of_good] prompt length: {len(prompt)}")
     logger.info(f"[find_property_of_good] prompt:\n{prompt}")
+    return prompt
+
 
-    response = client.chat.completions.create(
+def _completion_kwargs(prompt):
+    return dict(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5,
         max_tokens=4096,
     )
 
+
+def _result(response):
     result_message = response.choices[0].message.content.strip()
     logger.info(f"[find_property_of_good] LLM response: {result_message}")
 
@@ -92,4 +72,23 @@ def find_property_of_good(last_message):
         "message": result_message,
         "base_random_keys": None,
         "member_random_keys": None
-    }
\ No newline at end of file
+    }
+
+
+def find_property_of_good(last_message):
+    client = get_openai_client()
+
+    retrieval = retrieve_products_for_text(last_message)
+    prompt = _build_prompt(last_message, _nearest_products(retrieval))
+
+    return _result(client.chat.completions.create(**_completion_kwargs(prompt)))
+
+
+async def afind_property_of_good(last_message, retrieval=None):
+    client = get_async_openai_client()
+
+    if retrieval is None:
+        retrieval = await aretrieve_products_for_text(last_message)
+    prompt = _build_prompt(last_message, _nearest_products(retrieval))
+
+    return _result(await client.chat.completions.create(**_completion_kwargs(prompt)))
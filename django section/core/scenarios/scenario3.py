@@ -1,12 +1,10 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import get_openai_client, get_async_openai_client
 import re
-import numpy as np
 import json
 import logging
-import os
-from core.faiss_index import get_faiss_index
+from core.retrieval import retrieve_products_for_text, aretrieve_products_for_text
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +44,16 @@ def get_member_descriptions(best_key):
             'shop', 'shop__city'
         )
         
+        return describe_members(members)
+    
+    except BaseProduct.DoesNotExist:
+        return [f"No product found with key: {best_key}"]
+    except Exception as e:
+        return [f"Error retrieving data: {str(e)}"]
+
+
+def describe_members(members):
+    try:
         descriptions = []
         for member in members:
             # Build the description string for each member
@@ -63,36 +71,20 @@ def get_member_descriptions(best_key):
         
         return descriptions
     
-    except BaseProduct.DoesNotExist:
-        return [f"No product found with key: {best_key}"]
     except Exception as e:
         return [f"Error retrieving data: {str(e)}"]
 
 
-def find_property_of_shops(last_message):
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
-
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=last_message
-    )
-
-    faiss_dict = get_faiss_index()
-
-    query_vec = np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
-
-    k = 1 
-    distances, indices = faiss_dict['index_product'].search(query_vec, k)
+def _member_descriptions(retrieval):
+    logger.info(f"[find_property_of_shop] best_key: {retrieval.best_key}")
 
-    best_idx = indices[0][0]
+    if retrieval.product is None:
+        return [f"No product found with key: {retrieval.best_key}"]
+    # members/shop/city were prefetched together with the product
+    return describe_members(retrieval.product.members.all())
 
-    if best_idx >= len(faiss_dict['product_keys']):
-        return None, None
-
-    logger.info(f"[find_property_of_shop] best_key: {faiss_dict['product_keys'][best_idx]}")
-
-    member_descriptions = get_member_descriptions(faiss_dict['product_keys'][best_idx])
 
+def _build_prompt(last_message, member_descriptions):
     prompt = f"""
 شما یک دستیار هوش مصنوعی هستید. 
 با توجه به اطلاعات زیر، فقط به سوال کاربر پاسخ دهید. 
@@ -126,14 +118,19 @@ def find_property_of_shops(last_message):
 
     logger.info(f"[find_property_of_shop] prompt length: {len(prompt)}")
     logger.info(f"[find_property_of_shop] prompt:\n{prompt}")
+    return prompt
+
 
-    response = client.chat.completions.create(
+def _completion_kwargs(prompt):
+    return dict(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.3,
         max_tokens=100,
     )
 
+
+def _result(response):
     result_message = response.choices[0].message.content.strip()
     logger.info(f"[find_property_of_shop] LLM response: {result_message}")
 
@@ -151,3 +148,26 @@ def find_property_of_shops(last_message):
             "base_random_keys": None,
             "member_random_keys": None
         }
+
+
+def find_property_of_shops(last_message):
+    client = get_openai_client()
+
+    retrieval = retrieve_products_for_text(last_message)
+    if retrieval.best_key is None:
+        return None, None
+
+    prompt = _build_prompt(last_message, _member_descriptions(retrieval))
+    return _result(client.chat.completions.create(**_completion_kwargs(prompt)))
+
+
+async def afind_property_of_shops(last_message, retrieval=None):
+    client = get_async_openai_client()
+
+    if retrieval is None:
+        retrieval = await aretrieve_products_for_text(last_message)
+    if retrieval.best_key is None:
+        return None, None
+
+    prompt = _build_prompt(last_message, _member_descriptions(retrieval))
+    return _result(await client.chat.completions.create(**_completion_kwargs(prompt)))
@@ -1,92 +1,46 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import get_openai_client
 import re
-import numpy as np
 import json
 import logging
 from django.db.models import Q
-import os
-from core.faiss_index import get_faiss_index
+from django.conf import settings
+from core.faiss_index import get_faiss_index, product_rows
+from core.ann import search_index, filtered_search, radius_search
+from core.embedding_cache import embed_text
 
 logger = logging.getLogger(__name__)
 
-def find_best_product(customer_data, extra_features_dict, chat):
-    logger.info(f"شروع find_best_product با داده‌های اصلی: {customer_data}")
-    
-    client = OpenAI(api_key="trb-2c31d1370852408ae5-85e4-464e-9d1b-27a793c97e14", base_url="https://turbo.torob.com/v1")
-
-    prompt=f"""
-اسم محصول را بدون توجه به جزئیات آن استخراح کن و خروجی بده
-
-متن:
-{chat.messages[0]}
-"""
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.5,
-        max_tokens=4096,
-    )
-
-    result_message = response.choices[0].message.content.strip()
-    logger.info(f"result_message for product persian name: {result_message}")
-
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=result_message
-    )
-
-    faiss_dict = get_faiss_index()
-
-    query_vec = np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
-
-    k = 10000
-
-    distances, indices = faiss_dict['index_product'].search(query_vec, k)
-    logger.info(f"indices: {distances[0][0]}")
-    logger.info(f"indices: {distances[0][1]}")
-
-    threshold = 0.8
-
-    # mask = distances >= threshold  
-    mask = distances <= threshold  
-
-    filtered_indices = [idx[mask_row] for idx, mask_row in zip(indices, mask)]
-    filtered_distances = [dist[mask_row] for dist, mask_row in zip(distances, mask)]
-
-    best_keys = []
-    for idx in filtered_indices[0]:
-        if idx < len(faiss_dict['product_keys']):
-            best_keys.append(faiss_dict['product_keys'][idx])
-        else:
-            best_keys.append(None) 
-
-
-    members_qs = Member.objects.filter(base_product__random_key__in=best_keys)
-    
+def filter_members(members_qs, customer_data, extra_features_dict):
+    """
+    فیلترهای SQL روی شهر، امتیاز، گارانتی، قیمت و کلیدهای extra_features.
+    برمی‌گرداند: (members_qs, آیا فیلتری اعمال شد)
+    """
+    # no per-step count() here: the queryset is not narrowed to the vector matches yet
+    initial_qs = members_qs
     if customer_data.get("city") not in [None, "", "none", "None"]:
         members_qs = members_qs.filter(shop__city__title=customer_data["city"])
-        logger.info(f"فیلتر بر اساس شهر: {customer_data.get('city')} → {members_qs.count()} رکورد")
+        logger.info(f"فیلتر بر اساس شهر: {customer_data.get('city')}")
     if customer_data.get("score") not in [None, "", "none", "None"]:
         try:
             desired_score = float(customer_data["score"])
             members_qs = members_qs.filter(shop__score__gte=desired_score)
-            logger.info(f"فیلتر بر اساس score ≥ {customer_data.get('score')} → {members_qs.count()} رکورد")
+            logger.info(f"فیلتر بر اساس score ≥ {customer_data.get('score')}")
         except:
             logger.info(f"could not cast the score to a float number. The score: {customer_data.get('score')}")
     if customer_data.get("has_warranty") not in [None, "", "none", "None"]:
         if customer_data.get("has_warranty") in [True, False, "true", "True", "false", "False"]:
             has_warr = True if customer_data.get("has_warranty") in ["True", "true"] else False
             members_qs = members_qs.filter(shop__has_warranty=has_warr)
-            logger.info(f"فیلتر بر اساس has_warranty={customer_data.get('has_warranty')} → {members_qs.count()} رکورد")
+            logger.info(f"فیلتر بر اساس has_warranty={customer_data.get('has_warranty')}")
     if customer_data.get("price") not in [None, "", "none", "None"]:
         try:
             desired_price = float(customer_data.get('price'))
             lower_bound = desired_price * 0.95  # 5% less
             upper_bound = desired_price * 1.05  # 5% more
             members_qs = members_qs.filter(price__gte=lower_bound, price__lte=upper_bound)
-            logger.info(f"فیلتر بر اساس محدوده قیمت: {lower_bound:.0f} تا {upper_bound:.0f} → {members_qs.count()} رکورد")
+            logger.info(f"فیلتر بر اساس محدوده قیمت: {lower_bound:.0f} تا {upper_bound:.0f}")
         except:
             logger.info(f"could not cast the price to a float number. The price: {customer_data.get('price')}")
     # NEW FILTER: Filter by extra_features keys matching (Static)
@@ -100,8 +54,59 @@ def find_best_product(customer_data, extra_features_dict, chat):
         
         if conditions:
             members_qs = members_qs.filter(conditions)
-            logger.info(f"فیلتر بر اساس کلیدهای extra_features: {list(extra_features_dict.keys())} → {members_qs.count()} رکورد")
+            logger.info(f"فیلتر بر اساس کلیدهای extra_features: {list(extra_features_dict.keys())}")
+
+    return members_qs, members_qs is not initial_qs
+
+
+def find_best_product(customer_data, extra_features_dict, chat):
+    logger.info(f"شروع find_best_product با داده‌های اصلی: {customer_data}")
     
+    client = get_openai_client()
+
+    prompt=f"""
+اسم محصول را بدون توجه به جزئیات آن استخراح کن و خروجی بده
+
+متن:
+{chat.messages[0]}
+"""
+    response = client.chat.completions.create(
+        model="gpt-4.1-mini",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.5,
+        max_tokens=4096,
+    )
+
+    result_message = response.choices[0].message.content.strip()
+    logger.info(f"result_message for product persian name: {result_message}")
+
+    query_vec = embed_text(result_message)
+
+    faiss_dict = get_faiss_index()
+
+    # Step 1: the customer's criteria → eligible base products, so FAISS only scores those.
+    # Loose filters (too many eligible products) are applied in SQL after the search instead.
+    members_qs, filtered = filter_members(Member.objects.all(), customer_data, extra_features_dict)
+    allowed_rows = None
+    if filtered:
+        max_products = settings.SCENARIO4_PREFILTER_MAX_PRODUCTS
+        eligible_keys = list(members_qs.values_list('base_product_id', flat=True).distinct()[:max_products + 1])
+        if len(eligible_keys) <= max_products:
+            allowed_rows = product_rows(faiss_dict, eligible_keys)
+            logger.info(f"{len(allowed_rows)} base products pass the filters")
+        else:
+            logger.info(f"more than {max_products} base products pass the filters → filtering after the search")
+
+    # Step 2: eligible products whose name is within the threshold, closest first
+    threshold = 0.8
+    distances, rows = radius_search(
+        faiss_dict, 'index_product', query_vec, threshold, allowed_rows, limit=settings.SCENARIO4_MAX_CANDIDATES
+    )
+    logger.info(f"{len(rows)} products within distance {threshold}: {distances[:2]}")
+
+    best_keys = [faiss_dict['product_keys'][row] for row in rows]
+
+    members_qs = members_qs.filter(base_product__random_key__in=best_keys)
     members_qs = members_qs.distinct()
     logger.info(f"تعداد رکوردهای یکتا بعد از فیلتر: {members_qs.count()}")
     # Get all member random_keys as a list
@@ -132,36 +137,26 @@ def find_best_product(customer_data, extra_features_dict, chat):
 
     logger.info("استفاده از extra_features برای جستجوی نزدیک‌ترین محصول")
 
-    client = OpenAI(
-        api_key=os.getenv("TOROB_API_KEY"),
-        base_url="https://turbo.torob.com/v1"
-    )
-    
     filtered_dict = {k: v for k, v in extra_features_dict.items() if v not in [None, "", "none", "None"]}
     query_str = json.dumps(filtered_dict, ensure_ascii=False)
     logger.info(f"query_str: {query_str}")
-    query_embedding = np.array(
-        client.embeddings.create(model="text-embedding-3-small", input=query_str).data[0].embedding,
-        dtype=np.float32
-    ).reshape(1, -1)
+    query_embedding = embed_text(query_str)
     logger.info(f"embedding query ساخته شد")
 
     
-    # Search for more results initially to ensure we find matches within our filtered set
-    search_k = 2000 
-    distances, indices = faiss_dict['index_extra_features'].search(query_embedding, search_k)
+    # Step 5: nearest extra_features among the base products that match customer criteria only
+    candidate_rows = product_rows(faiss_dict, bp_to_mem.keys())
+    distances, indices = filtered_search(faiss_dict, 'index_extra_features', query_embedding, 15, candidate_rows)
 
-    # Step 5: Filter results to only include base products that match customer criteria
     valid_results = []
     for i, idx in enumerate(indices[0]):
-        if idx < len(faiss_dict['product_keys']): 
+        if 0 <= idx < len(faiss_dict['product_keys']):
             bp_key = faiss_dict['product_keys'][idx]
-            if bp_key in bp_to_mem: 
-                valid_results.append({
-                    'bp_key': bp_key,
-                    'distance': distances[0][i],
-                    'index': idx
-                })
+            valid_results.append({
+                'bp_key': bp_key,
+                'distance': distances[0][i],
+                'index': idx
+            })
     
     best_members_key = []
     if valid_results:
@@ -236,10 +231,7 @@ def find_product_after_chat_with_user(message, chat_id):
     
     chat, created = Chat.objects.get_or_create(chat_id=chat_id)
 
-    client = OpenAI(
-        api_key=os.getenv("TOROB_API_KEY"),
-        base_url="https://turbo.torob.com/v1"
-    )
+    client = get_openai_client()
 
     if created:
         logger.info("Chat جدید ایجاد شد، بخش فیلدهای اصلی اجرا می‌شود")
@@ -368,12 +360,8 @@ JSON قبلی:
         if "extra_features" not in previous_data:
             logger.info("ساخت extra_features برای اولین بار")
 
-            # ایجاد embedding از پیام کاربر
-            response = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=chat.messages[0]
-            )
-            query_vec = np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
+            # ایجاد embedding از پیام کاربر (از کش، چون پیام اول در هر نوبت تکرار می‌شود)
+            query_vec = embed_text(chat.messages[0])
             logger.info("embedding پیام کاربر ساخته شد")
 
             # بارگذاری FAISS index
@@ -383,7 +371,7 @@ JSON قبلی:
 
             # جستجوی بهترین محصولات مشابه
             k = 5
-            distances, indices = faiss_dict['index_product'].search(query_vec, k)
+            distances, indices = search_index(faiss_dict, 'index_product', query_vec, k, profile="exact")
             best_keys = [faiss_dict['product_keys'][idx] if idx < len(faiss_dict['product_keys']) else None for idx in indices[0]]
             logger.info(f"best_keys پیدا شد: {best_keys}")
 
@@ -472,4 +460,4 @@ JSON قبلی:
             "message": translated_questions,
             "base_random_keys": None,
             "member_random_keys": None
-        }
\ No newline at end of file
+        }
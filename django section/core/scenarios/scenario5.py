@@ -1,12 +1,14 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import get_openai_client, get_async_openai_client
 import re
 import numpy as np
 import json
 import logging
 from core.faiss_index import get_faiss_index
-import os
+from core.ann import search_index
+from core.embedding_cache import embed_texts, aembed_texts
+from core.executor import run_blocking
 
 logger = logging.getLogger("product_logger")
 logger.setLevel(logging.DEBUG)
@@ -50,9 +52,7 @@ def get_member_descriptions(best_key):
         return [f"Error retrieving data: {str(e)}"]
 
         
-def compare_bases_for_user_query(last_message):
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
-
+def _extraction_kwargs(last_message):
     # logger.info("Generating product list from LLM...")
     prompt = f"""
 متنی به تو داده می‌شود که شامل چند محصول است. لطفاً همه محصول‌ها را شناسایی کن و هر محصول را در یک خط جداگانه بنویس. هیچ توضیح اضافی، نقطه، کاما یا متن اضافی اضافه نکن. محصولات باید دقیقاً همانطور که در متن آمده‌اند، حفظ شوند.
@@ -64,26 +64,23 @@ def compare_bases_for_user_query(last_message):
 """
 
     # logger.info(f"first prompt: {prompt}")
-    response = client.chat.completions.create(
+    return dict(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5,
         max_tokens=4096,
     )
+
+
+def _parse_products(response):
     llm_text = response.choices[0].message.content
     # logger.info(f"llm_text: {llm_text}")
     products_list = [line.strip() for line in llm_text.splitlines() if line.strip()]
     # logger.info(f"Extracted {len(products_list)} products")
+    return products_list
 
-    # -------------------------------
-    # مرحله 2: ایجاد embedding برای محصولات
-    # -------------------------------
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=products_list
-    )
-    embeddings_list = [item.embedding for item in response.data]
 
+def _load_records(embeddings_list):
     # -------------------------------
     # مرحله 3: پیدا کردن نزدیک‌ترین random_key از FAISS
     # -------------------------------
@@ -95,10 +92,10 @@ def compare_bases_for_user_query(last_message):
     for i, emb in enumerate(embeddings_list, 1):
         query_vec = np.array(emb, dtype=np.float32).reshape(1, -1)
         k = 1
-        distances, indices = faiss_dict['index_product'].search(query_vec, k)
+        distances, indices = search_index(faiss_dict, 'index_product', query_vec, k, profile="top1")
         best_idx = indices[0][0]
 
-        if best_idx >= len(faiss_dict['product_keys']):
+        if best_idx < 0 or best_idx >= len(faiss_dict['product_keys']):
             closest_keys.append(None)
             # logger.debug(f"[{i}] No matching key found")
         else:
@@ -119,7 +116,10 @@ def compare_bases_for_user_query(last_message):
         member_desc = get_member_descriptions(key)
         all_member_descriptions[key] = member_desc
 
+    return products_list, all_member_descriptions
 
+
+def _answer_kwargs(last_message, products_list, all_member_descriptions):
     # -------------------------------
     # مرحله 5: آماده‌سازی پرامپت نهایی برای پاسخ‌دهی به کاربر
     # -------------------------------
@@ -184,17 +184,16 @@ def compare_bases_for_user_query(last_message):
   "random_key": "random_key محصول موردنظر"  
 }}
 """
-
-    # -------------------------------
-    # مرحله 6: دریافت پاسخ نهایی از LLM
-    # -------------------------------
     # logger.info("Sending final prompt to LLM...")
-    response = client.chat.completions.create(
+    return dict(
         model="gpt-4.1-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5,
         max_tokens=4096,
     )
+
+
+def _result(response):
     result_message = response.choices[0].message.content.strip()
 
     data = json.loads(result_message)
@@ -210,3 +209,33 @@ def compare_bases_for_user_query(last_message):
         "base_random_keys": [random_key],
         "member_random_keys": None
     }
+
+
+def compare_bases_for_user_query(last_message):
+    client = get_openai_client()
+
+    products_list = _parse_products(client.chat.completions.create(**_extraction_kwargs(last_message)))
+
+    # -------------------------------
+    # مرحله 2: ایجاد embedding برای محصولات
+    # -------------------------------
+    embeddings_list = embed_texts(products_list)
+
+    records, all_member_descriptions = _load_records(embeddings_list)
+
+    # -------------------------------
+    # مرحله 6: دریافت پاسخ نهایی از LLM
+    # -------------------------------
+    answer_kwargs = _answer_kwargs(last_message, records, all_member_descriptions)
+    return _result(client.chat.completions.create(**answer_kwargs))
+
+
+async def acompare_bases_for_user_query(last_message):
+    client = get_async_openai_client()
+
+    products_list = _parse_products(await client.chat.completions.create(**_extraction_kwargs(last_message)))
+    embeddings_list = await aembed_texts(products_list)
+    records, all_member_descriptions = await run_blocking(_load_records, embeddings_list)
+
+    answer_kwargs = _answer_kwargs(last_message, records, all_member_descriptions)
+    return _result(await client.chat.completions.create(**answer_kwargs))
@@ -1,25 +1,20 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import get_openai_client, get_async_openai_client
 import re
 import base64
-import requests
-import numpy as np
 import json
 import logging
 from core.faiss_index import get_faiss_index
-import os
+from core.ann import search_index
+from core.image_cache import fetch_image_data_url
+from core.embedding_cache import embed_text, aembed_text
+from core.executor import run_blocking
 
 logger = logging.getLogger(__name__)
 
 def get_image_base64_data_url(image_url):
-    response = requests.get(image_url)
-    response.raise_for_status()  # Check for errors
-    image_data = response.content
-    mime_type = response.headers.get('content-type', 'image/jpeg')
-    base64_encoded = base64.b64encode(image_data).decode('utf-8')
-    data_url = f"data:{mime_type};base64,{base64_encoded}"
-    return data_url
+    return fetch_image_data_url(image_url)
 
 
 def extract_object(response):
@@ -46,7 +41,10 @@ def extract_object(response):
 
     return raw_text
 
-def find_object_in_image(message, image_url):
+THRESHOLD = 0.5
+
+
+def _vision_kwargs(image_url):
     base64_image = (image_url)
     prompt = f"""
 همه اشیای محصول واقعی و قابل تشخیص در تصویر را در لیست قرار بده. 
@@ -70,9 +68,7 @@ def find_object_in_image(message, image_url):
     logger.info(f"[find_object_in_image] prompt length: {len(prompt)}")
     logger.info(f"[find_object_in_image] prompt:\n{prompt}")
 
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
-
-    response = client.responses.create(
+    return dict(
         model="gpt-4.1",
         input=[{
             "role": "user",
@@ -84,36 +80,31 @@ def find_object_in_image(message, image_url):
         temperature=0.5,
     )
 
+
+def _parse_objects(response):
     raw_text = extract_object(response)
     raw_text = raw_text.strip("[]")
     object_list = [x.strip() for x in re.split(r"[,\u060C]", raw_text) if x.strip()]
 
     logger.info(f"[find_object_in_image] Parsed objects: {object_list}")
+    return object_list
 
-    faiss_dict = get_faiss_index()
-    parent_title = None
-
-    THRESHOLD = 0.5
 
-    for obj in object_list:
-        emb = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=obj
-        )
-        query_vec = np.array(emb.data[0].embedding, dtype=np.float32).reshape(1, -1)
+def _is_strong_match(obj, query_vec):
+    faiss_dict = get_faiss_index()
 
-        k = 3 
-        distances, indices = faiss_dict['index_product'].search(query_vec, k)
+    k = 3 
+    distances, indices = search_index(faiss_dict, 'index_product', query_vec, k)
 
-        logger.info(f"[find_object_in_image] obj={obj}, indices={indices[0]}, dists={distances[0]}")
+    logger.info(f"[find_object_in_image] obj={obj}, indices={indices[0]}, dists={distances[0]}")
 
-        if distances[0][0] > THRESHOLD:
-            logger.warning(f"[find_object_in_image] Weak match for {obj} (dist={distances[0][0]}) → skipping")
-            continue
+    if distances[0][0] > THRESHOLD:
+        logger.warning(f"[find_object_in_image] Weak match for {obj} (dist={distances[0][0]}) → skipping")
+        return False
+    return True
 
-        result_message = obj
-        break
 
+def _result(result_message):
     if not result_message:
         logger.warning("[find_object_in_image] No valid product/category found after checking all objects")
 
@@ -122,3 +113,29 @@ def find_object_in_image(message, image_url):
         "base_random_keys": None,
         "member_random_keys": None
     }
+
+
+def find_object_in_image(message, image_url):
+    client = get_openai_client()
+    object_list = _parse_objects(client.responses.create(**_vision_kwargs(image_url)))
+
+    result_message = None
+    for obj in object_list:
+        if _is_strong_match(obj, embed_text(obj)):
+            result_message = obj
+            break
+
+    return _result(result_message)
+
+
+async def afind_object_in_image(message, image_url):
+    client = get_async_openai_client()
+    object_list = _parse_objects(await client.responses.create(**_vision_kwargs(image_url)))
+
+    result_message = None
+    for obj in object_list:
+        if await run_blocking(_is_strong_match, obj, await aembed_text(obj)):
+            result_message = obj
+            break
+
+    return _result(result_message)
@@ -1,32 +1,28 @@
 from core.models import *
 from core.serializers import *
-from openai import OpenAI
+from core.clients import (
+    get_openai_client, get_clip_client,
+    get_async_openai_client, get_async_clip_client,
+)
 import re
 import base64
-import requests
 import numpy as np
 import json
 import logging
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openai import APITimeoutError
+from django.conf import settings
 from core.faiss_index import get_faiss_index
-import os
+from core.image_cache import fetch_image_data_url, afetch_image_data_url
+from core.executor import run_blocking
 
 logger = logging.getLogger(__name__)
 
-def get_image_base64_data_url(image_url):
-    # Download the image
-    response = requests.get(image_url)
-    response.raise_for_status()  # Check for errors
-    
-    # Get the image content and MIME type
-    image_data = response.content
-    mime_type = response.headers.get('content-type', 'image/jpeg')
-    
-    # Encode to base64
-    base64_encoded = base64.b64encode(image_data).decode('utf-8')
-    
-    # Create data URL
-    data_url = f"data:{mime_type};base64,{base64_encoded}"
-    return data_url
+def get_image_base64_data_url(image_url, thumbnail=False):
+    # served from the on-disk image cache when the same image was seen before
+    return fetch_image_data_url(image_url, thumbnail)
 
 def extract_object(response):
     logger.info(f"{response}")
@@ -52,70 +48,258 @@ def extract_object(response):
 
     return raw_text
 
-def find_object_in_image_and_products(message, image_url):
+def _clip_request(image_url, transport=None):
+    """
+    آرگومان‌های POST /embed_image. در حالت binary تصویر به صورت بایت خام
+    فرستاده و embedding به صورت float32 خام دریافت می‌شود (بدون base64/JSON).
+    """
     base64_image = (image_url)
     if base64_image.startswith("data:"):
-        base64_image_2 = base64_image.split(",")[1]   
-    API_URL = "https://model-api.darkube.app/embed_image"
+        base64_image = base64_image.split(",")[1]
+    if (transport or settings.CLIP_TRANSPORT) != "binary":
+        return {"json": {"base64_images": [base64_image]}}
+    return {
+        "content": base64.b64decode(base64_image),
+        "headers": {"Content-Type": "application/octet-stream", "Accept": "application/octet-stream"},
+    }
 
-    payload = {"base64_images": [base64_image_2]}
-    response = requests.post(API_URL, json=payload)
 
-    # ---------- نتیجه ----------
-    if response.status_code == 200:
-        data = response.json()
-        print("Embedding dims:", data["dims"])
-        print("First vector (truncated):", data["embeddings"][0][:10]) 
-    else:
-        print("Error:", response.status_code, response.text)
+# set when the CLIP service rejects the binary body: it predates the binary transport
+_clip_fallback_transport = None
+
+
+def _clip_transport():
+    return _clip_fallback_transport or settings.CLIP_TRANSPORT
+
+
+def _rejects_binary(response, transport):
+    global _clip_fallback_transport
+    if transport != "binary" or response.status_code not in (415, 422):
+        return False
+    logger.warning(
+        f"[find_object_in_image_and_products] CLIP service answered {response.status_code} to the binary "
+        f"transport → using the JSON transport for this process (upgrade the service or set CLIP_TRANSPORT=json)"
+    )
+    _clip_fallback_transport = "json"
+    return True
 
-    faiss_dict = get_faiss_index()
 
-    
-    query_vec = np.array(data["embeddings"][0], dtype=np.float32).reshape(1, -1)
+def embed_image(image_url):
+    transport = _clip_transport()
+    response = get_clip_client().post("/embed_image", **_clip_request(image_url, transport))
+    if _rejects_binary(response, transport):
+        response = get_clip_client().post("/embed_image", **_clip_request(image_url, "json"))
+    return _query_vector(response)
 
-    k = 1000
-    distances, indices = faiss_dict['index_images'].search(query_vec, k)
 
-    best_idx = indices[0][0]
+async def aembed_image(image_url):
+    transport = _clip_transport()
+    response = await get_async_clip_client().post("/embed_image", **_clip_request(image_url, transport))
+    if _rejects_binary(response, transport):
+        response = await get_async_clip_client().post("/embed_image", **_clip_request(image_url, "json"))
+    return _query_vector(response)
 
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
 
-    for i in range(k):
-        index = indices[0][i]
-        base_random_key = faiss_dict['images_keys'][str(index)]
+def _query_vector(response):
+    # ---------- نتیجه ----------
+    if response.status_code != 200:
+        logger.error(f"[find_object_in_image_and_products] CLIP error: {response.status_code} {response.text}")
+    response.raise_for_status()
+    if response.headers.get("content-type", "").startswith("application/octet-stream"):
+        dims = int(response.headers["X-Embedding-Dims"])
+        # read-only view over the response body: no parsing, no copy
+        return np.frombuffer(response.content, dtype="<f4").reshape(-1, dims)[:1]
+    data = response.json()
+    logger.info(f"[find_object_in_image_and_products] embedding dims: {data['dims']}")
+    return np.array(data["embeddings"][0], dtype=np.float32).reshape(1, -1)
+
+
+def _candidate_keys(query_vec, budget):
+    """حداکثر budget کلید base یکتا به ترتیب شباهت CLIP (چند تصویر یک base فقط یک کاندید است)"""
+    faiss_dict = get_faiss_index()
+    # a base usually owns several images, so over-fetch before de-duplicating
+    distances, indices = faiss_dict['index_images'].search(query_vec, budget * 4)
+    candidates = []
+    for index in indices[0]:
+        if index < 0:
+            continue
+        key = faiss_dict['images_keys'][index]
+        if key not in candidates:
+            candidates.append(key)
+            if len(candidates) == budget:
+                break
+    return candidates
+
 
-        product = BaseProduct.objects.get(random_key=base_random_key)
-        product_base64_image = get_image_base64_data_url(product.image_url)
+def _product_image_urls(candidates):
+    """آدرس تصویر همه‌ی کاندیدها با یک کوئری؛ کاندیدهای بدون تصویر حذف می‌شوند"""
+    urls = dict(
+        BaseProduct.objects
+        .filter(random_key__in=candidates)
+        .values_list("random_key", "image_url")
+    )
+    return [(key, urls[key]) for key in candidates if urls.get(key)]
 
-        prompt = """
-آیا دو تصویر یک محصول را نشان می‌دهند؟
-اگر بله True خروجی بده، اگر خیر False.
+
+def _verify_kwargs(base64_image, product_base64_images):
+    prompt = f"""
+تصویر اول تصویر کاربر است و {len(product_base64_images)} تصویر بعدی به ترتیب کاندیدهای 1 تا {len(product_base64_images)} هستند.
+کدام کاندید دقیقاً همان محصول تصویر کاربر را نشان می‌دهد؟
+فقط شماره‌ی آن کاندید را خروجی بده. اگر هیچ‌کدام همان محصول نیست 0 خروجی بده.
 هیچ توضیح اضافه‌ای نده
 """
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=[{
-                "role": "user",
-                "content": [
-                    {"type": "input_text", "text": prompt},
-                    {"type": "input_image", "image_url": base64_image},
-                    {"type": "input_image", "image_url": product_base64_image},
-                ],
-            }],
-            temperature=0.5,
-        )
+    return dict(
+        model="gpt-4.1",
+        input=[{
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": prompt},
+                {"type": "input_image", "image_url": base64_image},
+                *({"type": "input_image", "image_url": image} for image in product_base64_images),
+            ],
+        }],
+        temperature=0,
+    )
+
 
-        result_message = extract_object(response)
+def _matched_candidate(result_message, batch):
+    """کلید کاندید تأییدشده در این batch یا None"""
+    match = re.search(r"\d+", result_message or "")
+    if match is None:
+        return None
+    number = int(match.group())
+    if 1 <= number <= len(batch):
+        return batch[number - 1]
+    return None
 
-        if (bool(result_message)):
-            final_result = base_random_key
-            logger.info("final_result:", final_result)
-            break
 
+def _batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
+
+def _result(final_result):
     return {
         "message": None,
         "base_random_keys": [str(final_result)],
         "member_random_keys": None
     }
+
+
+def _fallback(candidates):
+    # nothing verified within the budget/deadline → the closest image in CLIP space
+    return candidates[0] if candidates else None
+
+
+def _verify_candidates(client, image_url, candidates, deadline):
+    pool = ThreadPoolExecutor(max_workers=settings.SCENARIO7_IMAGE_CONCURRENCY)
+    try:
+        images = {
+            key: pool.submit(get_image_base64_data_url, product_image_url, True)
+            for key, product_image_url in _product_image_urls(candidates)
+        }
+        for batch in _batches(list(images), settings.SCENARIO7_VERIFY_BATCH):
+            if time.monotonic() >= deadline:
+                logger.warning("[find_object_in_image_and_products] verification deadline reached")
+                return None
+            downloaded = []
+            for key in batch:
+                try:
+                    downloaded.append((key, images[key].result(timeout=max(deadline - time.monotonic(), 0))))
+                except Exception as e:
+                    logger.warning(f"[find_object_in_image_and_products] skipping {key}: {e}")
+            if not downloaded:
+                continue
+            keys = [key for key, _ in downloaded]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("[find_object_in_image_and_products] verification deadline reached")
+                return None
+            try:
+                # a slow vision call must not overrun SCENARIO7_DEADLINE either
+                response = client.responses.create(
+                    **_verify_kwargs(image_url, [image for _, image in downloaded]), timeout=remaining
+                )
+            except APITimeoutError:
+                logger.warning("[find_object_in_image_and_products] verification deadline reached")
+                return None
+            match = _matched_candidate(extract_object(response), keys)
+            if match is not None:
+                return match
+        return None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def find_object_in_image_and_products(message, image_url):
+    deadline = time.monotonic() + settings.SCENARIO7_DEADLINE
+    query_vec = embed_image(image_url)
+    candidates = _candidate_keys(query_vec, settings.SCENARIO7_CANDIDATE_BUDGET)
+
+    final_result = _verify_candidates(get_openai_client(), image_url, candidates, deadline)
+    if final_result is None:
+        final_result = _fallback(candidates)
+    logger.info(f"final_result: {final_result}")
+
+    return _result(final_result)
+
+
+async def aget_image_base64_data_url(image_url, thumbnail=False):
+    return await afetch_image_data_url(image_url, thumbnail)
+
+
+async def _adownload(semaphore, key, product_image_url):
+    async with semaphore:
+        return key, await aget_image_base64_data_url(product_image_url, thumbnail=True)
+
+
+async def _averify_candidates(client, image_url, candidates):
+    """
+    همه‌ی تصاویر کاندیدها همزمان (با سقف SCENARIO7_IMAGE_CONCURRENCY) دانلود می‌شوند و
+    هر batch به محض آماده شدن تصاویرش در یک فراخوانی vision بررسی می‌شود.
+    """
+    product_image_urls = await run_blocking(_product_image_urls, candidates)
+    semaphore = asyncio.Semaphore(settings.SCENARIO7_IMAGE_CONCURRENCY)
+    downloads = [
+        asyncio.ensure_future(_adownload(semaphore, key, product_image_url))
+        for key, product_image_url in product_image_urls
+    ]
+    try:
+        for batch in _batches(downloads, settings.SCENARIO7_VERIFY_BATCH):
+            downloaded = []
+            for key_and_image in await asyncio.gather(*batch, return_exceptions=True):
+                if isinstance(key_and_image, Exception):
+                    logger.warning(f"[find_object_in_image_and_products] skipping candidate: {key_and_image}")
+                else:
+                    downloaded.append(key_and_image)
+            if not downloaded:
+                continue
+            keys = [key for key, _ in downloaded]
+            response = await client.responses.create(**_verify_kwargs(image_url, [image for _, image in downloaded]))
+            match = _matched_candidate(extract_object(response), keys)
+            if match is not None:
+                return match
+        return None
+    finally:
+        for task in downloads:
+            task.cancel()
+
+
+async def afind_object_in_image_and_products(message, image_url):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SCENARIO7_DEADLINE
+    query_vec = await aembed_image(image_url)
+    candidates = await run_blocking(_candidate_keys, query_vec, settings.SCENARIO7_CANDIDATE_BUDGET)
+
+    try:
+        final_result = await asyncio.wait_for(
+            _averify_candidates(get_async_openai_client(), image_url, candidates),
+            timeout=max(deadline - loop.time(), 0),
+        )
+    except asyncio.TimeoutError:
+        logger.warning("[find_object_in_image_and_products] verification deadline reached")
+        final_result = None
+    if final_result is None:
+        final_result = _fallback(candidates)
+    logger.info(f"final_result: {final_result}")
+
+    return _result(final_result)
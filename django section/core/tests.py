@@ -1,3 +1,153 @@
-from django.test import TestCase
+import asyncio
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from io import StringIO
 
-# Create your tests here.
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.clients import client_stats, get_async_clip_client
+from core.models import City, Member, Shop
+
+
+class _OkHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the second request reuses the connection
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncClientTraceTests(SimpleTestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_async_client_counts_requests_through_the_trace_hook(self):
+        before = client_stats().get("clip", {"requests": 0, "new_connections": 0})
+
+        async def fetch():
+            client = get_async_clip_client()
+            try:
+                return [(await client.get("/")).text for _ in range(2)]
+            finally:
+                await client.aclose()
+
+        with override_settings(CLIP_API_URL=f"http://127.0.0.1:{self.server.server_port}"):
+            self.assertEqual(asyncio.run(fetch()), ["ok", "ok"])
+        after = client_stats()["clip"]
+        self.assertEqual(after["requests"] - before["requests"], 2)
+        self.assertEqual(after["new_connections"] - before["new_connections"], 1)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+class ImportParquetCopyTests(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        # row_group_size=2: several row groups, so staging is reused between merges
+        pq.write_table(
+            pa.table({"id": [1, 2, 3], "name": ["تهران", "مشهد", "تبریز"]}),
+            os.path.join(self.data_dir, "cities.parquet"), row_group_size=2,
+        )
+        pq.write_table(
+            pa.table({
+                "id": [10, 11, 12, 13, 14],
+                "city_id": [1, 99, 2, 3, 1],
+                "score": [4.5, 3.0, 2.5, 5.0, 1.0],
+                "has_warranty": [True, False, True, False, True],
+            }),
+            os.path.join(self.data_dir, "shops.parquet"), row_group_size=2,
+        )
+
+    def _import(self, *args):
+        out = StringIO()
+        call_command(
+            "import_parquet", "--mode", "copy", "--tables", "cities,shops", "--data-dir", self.data_dir,
+            *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_copy_loads_every_row_group_once(self):
+        output = self._import()
+        self.assertEqual(City.objects.count(), 3)
+        self.assertEqual(Shop.objects.count(), 5)
+        self.assertEqual(City.objects.get(id=2).title, "مشهد")
+        self.assertIsNone(Shop.objects.get(id=11).city_id)
+        self.assertEqual(Shop.objects.get(id=13).city_id, 3)
+        # one shop points at a missing city; earlier row groups must not be merged (and counted) again
+        self.assertIn("1 rows without a city", output)
+        self.assertIn("5 new rows (0 already present)", output)
+
+    def test_copy_skips_existing_rows(self):
+        self._import()
+        output = self._import()
+        self.assertEqual(Shop.objects.count(), 5)
+        self.assertIn("0 new rows (5 already present)", output)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "the delta import uses PostgreSQL temp tables")
+class ImportParquetDeltaTests(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self._write("cities.parquet", {"id": [1], "name": ["تهران"]})
+        self._write("shops.parquet", {
+            "id": [10, 11], "city_id": [1, 2], "score": [4.0, 3.0], "has_warranty": [True, False],
+        })
+        self._write("members.parquet", {
+            "random_key": ["m1", "m2"], "base_random_key": ["p1", "p2"], "shop_id": [10, 11], "price": [1000.0, 2000.0],
+        })
+
+    def _write(self, name, columns):
+        pq.write_table(pa.table(columns), os.path.join(self.data_dir, name))
+
+    def _import(self, tables, *args):
+        out = StringIO()
+        call_command(
+            "import_parquet", "--mode", "delta", "--tables", tables, "--data-dir", self.data_dir, *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_missing_reference_is_resolved_once_it_exists(self):
+        self._import("cities,shops")
+        self.assertIsNone(Shop.objects.get(id=11).city_id)
+        self._write("cities.parquet", {"id": [1, 2], "name": ["تهران", "مشهد"]})
+        output = self._import("cities,shops")
+        self.assertEqual(Shop.objects.get(id=11).city_id, 2)
+        self.assertIn("Shops: 0 inserted, 1 updated, 0 deleted, 1 unchanged", output)
+
+    def test_member_of_a_missing_shop_is_kept_without_one(self):
+        self._write("shops.parquet", {"id": [10], "city_id": [1], "score": [4.0], "has_warranty": [True]})
+        self._import("cities,shops,members")
+        self.assertIsNone(Member.objects.get(random_key="m2").shop_id)
+        self._write("shops.parquet", {
+            "id": [10, 11], "city_id": [1, 1], "score": [4.0, 3.0], "has_warranty": [True, False],
+        })
+        output = self._import("shops,members")
+        self.assertEqual(Member.objects.get(random_key="m2").shop_id, 11)
+        self.assertIn("Members: 0 inserted, 1 updated, 0 deleted, 1 unchanged", output)
+
+    def test_delete_missing_reports_cascaded_members(self):
+        self._import("cities,shops,members")
+        self._write("shops.parquet", {"id": [10], "city_id": [1], "score": [4.0], "has_warranty": [True]})
+        changes_dir = tempfile.mkdtemp()
+        self._import("shops", "--delete-missing", "--changes-dir", changes_dir)
+        self.assertFalse(Shop.objects.filter(id=11).exists())
+        self.assertEqual(list(Member.objects.values_list("random_key", flat=True)), ["m1"])
+        with open(os.path.join(changes_dir, "core_shop.changes.json"), encoding="utf-8") as f:
+            changes = json.load(f)
+        self.assertEqual(changes["deleted"], [11])
+        self.assertEqual(changes["cascaded"], {"core_member": ["m2"]})
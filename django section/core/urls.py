@@ -16,4 +16,7 @@ router.register(r"cities", CityViewSet)
 urlpatterns = [
     path("api/", include(router.urls)), 
     path("chat", chat, name="chat"), 
+    path("metrics", metrics, name="metrics"),
+    path("healthz", healthz, name="healthz"),
+    path("readyz", readyz, name="readyz"),
 ]
@@ -3,22 +3,32 @@ from rest_framework.response import Response
 from rest_framework import viewsets
 from .models import *
 from .serializers import *
-from openai import OpenAI
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .clients import get_async_openai_client, client_stats
 import re
 import os
 import numpy as np
 import json
 import logging
-from .faiss_index import get_faiss_index
+import time
+from django.conf import settings
+from .faiss_index import get_faiss_index, index_status
+from .embedding_cache import embedding_cache_stats
+from .image_cache import image_cache_stats
+from .intent_classifier import apredict_scenario, log_decision, count_route, intent_classifier_stats
+from .executor import run_blocking
+from .retrieval import Speculation, speculation_stats
+from .response_cache import get_response_cache, request_cache_key
 
 from core.scenarios.scenario0 import extract_special_case
-from core.scenarios.scenario1 import find_product_based_name
-from core.scenarios.scenario2 import find_property_of_good
-from core.scenarios.scenario3 import find_property_of_shops
-from core.scenarios.scenario4 import find_product_after_chat_with_user
-from core.scenarios.scenario5 import compare_bases_for_user_query
-from core.scenarios.scenario6 import find_object_in_image
-from core.scenarios.scenario7 import find_object_in_image_and_products
+from core.scenarios.scenario1 import afind_product_based_name
+from core.scenarios.scenario2 import afind_property_of_good
+from core.scenarios.scenario3 import afind_property_of_shops
+from core.scenarios.scenario5 import acompare_bases_for_user_query
+from core.scenarios.scenario6 import afind_object_in_image
+from core.scenarios.scenario7 import afind_object_in_image_and_products
 
 
 logger = logging.getLogger(__name__)
@@ -68,13 +78,37 @@ class CityViewSet(viewsets.ModelViewSet):
     serializer_class = CitySerializer
 
 
-def detect_scenario_with_llm(message: str, last_message_type) -> str:
+@api_view(["GET"])
+def metrics(request):
+    return Response({
+        "clients": client_stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "image_cache": image_cache_stats(),
+        "intent_classifier": intent_classifier_stats(),
+        "speculative_retrieval": speculation_stats(),
+        "response_cache": get_response_cache().stats(),
+        "faiss": index_status(),
+    })
+
+
+def healthz(request):
+    """503 تا وقتی ایندکس‌ها و جدول‌های کلید لود و گرم نشده‌اند (یا لودشان شکست خورده)"""
+    status = index_status()
+    return JsonResponse({"status": "ok" if status["ready"] else status["state"]}, status=200 if status["ready"] else 503)
+
+
+def readyz(request):
+    status = index_status()
+    return JsonResponse(status, status=200 if status["ready"] else 503)
+
+
+async def detect_scenario_with_llm(message: str, last_message_type) -> str:
     """
     پیام رو به LLM می‌ده و فقط شماره سناریو (۱ تا ۷) رو برمی‌گردونه.
     """
 
     
-    client = OpenAI(api_key=os.getenv("TOROB_API_KEY"), base_url="https://turbo.torob.com/v1")
+    client = get_async_openai_client()
 
     prompt = f"""
 شما یک داور هوش مصنوعی هستید که باید تشخیص دهید ورودی کاربر به کدام یک از 7 سناریوی از پیش تعریف‌شده تعلق دارد.  
@@ -129,7 +163,7 @@ message_type = {last_message_type}
 {message}
 """
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4.1",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.5,
@@ -139,11 +173,48 @@ message_type = {last_message_type}
     return response.choices[0].message.content.strip()
 
 
-@api_view(["POST"])
-def chat(request):
-    chat_id = request.data.get("chat_id")
-    messages = request.data.get("messages", [])
-
+async def classify_scenario(message: str, last_message_type, embedding=None) -> str:
+    """
+    اول طبقه‌بند محلی اجرا می‌شود و فقط وقتی اطمینان آن کمتر از آستانه است سراغ LLM می‌رویم.
+    """
+    try:
+        prediction = await apredict_scenario(message, last_message_type, embedding)
+    except Exception as e:
+        logger.warning(f"[classify_scenario] local classifier failed: {e}")
+        prediction = None
+
+    if prediction is not None:
+        scenario, confidence = prediction
+        logger.info(f"[classify_scenario] classifier → scenario={scenario}, confidence={confidence:.3f}")
+        if confidence >= settings.INTENT_CLASSIFIER_THRESHOLD:
+            count_route("classifier")
+            return str(scenario)
+
+    count_route("llm")
+    start = time.perf_counter()
+    scenario_number = await detect_scenario_with_llm(message, last_message_type)
+    latency_ms = (time.perf_counter() - start) * 1000
+    if scenario_number.isdigit():
+        await run_blocking(log_decision, message, last_message_type, int(scenario_number), latency_ms)
+    return scenario_number
+
+
+async def _take_speculation(speculation, scenario_number):
+    """نتیجه‌ی بازیابی پیش‌دستانه برای سناریوهای ۱ تا ۳؛ برای بقیه لغو می‌شود"""
+    if speculation is None:
+        return None
+    if str(scenario_number).strip() in ("1", "2", "3"):
+        return await speculation.take()
+    speculation.cancel()
+    return None
+
+
+def _respond(data):
+    return JsonResponse(data, safe=False, json_dumps_params={"ensure_ascii": False})
+
+
+async def _dispatch(chat_id, messages, has_chat_state):
+    """(scenario_number, result) برای یک درخواست"""
     if messages:
         message_dict = messages[0] 
         message_content_1 = messages[0].get("content", "")
@@ -158,75 +229,86 @@ def chat(request):
         message_content_2 = ""
         message_type_2 = None
 
-    exists = Chat.objects.filter(chat_id=chat_id).exists()
-
-    # if exists:
-    #     result = find_product_after_chat_with_user(message_content_1, chat_id)
+    # if has_chat_state:
+    #     result = await run_blocking(find_product_after_chat_with_user, message_content_1, chat_id)
     #     logger.info(f"[chat] scenario=4 → result={result}")
-    #     return Response(result)
+    #     return "4", result
 
     logger.info(f"[chat] chat_id={chat_id}, message_content_1={message_content_1}")
 
     special_case = extract_special_case(message_content_1)
     if special_case:
         logger.info(f"[chat] special_case detected → {special_case}")
-        return Response(special_case)
+        return "0", special_case
 
-    if len(messages) == 2:
-        scenario_number = detect_scenario_with_llm(message_content_1, message_type_2)
-    else:
-        scenario_number = detect_scenario_with_llm(message_content_1, message_type_1)
-    logger.info(f"[chat] scenario_number={scenario_number}")
+    # text-only requests: embed + top-1 product lookup run while the scenario is being classified
+    speculation = None
+    if len(messages) < 2 and settings.SPECULATIVE_RETRIEVAL:
+        speculation = Speculation(message_content_1)
+
+    try:
+        if len(messages) == 2:
+            scenario_number = await classify_scenario(message_content_1, message_type_2)
+        else:
+            scenario_number = await classify_scenario(
+                message_content_1, message_type_1, speculation.embedding if speculation else None
+            )
+        logger.info(f"[chat] scenario_number={scenario_number}")
+
+        retrieval = await _take_speculation(speculation, scenario_number)
+    except BaseException:
+        if speculation is not None:
+            speculation.cancel()
+        raise
 
     if int(scenario_number) == 1:
-        result = find_product_based_name(message_content_1)
+        result = await afind_product_based_name(message_content_1, retrieval)
         logger.info(f"[chat] scenario=1 → result={result}")
-        return Response(result)
+        return scenario_number, result
 
     if int(scenario_number) == 2:
-        result = find_property_of_good(message_content_1)
+        result = await afind_property_of_good(message_content_1, retrieval)
         logger.info(f"[chat] scenario=2 → result={result}")
-        return Response(result)
+        return scenario_number, result
     
     if int(scenario_number) == 3:
-        result = find_property_of_shops(message_content_1)
+        result = await afind_property_of_shops(message_content_1, retrieval)
         logger.info(f"[chat] scenario=3 → result={result}")
-        return Response(result)
+        return scenario_number, result
 
     # if int(scenario_number) == 4:
-    #     result = find_product_after_chat_with_user(message_content_1, chat_id)
+    #     result = await run_blocking(find_product_after_chat_with_user, message_content_1, chat_id)
     #     logger.info(f"[chat] scenario=4 → result={result}")
-    #     return Response(result)
+    #     return scenario_number, result
 
     if int(scenario_number) == 5:
-        result = compare_bases_for_user_query(message_content_1)
+        result = await acompare_bases_for_user_query(message_content_1)
         logger.info(f"[chat] scenario=5 → result={result}")
-        return Response(result)
+        return scenario_number, result
 
     if int(scenario_number) == 6:
         if len(messages) < 2:
-            return Response({
+            return scenario_number, {
                 "message": "There is no image in the request",
                 "base_random_keys": None,
                 "member_random_keys": None
-            })
+            }
         image_url = messages[1].get("content")
-        result = find_object_in_image(message_content_1, image_url)
+        result = await afind_object_in_image(message_content_1, image_url)
         logger.info(f"[chat] scenario=6 → result={result}")
-        return Response(result)
+        return scenario_number, result
 
     if int(scenario_number) == 7:
         if len(messages) < 2:
-            return Response({
+            return scenario_number, {
                 "message": "There is no image in the request",
                 "base_random_keys": None,
                 "member_random_keys": None
-            })
+            }
         image_url = messages[1].get("content")
-        result = find_object_in_image_and_products(message_content_1, image_url)
+        result = await afind_object_in_image_and_products(message_content_1, image_url)
         logger.info(f"[chat] scenario=7 → result={result}")
-        return Response(result)
-
+        return scenario_number, result
 
     response_data = {
         "message": scenario_number,
@@ -234,4 +316,37 @@ def chat(request):
         "member_random_keys": None,
     }
     logger.info(f"[chat] default response → {response_data}")
-    return Response(response_data)
\ No newline at end of file
+    return scenario_number, response_data
+
+
+@csrf_exempt
+@require_POST
+async def chat(request):
+    """
+    نسخه‌ی async؛ اگر کلاینت اتصال را قطع کند Django این coroutine را cancel می‌کند
+    و درخواست‌های در جریان به LLM/embedding/CLIP هم همراه آن لغو می‌شوند.
+    پاسخ درخواست‌های تکراری از response cache برمی‌گردد (core/response_cache.py).
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return JsonResponse({"detail": "Invalid JSON body"}, status=400)
+
+    chat_id = data.get("chat_id")
+    messages = data.get("messages", [])
+
+    has_chat_state = await run_blocking(Chat.objects.filter(chat_id=chat_id).exists)
+
+    cache = get_response_cache()
+    # follow-up turns of scenario 4 depend on the stored chat, not only on the messages
+    if has_chat_state or settings.RESPONSE_CACHE_TTL <= 0:
+        cache.bypass()
+        _, result = await _dispatch(chat_id, messages, has_chat_state)
+        return _respond(result)
+
+    async def compute():
+        scenario_number, result = await _dispatch(chat_id, messages, has_chat_state)
+        return result, str(scenario_number).strip() != "4"
+
+    key = request_cache_key(messages, classifier_threshold=settings.INTENT_CLASSIFIER_THRESHOLD)
+    return _respond(await cache.get_or_compute(key, compute))
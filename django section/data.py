@@ -1,14 +1,31 @@
-import gdown
-import tarfile
+import logging
 import os
+import shutil
+import tarfile
+
+from core.artifact_fetcher import Artifact, fetch_all, load_manifest, parse_sources, with_manifest
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 url = "https://drive.google.com/uc?id=1W4mSI33IbeKkWztK3XmE05F7m4tNYDYu"
 output = "torob-turbo-stage2.tar.gz"
+target = "torob-turbo-stage2"
+
+# same sources/manifest settings as the server (see core/artifact_fetcher.py)
+artifacts = with_manifest(
+    [Artifact(output, os.path.abspath(output), url)],
+    load_manifest(os.getenv("ARTIFACT_MANIFEST", "")),
+)
 
 print("Downloading file...")
-gdown.download(url, output, quiet=False)
+fetch_all(artifacts, parse_sources(os.getenv("ARTIFACT_SOURCES", "gdrive")))
 
 print("Extracting file...")
+# extract next to the target and rename, so an interrupted run never leaves a half-extracted dataset
+tmp_target = f"{target}.tmp"
+shutil.rmtree(tmp_target, ignore_errors=True)
 with tarfile.open(output, "r:gz") as tar:
-    tar.extractall("torob-turbo-stage2")
-    print(f"Extracted to {os.path.abspath('torob-turbo-stage2')}")
\ No newline at end of file
+    tar.extractall(tmp_target)
+shutil.rmtree(target, ignore_errors=True)
+os.rename(tmp_target, target)
+print(f"Extracted to {os.path.abspath(target)}")
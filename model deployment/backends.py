@@ -0,0 +1,88 @@
+"""
+Image-embedding backends for the CLIP service.
+
+torch: the Hugging Face CLIPModel in eager fp32 (default).
+onnx:  the vision tower + projection exported by export_onnx.py, optionally
+       int8-quantized, run with ONNX Runtime on CPU.
+
+Both return L2-normalized float32 embeddings as a NumPy array.
+"""
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from transformers import CLIPProcessor, CLIPModel
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+DATA_DIR = os.getenv("DATA_DIR", "/var/lib/data")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", os.path.join(DATA_DIR, "clip_vision.onnx"))
+# 0 → one thread per CPU core
+INTRA_OP_THREADS = int(os.getenv("INTRA_OP_THREADS", 0))
+
+
+class VisionTower(torch.nn.Module):
+    """pixel_values → image_embeds (unnormalized), the graph exported to ONNX"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if INTRA_OP_THREADS > 0:
+            torch.set_num_threads(INTRA_OP_THREADS)
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device).eval()
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.dims = self.model.config.projection_dim
+
+    def embed(self, images):
+        inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            image_features = self.model.get_image_features(**inputs)
+        return F.normalize(image_features, p=2, dim=1).cpu().numpy().astype(np.float32, copy=False)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path=ONNX_MODEL_PATH, model_name=MODEL_NAME):
+        import onnxruntime as ort
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run `python export_onnx.py` first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # requests are already serialized by the batcher → all cores go to one run
+        options.intra_op_num_threads = INTRA_OP_THREADS or os.cpu_count()
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.path = path
+        self.dims = self.session.get_outputs()[0].shape[1]
+        self.device = "cpu"
+
+    def embed(self, images):
+        pixel_values = self.processor(images=images, return_tensors="np")["pixel_values"].astype(np.float32)
+        image_features = self.session.run(None, {"pixel_values": pixel_values})[0]
+        norms = np.maximum(np.linalg.norm(image_features, axis=1, keepdims=True), 1e-12)
+        return (image_features / norms).astype(np.float32, copy=False)
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend}
+
+
+def load_backend(name=None, **kwargs):
+    name = name or os.getenv("CLIP_BACKEND", "torch")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CLIP backend {name!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
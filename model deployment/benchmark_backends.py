@@ -0,0 +1,46 @@
+"""
+Throughput of the CLIP backends on CPU.
+
+    python benchmark_backends.py --backends torch onnx --batch-sizes 1 8 32
+    ONNX_MODEL_PATH=/var/lib/data/clip_vision_int8.onnx python benchmark_backends.py --backends onnx
+"""
+import argparse
+import time
+
+import numpy as np
+from PIL import Image
+
+from backends import load_backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8))
+        for _ in range(max(args.batch_sizes))
+    ]
+
+    print(f"{'backend':<8} {'batch':>5} {'p50 ms':>9} {'images/s':>9}")
+    for name in args.backends:
+        backend = load_backend(name)
+        for batch_size in args.batch_sizes:
+            batch = images[:batch_size]
+            timings = []
+            for i in range(args.warmup + args.iterations):
+                start = time.perf_counter()
+                backend.embed(batch)
+                if i >= args.warmup:
+                    timings.append(time.perf_counter() - start)
+            p50 = float(np.median(timings))
+            print(f"{name:<8} {batch_size:>5} {p50 * 1000:>9.1f} {batch_size / p50:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the onnx backend against the torch backend on a sample of images.
+
+    python check_parity.py --images /path/to/sample_images [--onnx-model clip_vision_int8.onnx]
+
+Reports the cosine similarity of the two embeddings of every image and how
+often both backends retrieve the same neighbours from images.index.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+from backends import DATA_DIR, ONNX_MODEL_PATH, OnnxBackend, TorchBackend
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_images(directory, limit):
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    return [Image.open(path).convert("RGB") for path in paths]
+
+
+def embed_all(backend, images, batch_size):
+    return np.vstack([backend.embed(images[i:i + batch_size]) for i in range(0, len(images), batch_size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Directory of sample images")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--onnx-model", default=ONNX_MODEL_PATH)
+    parser.add_argument("--index", default=os.path.join(DATA_DIR, "images.index"))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Fail below this per-image cosine")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        sys.exit(f"No images in {args.images}")
+
+    reference = embed_all(TorchBackend(), images, args.batch_size)
+    candidate = embed_all(OnnxBackend(args.onnx_model), images, args.batch_size)
+
+    cosine = (reference * candidate).sum(axis=1)
+    print(f"images: {len(images)}")
+    print(f"cosine(torch, onnx): mean={cosine.mean():.5f} min={cosine.min():.5f} p1={np.percentile(cosine, 1):.5f}")
+
+    if os.path.exists(args.index):
+        import faiss
+
+        index = faiss.read_index(args.index, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        _, ref_ids = index.search(reference, args.k)
+        _, cand_ids = index.search(candidate, args.k)
+        top1 = (ref_ids[:, 0] == cand_ids[:, 0]).mean()
+        overlap = np.mean([len(set(r) & set(c)) / args.k for r, c in zip(ref_ids, cand_ids)])
+        print(f"{args.index}: top-1 agreement={top1:.2%} overlap@{args.k}={overlap:.2%}")
+    else:
+        print(f"{args.index} not found → skipping retrieval comparison")
+
+    if cosine.min() < args.min_cosine:
+        sys.exit(f"❌ min cosine {cosine.min():.5f} < {args.min_cosine}")
+    print("✅ backends agree")
+
+
+if __name__ == "__main__":
+    main()
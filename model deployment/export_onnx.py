@@ -0,0 +1,60 @@
+"""
+Export the CLIP vision tower to ONNX for the onnx backend.
+
+    python export_onnx.py                 # fp32 → $DATA_DIR/clip_vision.onnx
+    python export_onnx.py --quantize      # also writes clip_vision_int8.onnx
+
+Serve it with CLIP_BACKEND=onnx (and ONNX_MODEL_PATH for the int8 file).
+"""
+import argparse
+import os
+
+import torch
+from transformers import CLIPModel
+
+from backends import MODEL_NAME, ONNX_MODEL_PATH, VisionTower
+
+
+def export(output, model_name=MODEL_NAME, opset=17):
+    model = CLIPModel.from_pretrained(model_name).eval()
+    size = model.config.vision_config.image_size
+    dummy = torch.randn(1, 3, size, size)
+    tmp_path = f"{output}.tmp"
+    torch.onnx.export(
+        VisionTower(model),
+        (dummy,),
+        tmp_path,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    os.replace(tmp_path, output)
+    print(f"✅ exported {output}")
+
+
+def quantize(source, output):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, output, weight_type=QuantType.QInt8)
+    print(f"✅ quantized {output} ({os.path.getsize(output) / 1024 ** 2:.0f} MiB, "
+          f"fp32 {os.path.getsize(source) / 1024 ** 2:.0f} MiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=ONNX_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    export(args.output, opset=args.opset)
+    if args.quantize:
+        root, ext = os.path.splitext(args.output)
+        quantize(args.output, f"{root}_int8{ext}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,32 @@
 from typing import List
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import torch
-import torch.nn.functional as F
-from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
+import numpy as np
+import asyncio
 import base64
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+from backends import load_backend
+
 app = FastAPI(title="Image Base64 Embedding API with CLIP")
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
+# CLIP_BACKEND=torch (default) or onnx, see backends.py
+backend = load_backend()
+device = backend.device
+
+# Concurrent /embed_image calls are merged into one forward pass of up to
+# MAX_BATCH_SIZE images; the first request of a batch waits at most
+# MAX_BATCH_WAIT_MS for others to join.
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 32))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", 10))
 
-MODEL_NAME = "openai/clip-vit-base-patch32"
-model = CLIPModel.from_pretrained(MODEL_NAME).to(device)
-processor = CLIPProcessor.from_pretrained(MODEL_NAME)
 
 class EmbedRequest(BaseModel):
     base64_images: List[str]
@@ -23,25 +35,198 @@ class EmbedResponse(BaseModel):
     embeddings: List[List[float]]
     dims: int
 
-@app.get("/health")
-def health():
-    return {"status": "ok", "device": device}
 
-@app.post("/embed_image", response_model=EmbedResponse)
-def embed_image(req: EmbedRequest):
+def decode_images(raw_images):
     images = []
-    for b64 in req.base64_images:
+    for img_data in raw_images:
         try:
-            img_data = base64.b64decode(b64)
             img = Image.open(BytesIO(img_data)).convert("RGB")
             images.append(img)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    return images
+
+
+def decode_base64_images(base64_images):
+    raw_images = []
+    for b64 in base64_images:
+        try:
+            raw_images.append(base64.b64decode(b64))
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+    return decode_images(raw_images)
+
+
+async def read_images(request: Request):
+    """
+    Accepts JSON ({"base64_images": [...]}), multipart/form-data (one or more
+    "images" files) or a single raw image as application/octet-stream.
+    """
+    content_type = request.headers.get("content-type", "application/json")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        raw_images = [await upload.read() for upload in form.getlist("images")]
+        return await run_in_threadpool(decode_images, raw_images)
+    if content_type.startswith("application/octet-stream") or content_type.startswith("image/"):
+        return await run_in_threadpool(decode_images, [await request.body()])
+
+    try:
+        req = EmbedRequest(**(await request.json()))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON body: {str(e)}")
+    return await run_in_threadpool(decode_base64_images, req.base64_images)
+
+
+def encode_embeddings(image_features, accept):
+    """
+    application/x-npy → NumPy .npy file; application/octet-stream → raw
+    float32 little-endian rows (shape in X-Embedding-Count / X-Embedding-Dims);
+    anything else → JSON.
+    """
+    count, dims = image_features.shape
+    if "application/x-npy" in accept:
+        out = BytesIO()
+        np.save(out, image_features.astype("<f4", copy=False))
+        return Response(out.getvalue(), media_type="application/x-npy")
+    if "application/octet-stream" in accept:
+        return Response(
+            image_features.astype("<f4", copy=False).tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Embedding-Count": str(count), "X-Embedding-Dims": str(dims)},
+        )
+    return {"embeddings": image_features.tolist(), "dims": dims}
+
+
+class BatchMetrics:
+    """Counters plus a window of recent batches for percentile reporting."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.images = 0
+        self._recent = deque(maxlen=window)
 
-    inputs = processor(images=images, return_tensors="pt").to(device)
-    with torch.no_grad():
-        image_features = model.get_image_features(**inputs)
+    def record(self, batch_requests, batch_images, queue_waits_ms, inference_ms):
+        with self._lock:
+            self.batches += 1
+            self.requests += batch_requests
+            self.images += batch_images
+            self._recent.append((batch_images, max(queue_waits_ms), inference_ms))
 
-    image_features = F.normalize(image_features, p=2, dim=1)
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return None
+        values = sorted(values)
+        pick = lambda q: round(values[min(int(q * len(values)), len(values) - 1)], 2)
+        return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 2)}
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "images": self.images,
+            "avg_batch_size": round(self.images / self.batches, 2) if self.batches else None,
+            "batch_size": self._percentiles([r[0] for r in recent]),
+            "queue_wait_ms": self._percentiles([r[1] for r in recent]),
+            "inference_ms": self._percentiles([r[2] for r in recent]),
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_batch_wait_ms": MAX_BATCH_WAIT_MS,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects concurrent embedding requests into batches and runs them on a
+    single inference thread, so the event loop keeps accepting requests while
+    a batch is running; whatever queues up meanwhile forms the next batch.
+    """
+
+    def __init__(self, embed_fn, max_batch_size, max_wait_ms):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = BatchMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-inference")
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, images):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((images, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        # callers that disconnected while queued do not need a forward pass
+        return [item for item in batch if not item[1].cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            images = [img for item_images, _, _ in batch for img in item_images]
+            started = time.perf_counter()
+            try:
+                features = await loop.run_in_executor(self._executor, self.embed_fn, images)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            self.metrics.record(
+                len(batch),
+                len(images),
+                [(started - enqueued) * 1000 for _, _, enqueued in batch],
+                (finished - started) * 1000,
+            )
+
+            offset = 0
+            for item_images, future, _ in batch:
+                if not future.done():
+                    future.set_result(features[offset:offset + len(item_images)])
+                offset += len(item_images)
+
+
+batcher = MicroBatcher(backend.embed, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "device": device, "backend": backend.name}
+
+@app.get("/metrics")
+def metrics():
+    return {"batching": batcher.metrics.snapshot()}
+
+@app.post("/embed_image", response_model=EmbedResponse)
+async def embed_image(request: Request):
+    images = await read_images(request)
+    if images:
+        image_features = await batcher.submit(images)
+    else:
+        image_features = np.empty((0, backend.dims), dtype=np.float32)
 
-    return {"embeddings": image_features.cpu().tolist(), "dims": image_features.shape[1]}
+    return encode_embeddings(image_features, request.headers.get("accept", ""))